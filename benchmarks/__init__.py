@@ -0,0 +1,4 @@
+"""
+Benchmark suite running the API against local fakes of Azure and Mongo, see
+`python -m benchmarks --help`.
+"""
@@ -0,0 +1,134 @@
+"""
+Benchmarks the API against local fakes of Azure and Mongo.
+
+    python -m benchmarks --scenarios prompt,metrics --requests 200 --concurrency 32
+
+Results are compared against the baseline file and the command exits with a
+non-zero status on regressions. --update-baseline stores the new results.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+
+import httpx
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the API against local fakes of Azure and Mongo."
+    )
+    parser.add_argument("--scenarios", default="prompt,metrics,chat_get,statistics_add")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--profile", default=os.path.join(here, "profiles", "default.json"))
+    parser.add_argument(
+        "--scale", type=float, default=0.25, help="multiplies every latency of the profile"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--histories", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--baseline", default=os.path.join(here, "baselines", "default.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--output", help="also writes the results to this JSON file")
+    parser.add_argument("--log-level", default="critical", help="log level of the app")
+    return parser.parse_args()
+
+
+async def run(bench, names, args, results: dict, out):
+    from .runner import run_scenario
+    from .scenarios import scenarios, seed
+
+    async with bench.app.router.lifespan_context(bench.app):
+        context = await seed(
+            bench.db, random.Random(args.seed), args.users, args.histories, args.chats
+        )
+        transport = httpx.ASGITransport(app=bench.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            for name in names:
+                calls_before = bench.upstream_calls()
+                result = await run_scenario(
+                    client, scenarios[name], args.requests, args.concurrency, context, args.seed
+                )
+                calls_after = bench.upstream_calls()
+                result["upstream_calls"] = {
+                    upstream: calls_after[upstream] - calls_before.get(upstream, 0)
+                    for upstream in calls_after
+                    if calls_after[upstream] - calls_before.get(upstream, 0)
+                }
+                results[name] = result
+                print(
+                    f"{name:<16} {result['rps']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+                    f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                    f"loop lag p99 {result['loop_lag_p99_ms']:>7} ms  errors {result['errors']}",
+                    file=out,
+                )
+
+
+async def main(args) -> int:
+    with open(args.profile) as file:
+        profile = json.load(file)
+
+    from .app import build_app
+    from .runner import compare
+    from .scenarios import scenarios
+
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    bench = build_app(profile, args.scale, args.seed)
+    logging.getLogger().setLevel(args.log_level.upper())
+    results = {}
+    out = sys.stdout
+    # The app prints debugging output on some endpoints
+    with contextlib.redirect_stdout(io.StringIO()):
+        await run(bench, names, args, results, out)
+
+    meta = {
+        "profile": os.path.basename(args.profile),
+        "scale": args.scale,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"meta": meta, "results": results}, file, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    if args.update_baseline:
+        baseline = {"meta": meta, "results": {**baseline.get("results", {}), **results}}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2)
+            file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if baseline.get("meta") and baseline["meta"] != meta:
+        print(f"Baseline was recorded with {baseline['meta']}, results may not compare")
+
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
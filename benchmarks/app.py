@@ -0,0 +1,133 @@
+"""
+Builds the FastAPI app wired to the local fakes instead of Azure and Mongo.
+
+The fakes are installed before the app modules are imported, since routers
+and services create their clients at import time.
+"""
+
+import os
+import random
+import tempfile
+from dataclasses import dataclass
+from typing import Dict
+
+from .fakes import (
+    FakeAsyncTextAnalytics,
+    FakeContainer,
+    FakeCredential,
+    FakeEvaluator,
+    FakeFFmpeg,
+    FakeOpenAI,
+    FakeSpeech,
+    FakeTextAnalytics,
+    LatencyModel,
+)
+from .mongo import MemoryDatabase
+
+# Placeholders for the settings without a default, real values are not needed
+placeholder_settings = {
+    "ENVIRONMENT": "benchmark",
+    "COOKIE_DOMAIN": "localhost",
+    "API_DOMAIN": "localhost",
+    "FRONTEND_URL": "http://localhost:3000",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "MONGODB_DB_NAME": "benchmark",
+    "JWT_SECRET": "benchmark-secret-" + "0" * 64,
+    "AZURE_SUBSCRIPTION_ID": "benchmark",
+    "AZURE_CLIENT_ID": "benchmark",
+    "AZURE_TENANT_ID": "benchmark",
+    "AZURE_CLIENT_SECRET": "benchmark",
+    "AZURE_AI_PROJECT_NAME": "benchmark",
+    "AZURE_RG_NAME": "benchmark",
+    "AZURE_AI_ENDPOINT": "https://fake-ai.local",
+    "AZURE_LANGUAGE_API_KEY": "benchmark",
+    "AZURE_LANGUAGE_ENDPOINT": "https://fake-language.local",
+    "AZURE_OPENAI_API_KEY": "benchmark",
+    "AZURE_OPENAI_ENDPOINT": "https://fake-openai.local",
+    "AZURE_OPENAI_DEPLOYMENT": "gpt-4o",
+    "AZURE_OPENAI_API_VERSION": "2024-06-01",
+    "AZURE_OPENAI_MODEL_NAME": "gpt-4o",
+    "AZURE_STT_KEY": "benchmark",
+    "AZURE_STT_REGION": "eastus",
+    "ST_CONNECTION_STRING": "DefaultEndpointsProtocol=https;AccountName=benchmark;AccountKey=YmVuY2htYXJr;EndpointSuffix=core.windows.net",
+    "ANONYMOUS_USER_ID": "000000000000000000000000",
+}
+
+
+@dataclass
+class BenchmarkApp:
+    app: object
+    db: MemoryDatabase
+    fakes: Dict[str, object]
+
+    def upstream_calls(self) -> Dict[str, int]:
+        calls = {name: fake.calls for name, fake in self.fakes.items() if hasattr(fake, "calls")}
+        calls["content_safety"] = sum(
+            evaluator.calls for evaluator in self.fakes["evaluators"].values()
+        )
+        return calls
+
+
+def build_app(profile: dict, scale: float = 1.0, seed: int = 0) -> BenchmarkApp:
+    """
+    Args:
+        profile (dict): The latency model of every upstream, see profiles/default.json.
+        scale (float): Multiplies every latency, to run a profile faster or slower.
+        seed (int): Seeds the latency and failure draws.
+    """
+    for name, value in placeholder_settings.items():
+        os.environ.setdefault(name, value)
+    os.environ.setdefault("TMP_UPLOAD_DIR", tempfile.mkdtemp(prefix="pact-benchmark-"))
+    for name, value in profile.get("settings", {}).items():
+        os.environ[name.upper()] = str(value)
+
+    rng = random.Random(seed)
+
+    def latency(upstream: str) -> LatencyModel:
+        return LatencyModel.from_profile(profile.get(upstream, {}), scale, rng)
+
+    from pact_backend.config import get_config
+
+    config = get_config()
+    config.db = MemoryDatabase(latency=latency("mongo"))
+
+    openai = FakeOpenAI(latency("openai"), profile.get("openai", {}).get("token_interval", 0.0))
+
+    import pact_backend.services.response as response_module
+
+    response_module.get_async_http_client = (
+        lambda limits, timeout, transport=None: openai.async_client()
+    )
+
+    import azure.cognitiveservices.speech as speechsdk
+
+    speech = FakeSpeech(latency("speech"), speechsdk)
+    speech.install()
+
+    from pact_backend.server import app
+    from pact_backend.services import upload as upload_module
+    from pact_backend.services.evaluators import EvaluatorRegistry, evaluator_classes
+
+    upload_module.ffmpeg = FakeFFmpeg()
+    upload_module.FileUpload().uploads = FakeContainer(latency("storage"))
+
+    registry = EvaluatorRegistry()
+    registry.credential = FakeCredential()
+    evaluators = {
+        name: FakeEvaluator(name, latency("content_safety")) for name in evaluator_classes
+    }
+    registry.evaluators = dict(evaluators)
+    text_analytics = FakeAsyncTextAnalytics(latency("text_analytics"))
+    registry.text_analytics = FakeTextAnalytics(latency("text_analytics"))
+    registry.async_text_analytics = text_analytics
+
+    return BenchmarkApp(
+        app=app,
+        db=config.db,
+        fakes={
+            "openai": openai,
+            "text_analytics": text_analytics,
+            "speech": speech,
+            "evaluators": evaluators,
+        },
+    )
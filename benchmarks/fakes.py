@@ -0,0 +1,362 @@
+"""
+Local fakes of the Azure services called by the backend.
+
+Every fake draws its latency and failures from a LatencyModel, so a benchmark
+profile can describe a slow, fast or flaky upstream.
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import httpx
+from azure.core.credentials import AccessToken
+
+
+@dataclass
+class LatencyModel:
+    """
+    Log-normal latency around `median` seconds, `sigma` being the spread
+    (0 gives a constant latency), and a probability of failing each call.
+    """
+
+    median: float = 0.0
+    sigma: float = 0.0
+    error_rate: float = 0.0
+    scale: float = 1.0
+    rng: random.Random = field(default_factory=lambda: random.Random(0))
+
+    @classmethod
+    def from_profile(cls, profile: dict, scale: float, rng: random.Random):
+        return cls(
+            median=profile.get("median", 0.0),
+            sigma=profile.get("sigma", 0.0),
+            error_rate=profile.get("error_rate", 0.0),
+            scale=scale,
+            rng=rng,
+        )
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.scale * self.median * math.exp(self.sigma * self.rng.gauss(0, 1))
+
+    def fails(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+
+class FakeUpstreamError(Exception):
+    pass
+
+
+# Azure OpenAI
+
+
+class FakeOpenAI:
+    """
+    Answers chat completion requests of the Azure OpenAI REST API, streaming
+    or not. Failures are answered with a 429 carrying a retry-after, or a 500.
+    """
+
+    def __init__(self, latency: LatencyModel, token_interval: float = 0.0):
+        self.latency = latency
+        self.token_interval = token_interval * latency.scale
+        self.calls = 0
+
+    def answer(self, prompt: str) -> str:
+        if "return only the score" in prompt:
+            return str(self.latency.rng.randint(2, 5))
+        words = prompt.split()
+        if "optimize" in prompt:
+            return "Optimized: " + " ".join(words[-12:])
+        return " ".join(["This", "is", "a", "generated", "answer", "about"] + words[:40])
+
+    def parse(self, request: httpx.Request):
+        body = json.loads(request.content or b"{}")
+        prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        return body, prompt
+
+    def failure(self) -> httpx.Response:
+        if self.latency.rng.random() < 0.5:
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": "200"},
+                json={"error": {"code": "429", "message": "Rate limit is exceeded."}},
+            )
+        return httpx.Response(500, json={"error": {"code": "500", "message": "Internal error"}})
+
+    def usage(self, prompt: str, content: str) -> dict:
+        prompt_tokens = max(1, len(prompt.split()))
+        completion_tokens = max(1, len(content.split()))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def completion(self, body: dict, prompt: str) -> httpx.Response:
+        content = self.answer(prompt)
+        return httpx.Response(
+            200,
+            json={
+                "id": f"chatcmpl-{self.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model") or "gpt-4o",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": self.usage(prompt, content),
+            },
+        )
+
+    def chunk(self, index: int, delta: dict, finish_reason=None) -> bytes:
+        payload = {
+            "id": f"chatcmpl-{index}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+    async def stream(self, body: dict, prompt: str):
+        content = self.answer(prompt)
+        tokens = content.split(" ")
+        yield self.chunk(self.calls, {"role": "assistant", "content": ""})
+        for index, token in enumerate(tokens):
+            if self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            yield self.chunk(self.calls, {"content": token if index == 0 else " " + token})
+        yield self.chunk(self.calls, {}, "stop")
+        if body.get("stream_options", {}).get("include_usage"):
+            usage = self.usage(prompt, content)
+            payload = {
+                "id": f"chatcmpl-{self.calls}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "gpt-4o",
+                "choices": [],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    async def ahandle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        body, prompt = self.parse(request)
+        await asyncio.sleep(self.latency.sample())
+        if self.latency.fails():
+            return self.failure()
+        if body.get("stream"):
+            return httpx.Response(
+                200, headers={"content-type": "text/event-stream"}, content=self.stream(body, prompt)
+            )
+        return self.completion(body, prompt)
+
+    def async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.ahandle))
+
+
+# Content safety evaluators
+
+
+class FakeEvaluator:
+    """
+    Blocking callable returning the result of a content safety evaluator.
+    """
+
+    def __init__(self, name: str, latency: LatencyModel):
+        self.name = name
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, *, query: str, response: str) -> dict:
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        if self.latency.fails():
+            raise FakeUpstreamError(f"{self.name} evaluation failed")
+        if self.name == "jailbreak":
+            return {
+                "xpia_label": False,
+                "xpia_reason": "No attack detected",
+                "xpia_manipulated_content": False,
+                "xpia_intrusion": False,
+                "xpia_information_gathering": False,
+            }
+        score = self.latency.rng.randint(0, 7)
+        return {
+            self.name: "Very low" if score < 2 else "Medium",
+            f"{self.name}_score": score,
+            f"{self.name}_reason": "Fake evaluation",
+        }
+
+
+class FakeCredential:
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("fake-token", int(time.time()) + 3600)
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"fetched": 0, "scopes": {}}
+
+
+# Text Analytics
+
+
+class FakeTextAnalytics:
+    """
+    Entity and PII recognition answering a whole batch of documents after one
+    latency sample, like the multi-document API. Capitalized words are taken
+    for entities.
+    """
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.calls = 0
+        self.documents = 0
+
+    def recognize(self, documents: list) -> list:
+        if self.latency.fails():
+            raise FakeUpstreamError("Text Analytics call failed")
+        results = []
+        for document in documents:
+            entities = [
+                SimpleNamespace(
+                    text=word,
+                    category="Person",
+                    confidence_score=round(self.latency.rng.uniform(0.3, 1.0), 2),
+                )
+                for word in document.split()
+                if word[:1].isupper()
+            ]
+            results.append(SimpleNamespace(is_error=False, entities=entities))
+        return results
+
+    def redact(self, documents: list) -> list:
+        results = self.recognize(documents)
+        for document, result in zip(documents, results):
+            result.redacted_text = " ".join(
+                "*" * len(word) if word[:1].isupper() else word for word in document.split()
+            )
+        return results
+
+    def recognize_entities(self, documents: list, **kwargs) -> list:
+        self.calls += 1
+        self.documents += len(documents)
+        time.sleep(self.latency.sample())
+        return self.recognize(documents)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncTextAnalytics(FakeTextAnalytics):
+    async def recognize_entities(self, documents: list, **kwargs) -> list:
+        self.calls += 1
+        self.documents += len(documents)
+        await asyncio.sleep(self.latency.sample())
+        return self.recognize(documents)
+
+    async def recognize_pii_entities(self, documents: list, **kwargs) -> list:
+        self.calls += 1
+        self.documents += len(documents)
+        await asyncio.sleep(self.latency.sample())
+        return self.redact(documents)
+
+    async def close(self):
+        pass
+
+
+# Speech to text, blob storage and ffmpeg used by /llm/voice
+
+
+class FakeSpeech:
+    """
+    Replaces the classes of the Speech SDK used by FileUpload. Recognition
+    blocks the calling thread like `recognize_once_async().get()` does.
+    """
+
+    def __init__(self, latency: LatencyModel, speechsdk):
+        self.latency = latency
+        self.speechsdk = speechsdk
+        self.calls = 0
+
+    def install(self):
+        fake = self
+
+        class SpeechConfig:
+            def __init__(self, subscription=None, region=None, **kwargs):
+                self.speech_recognition_language = "en-US"
+
+        class AudioConfig:
+            def __init__(self, filename=None, **kwargs):
+                self.filename = filename
+
+        class SpeechRecognizer:
+            def __init__(self, speech_config=None, audio_config=None, **kwargs):
+                pass
+
+            def recognize_once_async(self):
+                return SimpleNamespace(get=fake.recognize)
+
+        self.speechsdk.SpeechConfig = SpeechConfig
+        self.speechsdk.audio.AudioConfig = AudioConfig
+        self.speechsdk.SpeechRecognizer = SpeechRecognizer
+
+    def recognize(self):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        if self.latency.fails():
+            return SimpleNamespace(
+                reason=self.speechsdk.ResultReason.NoMatch, no_match_details="No speech"
+            )
+        return SimpleNamespace(
+            reason=self.speechsdk.ResultReason.RecognizedSpeech,
+            text="Write a short poem about the sea",
+        )
+
+
+class FakeBlob:
+    def __init__(self, name: str, latency: LatencyModel):
+        self.url = f"https://fake-storage.local/uploads/{name}"
+        self.latency = latency
+
+    def upload_blob(self, data, **kwargs):
+        time.sleep(self.latency.sample())
+
+
+class FakeContainer:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def get_blob_client(self, name: str) -> FakeBlob:
+        return FakeBlob(name, self.latency)
+
+
+class FakeFFmpeg:
+    """
+    Stands in for the ffmpeg module, "converting" by copying the input file.
+    """
+
+    Error = Exception
+
+    def input(self, path: str):
+        return SimpleNamespace(
+            output=lambda target: SimpleNamespace(run=lambda: self.convert(path, target))
+        )
+
+    @staticmethod
+    def convert(path: str, target: str):
+        with open(path, "rb") as source, open(target, "wb") as destination:
+            destination.write(source.read())
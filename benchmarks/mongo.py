@@ -0,0 +1,395 @@
+"""
+In-memory stand-in for the subset of the Motor API used by the backend.
+
+It keeps documents in dictionaries and supports the filters, updates,
+projections and bulk operations the services issue, so endpoints can be
+benchmarked without a Mongo server. Every operation waits for a round trip
+drawn from the latency model of the database, or at least yields to the event
+loop once.
+"""
+
+import asyncio
+import copy
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+_missing = object()
+
+
+def get_path(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _missing
+    return value
+
+
+def set_path(document: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def unset_path(document: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+
+def compare(value, operator: str, operand) -> bool:
+    if operator == "$exists":
+        return (value is not _missing) == bool(operand)
+    if operator == "$in":
+        if isinstance(value, list):
+            return any(item in operand for item in value)
+        return value in operand
+    if operator == "$nin":
+        return not compare(value, "$in", operand)
+    if operator == "$ne":
+        return value != operand
+    if operator == "$eq":
+        return value == operand
+    if operator == "$not":
+        return not all(compare(value, op, inner) for op, inner in operand.items())
+    if value is _missing or value is None:
+        return False
+    try:
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Unsupported query operator {operator}")
+
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = get_path(document, key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            if not all(compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif isinstance(value, list) and not isinstance(condition, list):
+            if condition not in value:
+                return False
+        elif (None if value is _missing else value) != condition:
+            return False
+    return True
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    included = [key for key, flag in projection.items() if flag and key != "_id"]
+    if included:
+        result = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+        for key in included:
+            value = get_path(document, key)
+            if value is not _missing:
+                set_path(result, key, value)
+        return result
+    for key, flag in projection.items():
+        if not flag:
+            unset_path(document, key)
+    return document
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False):
+    if not any(key.startswith("$") for key in update):
+        keep_id = document.get("_id")
+        document.clear()
+        document.update(copy.deepcopy(update))
+        if keep_id is not None:
+            document["_id"] = keep_id
+        return
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                set_path(document, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(document, path, copy.deepcopy(value))
+            elif operator == "$inc":
+                current = get_path(document, path)
+                set_path(document, path, (0 if current is _missing else current) + value)
+            elif operator == "$max":
+                current = get_path(document, path)
+                if current is _missing or value > current:
+                    set_path(document, path, value)
+            elif operator == "$min":
+                current = get_path(document, path)
+                if current is _missing or value < current:
+                    set_path(document, path, value)
+            elif operator == "$unset":
+                unset_path(document, path)
+            elif operator == "$push":
+                current = get_path(document, path)
+                set_path(document, path, ([] if current is _missing else current) + [value])
+            else:
+                raise NotImplementedError(f"Unsupported update operator {operator}")
+
+
+def sort_key(sort):
+    def key(document):
+        values = []
+        for field, direction in sort:
+            value = get_path(document, field)
+            values.append((value is _missing, value if value is not _missing else None))
+        return values
+
+    return key
+
+
+class MemoryCursor:
+    def __init__(self, collection, documents: List[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._documents = documents
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1):
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self) -> List[dict]:
+        documents = self._documents
+        for field, direction in reversed(self._sort):
+            documents = sorted(documents, key=sort_key([(field, direction)]), reverse=direction < 0)
+        documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[: self._limit]
+        return [project(document, self._projection) for document in documents]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection._round_trip()
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection._round_trip()
+        for document in self._results():
+            yield document
+
+
+class MemoryCollection:
+    def __init__(self, name: str, latency=None):
+        self.name = name
+        self.latency = latency
+        self.documents: Dict[Any, dict] = {}
+        self.indexes: List[Any] = []
+        self.operations = 0
+
+    async def _round_trip(self):
+        self.operations += 1
+        await asyncio.sleep(self.latency.sample() if self.latency else 0)
+
+    def _find(self, query: Optional[dict]) -> List[dict]:
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            document = self.documents.get(query["_id"])
+            return [document] if document is not None else []
+        return [document for document in self.documents.values() if matches(document, query)]
+
+    async def create_index(self, keys, **kwargs):
+        await self._round_trip()
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        cursor = MemoryCursor(self, self._find(query), projection)
+        if "sort" in kwargs:
+            cursor.sort(kwargs["sort"])
+        if "limit" in kwargs:
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        await self._round_trip()
+        documents = self._find(query)
+        if "sort" in kwargs and documents:
+            documents = MemoryCursor(self, documents, None).sort(kwargs["sort"])._results()
+        return project(documents[0], projection) if documents else None
+
+    async def count_documents(self, query: dict, **kwargs) -> int:
+        await self._round_trip()
+        return len(self._find(query))
+
+    def _insert(self, document: dict):
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+        self.documents[document["_id"]] = copy.deepcopy(document)
+        return document["_id"]
+
+    async def insert_one(self, document: dict, **kwargs):
+        await self._round_trip()
+        return SimpleNamespace(inserted_id=self._insert(document), acknowledged=True)
+
+    async def insert_many(self, documents: List[dict], **kwargs):
+        await self._round_trip()
+        return SimpleNamespace(
+            inserted_ids=[self._insert(document) for document in documents], acknowledged=True
+        )
+
+    def _update(self, query: dict, update: dict, upsert: bool = False, many: bool = False):
+        documents = self._find(query)
+        if not many:
+            documents = documents[:1]
+        for document in documents:
+            apply_update(document, update)
+        if documents or not upsert:
+            return SimpleNamespace(
+                matched_count=len(documents), modified_count=len(documents), upserted_id=None
+            )
+        document = {
+            key: value
+            for key, value in query.items()
+            if not key.startswith("$") and not isinstance(value, dict)
+        }
+        apply_update(document, update, inserting=True)
+        if "_id" in query and not isinstance(query["_id"], dict):
+            document["_id"] = query["_id"]
+        upserted_id = self._insert(document)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=upserted_id)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, **kwargs):
+        await self._round_trip()
+        return self._update(query, update, upsert)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False, **kwargs):
+        await self._round_trip()
+        return self._update(query, update, upsert, many=True)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False, **kwargs):
+        await self._round_trip()
+        return self._update(query, replacement, upsert)
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        projection: Optional[dict] = None,
+        sort=None,
+        upsert: bool = False,
+        return_document=ReturnDocument.BEFORE,
+        **kwargs,
+    ):
+        await self._round_trip()
+        documents = self._find(query)
+        if sort and documents:
+            documents = sorted(documents, key=sort_key(sort))
+        if not documents:
+            if not upsert:
+                return None
+            result = self._update(query, update, upsert=True)
+            if return_document == ReturnDocument.AFTER:
+                return project(self.documents[result.upserted_id], projection)
+            return None
+        document = documents[0]
+        before = project(document, projection)
+        apply_update(document, update)
+        return project(document, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_one(self, query: dict, **kwargs):
+        await self._round_trip()
+        documents = self._find(query)[:1]
+        for document in documents:
+            del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=len(documents))
+
+    async def delete_many(self, query: dict, **kwargs):
+        await self._round_trip()
+        documents = self._find(query)
+        for document in documents:
+            del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=len(documents))
+
+    async def bulk_write(self, operations: list, ordered: bool = True, **kwargs):
+        await self._round_trip()
+        counts = {"inserted": 0, "matched": 0, "modified": 0, "upserted": 0, "deleted": 0}
+        for operation in operations:
+            if isinstance(operation, InsertOne):
+                self._insert(operation._doc)
+                counts["inserted"] += 1
+                continue
+            if isinstance(operation, DeleteOne):
+                counts["deleted"] += (await self.delete_one(operation._filter)).deleted_count
+                continue
+            if isinstance(operation, (UpdateOne, UpdateMany, ReplaceOne)):
+                result = self._update(
+                    operation._filter,
+                    operation._doc,
+                    bool(operation._upsert),
+                    many=isinstance(operation, UpdateMany),
+                )
+                counts["matched"] += result.matched_count
+                counts["modified"] += result.modified_count
+                counts["upserted"] += result.upserted_id is not None
+                continue
+            raise NotImplementedError(f"Unsupported bulk operation {type(operation).__name__}")
+        return SimpleNamespace(
+            inserted_count=counts["inserted"],
+            matched_count=counts["matched"],
+            modified_count=counts["modified"],
+            upserted_count=counts["upserted"],
+            deleted_count=counts["deleted"],
+        )
+
+
+class MemoryDatabase:
+    def __init__(self, name: str = "benchmark", latency=None):
+        self.name = name
+        self.latency = latency
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self.latency)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def operations(self) -> Dict[str, int]:
+        return {
+            name: collection.operations
+            for name, collection in self.collections.items()
+            if collection.operations
+        }
@@ -0,0 +1,148 @@
+"""
+Closed-loop load generation against the in-process app, with an event-loop
+lag monitor, and comparison of the results against saved baselines.
+"""
+
+import asyncio
+import math
+import random
+import time
+from typing import Dict, List
+
+import httpx
+
+from .scenarios import Scenario
+
+
+def percentile(samples: List[float], value: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    index = min(len(samples) - 1, max(0, math.ceil(value / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+class LoopLagMonitor:
+    """
+    Measures how late a periodic timer fires, which is the time the event
+    loop spent running blocking code instead of serving requests.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started_at - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    context: dict,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    Sends `requests` requests with `concurrency` of them in flight at any time.
+    A response with a status of 500 or more, or a transport error, is an error.
+    """
+    rng = random.Random(seed)
+    built = [scenario.build(rng, index, context) for index in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < len(built):
+            request = built[next_index]
+            next_index += 1
+            started_at = time.perf_counter()
+            try:
+                response = await client.request(
+                    request.method,
+                    request.path,
+                    json=request.json,
+                    files=request.files,
+                    data=request.data,
+                    cookies=request.cookies,
+                )
+                await response.aread()
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started_at)
+            errors += failed
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    await monitor.stop()
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(monitor.lags, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(monitor.lags, default=0.0) * 1000, 2),
+    }
+
+
+# Metrics compared against the baseline, and whether higher is better
+compared_metrics = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "loop_lag_p99_ms": False,
+}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 5.0) -> List[str]:
+    """
+    Returns the regressions of the results against the baseline. A latency
+    regresses when it is more than `tolerance` (a ratio) and `min_delta_ms`
+    worse, the throughput when it is more than `tolerance` lower.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric, higher_is_better in compared_metrics.items():
+            if metric not in reference:
+                continue
+            current, previous = result[metric], reference[metric]
+            if higher_is_better:
+                regressed = current < previous * (1 - tolerance)
+            else:
+                regressed = (
+                    current > previous * (1 + tolerance)
+                    and current - previous > min_delta_ms
+                )
+            if regressed:
+                regressions.append(f"{name} {metric}: {previous} -> {current}")
+    return regressions
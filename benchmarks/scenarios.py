@@ -0,0 +1,149 @@
+"""
+The endpoints exercised by the benchmark and the requests sent to them.
+"""
+
+import datetime
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+
+words = (
+    "please explain how the ocean tides work and why the moon matters for "
+    "sailors who travel across Europe with Alice and Bob during winter storms"
+).split()
+
+metric_names = (
+    "grammar",
+    "spell_check",
+    "sensitive_info",
+    "violence",
+    "bias_gender",
+    "self_harm",
+    "hate_unfairness",
+)
+
+
+def sentence(rng: random.Random, index: int) -> str:
+    return " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))) + f" #{index}"
+
+
+def scores(rng: random.Random) -> dict:
+    return {
+        **{name: rng.randint(0, 5) for name in metric_names},
+        "jailbreak": rng.random() < 0.05,
+    }
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    json: Optional[dict] = None
+    files: Optional[dict] = None
+    data: Optional[dict] = None
+    cookies: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[random.Random, int, dict], Request]
+    description: str
+
+
+def prompt_request(rng: random.Random, index: int, context: dict) -> Request:
+    return Request("POST", "/api/v1/llm/prompt", json={"prompt": sentence(rng, index)})
+
+
+def metrics_request(rng: random.Random, index: int, context: dict) -> Request:
+    return Request(
+        "POST",
+        "/api/v1/llm/metrics",
+        json={
+            "query": sentence(rng, index),
+            "answer": sentence(rng, index),
+            "opt_query": sentence(rng, index),
+            "opt_answer": sentence(rng, index),
+            "flagged": False,
+            "metrics": None,
+        },
+    )
+
+
+def chat_get_request(rng: random.Random, index: int, context: dict) -> Request:
+    return Request("GET", "/api/v1/chat/get", cookies={"token": rng.choice(context["tokens"])})
+
+
+def statistics_add_request(rng: random.Random, index: int, context: dict) -> Request:
+    return Request(
+        "POST",
+        "/api/v1/statistics/add",
+        json={"metrics": scores(rng), "opt_metrics": scores(rng), "flagged": False},
+    )
+
+
+def voice_request(rng: random.Random, index: int, context: dict) -> Request:
+    return Request(
+        "POST",
+        "/api/v1/llm/voice",
+        files={"audio": (f"voice-{index}.wav", b"RIFF" + bytes(2048), "audio/wav")},
+        data={"language_code": "en-US"},
+    )
+
+
+scenarios: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("prompt", prompt_request, "POST /llm/prompt, 3 Azure OpenAI calls"),
+        Scenario("metrics", metrics_request, "POST /llm/metrics, both pairs evaluated"),
+        Scenario("chat_get", chat_get_request, "GET /chat/get for users with seeded chats"),
+        Scenario("statistics_add", statistics_add_request, "POST /statistics/add"),
+        Scenario("voice", voice_request, "POST /llm/voice, speech to text then prompt"),
+    )
+}
+
+
+async def seed(db, rng: random.Random, users: int, histories: int, chats: int) -> dict:
+    """
+    Inserts `histories` conversations of `chats` chats for every user, and
+    returns the session cookies of the users.
+    """
+    from pact_backend.helpers.auth import sign_jwt
+
+    tokens: List[str] = []
+    now = datetime.datetime.utcnow()
+    for user in range(users):
+        user_id = str(ObjectId())
+        tokens.append(sign_jwt(user_id, f"user{user}")[0])
+        history_documents = [
+            {
+                "_id": ObjectId(),
+                "user_id": user_id,
+                "title": f"Conversation {number}",
+                "title_pending": False,
+                "created_at": now,
+            }
+            for number in range(histories)
+        ]
+        if history_documents:
+            await db["history"].insert_many(history_documents)
+        chat_documents = [
+            {
+                "history_id": str(history["_id"]),
+                "prompt": sentence(rng, number),
+                "opt_prompt": sentence(rng, number),
+                "response": sentence(rng, number),
+                "opt_response": sentence(rng, number),
+                "flagged": False,
+                "prompt_metrics": scores(rng),
+                "opt_prompt_metrics": scores(rng),
+                "created_at": now,
+            }
+            for history in history_documents
+            for number in range(chats)
+        ]
+        if chat_documents:
+            await db["chat"].insert_many(chat_documents)
+    return {"tokens": tokens}
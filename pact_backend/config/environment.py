@@ -1,10 +1,24 @@
+from typing import Dict, List, Optional
+
 from dotenv import load_dotenv
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from ..helpers import singleton
 
 load_dotenv()
 
 
+class DeploymentConfig(BaseModel):
+    endpoint: str
+    api_key: str
+    deployment: str
+    api_version: Optional[str] = None
+    name: Optional[str] = None
+    weight: float = 1.0
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+
+
 @singleton.singleton
 class EnvVarConfig(BaseSettings):
     environment: str
@@ -33,6 +47,107 @@ class EnvVarConfig(BaseSettings):
     azure_openai_api_version: str
     azure_openai_model_name: str    
 
+    # Pool of Azure OpenAI deployments of the same model, as a JSON list of
+    # DeploymentConfig. The single deployment above is used when it is empty.
+    azure_openai_deployments: List[DeploymentConfig] = []
+    deployment_failure_threshold: int = 3
+    deployment_cooldown: float = 30.0
+
+    # Azure OpenAI connection pool shared by every BotHandler call
+    llm_timeout: float = 30.0
+    llm_max_connections: int = 256
+    llm_max_keepalive_connections: int = 64
+    llm_keepalive_expiry: float = 30.0
+    llm_max_retries: int = 3
+
+    # Azure OpenAI deployment quota, 0 disables the corresponding limit
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+
+    # Hedged requests and circuit breakers for upstream AI calls. Hedging is
+    # off by default, every backup request is a second full completion
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_max_workers: int = 32
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    # Evaluators and clients shared by every /llm/metrics call
+    evaluator_max_connections: int = 64
+    text_analytics_batch_size: int = 5
+    text_analytics_batch_wait: float = 0.005
+    evaluator_token_scope: str = "https://management.azure.com/.default"
+    token_refresh_margin: float = 300.0
+    evaluation_max_workers: int = 32
+    metric_timeout: float = 20.0
+    metric_timeouts: Dict[str, float] = {}
+
+    # Per-metric evaluation result cache
+    eval_cache_enabled: bool = True
+    eval_cache_max_entries: int = 50000
+    eval_cache_ttl: int = 3600
+    eval_cache_mongo_ttl: int = 604800
+    metric_versions: Dict[str, str] = {}
+
+    # Metrics job queue and `python -m pact_backend.worker`
+    metrics_job_lease_ttl: float = 60.0
+    metrics_job_max_attempts: int = 3
+    metrics_job_poll_interval: float = 1.0
+    metrics_job_ttl: int = 86400
+    metrics_worker_concurrency: int = 4
+
+    # Write-behind buffer of /statistics/add, the flush interval bounds the
+    # increments lost if a worker dies
+    statistics_write_behind: bool = True
+    statistics_flush_interval: float = 1.0
+    statistics_flush_events: int = 1000
+
+    # Minute, hour and day statistics buckets, retention in seconds per
+    # granularity (kept forever when missing) and the longest /statistics/get series
+    statistics_bucket_retention: Dict[str, int] = {"minute": 172800, "hour": 7776000}
+    statistics_max_buckets: int = 1440
+
+    # Statistics derived from the chat collection by
+    # `python -m pact_backend.worker statistics` instead of /statistics/add
+    statistics_materialized: bool = False
+    statistics_materialize_batch_size: int = 5000
+    statistics_materialize_lag: float = 60.0
+    statistics_materialize_interval: float = 30.0
+
+    # In-process cache of /statistics/get responses
+    statistics_cache_ttl: float = 5.0
+    statistics_cache_max_entries: int = 256
+
+    # Record/replay of upstream calls: "off", "record" or "replay"
+    cassette_mode: str = "off"
+    cassette_dir: str = "cassettes"
+    cassette_latency_scale: float = 1.0
+
+    # LLM usage ledger
+    usage_batch_size: int = 200
+    usage_flush_interval: float = 5.0
+    usage_max_buffer: int = 10000
+
+    # Users allowed to read the usage of every user and the upstream stats
+    admin_usernames: List[str] = []
+
+    # Deterministic LLM response cache
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 10000
+    llm_cache_ttl: int = 3600
+    llm_cache_mongo_ttl: int = 86400
+
+    # Cross-worker leases used to coalesce identical upstream calls
+    lease_enabled: bool = True
+    lease_ttl: float = 35.0
+    lease_poll_interval: float = 0.2
+
+    # /llm/prompt/batch
+    llm_batch_concurrency: int = 8
+    llm_batch_max_concurrency: int = 64
+    llm_batch_max_items: int = 1000
+
     # Azure speech to text
     azure_stt_key: str
     azure_stt_region: str
@@ -0,0 +1,11 @@
+optimize_prompt_template = 'Please analyze the given prompt and optimize it by removing any grammatical errors, spelling mistakes, biases (such as gender, racial, or cultural biases), sensitive or personal information, inappropriate content (such as self-harm, violence, or explicit material), and any unclear or incomplete phrasing. Ensure the optimized prompt is structured for clarity, neutrality, and inclusivity, making it more effective in generating meaningful and constructive responses only prompt no explanation."{prompt}"'
+
+voice_optimize_prompt_template = 'Please analyze the given prompt and optimize it by removing any grammatical errors, spelling mistakes, biases (such as gender, racial, or cultural biases), sensitive or personal information, inappropriate content (such as self-harm, violence, or explicit material), and any unclear or incomplete phrasing. Ensure the optimized prompt is structured for clarity, neutrality, and inclusivity, incorporating responsible AI principles making it more effective in generating meaningful and constructive responses only prompt no explanation.\n"{prompt}"'
+
+title_prompt_template = "For the following message '{user_msg}' give me a proper title for the chat. The length of the title should not be more than 3 words"
+
+grammar_prompt_template = "Evaluate the grammatical correctness of the following sentence and return only the score from 0 to 5:\n\n{query}"
+
+spell_check_prompt_template = "Evaluate the spelling accuracy of the following sentence and return only the score from 0 to 5:\n\n{query}"
+
+content_filter_message = "The provided prompt was filtered due to the prompt triggering the content management policy. Please modify your prompts"
@@ -51,3 +51,13 @@ def verify_jwt(token: str) -> bool:
     if decode_jwt(token):
         return True
     return False
+
+
+def get_user_id(token: str | None) -> str | None:
+    if token and (payload := decode_jwt(token)):
+        return payload.get("user_id")
+    return None
+
+
+def is_admin(payload: dict | None) -> bool:
+    return bool(payload) and payload.get("username") in config.env.admin_usernames
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers and processes them with a
+    single batched call.
+
+    A batch is sent `max_wait` seconds after its first item arrived, or as soon
+    as it holds `max_batch_size` items. `fn` receives the items of a batch and
+    returns one result per item, in the same order. An error raised by `fn` is
+    raised to every caller of the batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int,
+        max_wait: float,
+    ):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._items: List[Any] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to the batches it runs
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if items:
+            task = asyncio.ensure_future(self._run(items, futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: List[Any], futures: List[asyncio.Future]):
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = await self.fn(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "pending": len(self._items),
+        }
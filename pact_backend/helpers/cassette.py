@@ -0,0 +1,420 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+import urllib3
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Parts of an HTTP request compared to find its recorded response
+request_matchers = ("method", "host", "path", "url", "body")
+
+# Response headers not replayed, the recorded body is already decoded or
+# its length may not match once replayed as one chunk
+dropped_headers = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CassetteMiss(Exception):
+    """
+    Raised in replay mode for a request or call that was never recorded.
+    """
+
+
+def encode_body(body: bytes) -> dict:
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode("ascii")}
+
+
+def decode_body(body: dict) -> bytes:
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body.get("text", "").encode("utf-8")
+
+
+class Cassette:
+    """
+    Recorded upstream interactions of one service, stored as a JSON file.
+
+    In "record" mode every interaction is appended along with its timing and
+    `save` writes them out. In "replay" mode the interactions are loaded from
+    the file and served back in recorded order for identical keys, cycling
+    once exhausted, after waiting the recorded latency times `latency_scale`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str,
+        latency_scale: float = 1.0,
+        match: Iterable[str] = ("method", "url", "body"),
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        unknown = set(match) - set(request_matchers)
+        if unknown:
+            raise ValueError(f"Unknown request matchers: {', '.join(sorted(unknown))}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.match = tuple(match)
+        self.interactions: List[dict] = []
+        self._by_key: Dict[str, List[dict]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if self.replaying:
+            self.load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def request_key(self, method: str, url: str, body: bytes) -> str:
+        parts = urlsplit(url)
+        values = {
+            "method": method.upper(),
+            "host": parts.netloc,
+            "path": parts.path,
+            "url": url,
+            "body": body or b"",
+        }
+        return self.key(*(values[matcher] for matcher in self.match))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            self.interactions = json.load(file).get("interactions", [])
+        for interaction in self.interactions:
+            self._by_key[interaction["key"]].append(interaction)
+
+    def save(self):
+        if self.replaying:
+            return
+        with self.lock:
+            interactions = list(self.interactions)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"interactions": interactions}, file, indent=1)
+
+    def record(self, interaction: dict):
+        with self.lock:
+            self.interactions.append(interaction)
+            self._by_key[interaction["key"]].append(interaction)
+            self.recorded += 1
+
+    def play(self, key: str, description: str) -> dict:
+        with self.lock:
+            interactions = self._by_key.get(key)
+            if not interactions:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded interaction for {description} in {self.path}")
+            interaction = interactions[self._cursor[key] % len(interactions)]
+            self._cursor[key] += 1
+            self.replayed += 1
+        return interaction
+
+    def delay(self, seconds: float) -> float:
+        return max(0.0, seconds * self.latency_scale)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "interactions": len(self.interactions),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+
+# httpx, used by the Azure OpenAI clients
+
+
+def response_interaction(key: str, method: str, url: str, status: int, headers) -> dict:
+    return {
+        "key": key,
+        "request": {"method": method, "url": url},
+        "response": {
+            "status": status,
+            "headers": [
+                [name, value] for name, value in headers if name.lower() not in dropped_headers
+            ],
+            "chunks": [],
+        },
+    }
+
+
+class RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """
+    Passes the body of a live response through while recording every chunk
+    with the time it arrived, relative to the start of the request.
+    """
+
+    def __init__(self, response: httpx.Response, cassette: Cassette, interaction: dict, started_at: float):
+        self.response = response
+        self.cassette = cassette
+        self.interaction = interaction
+        self.started_at = started_at
+        self.recorded = False
+
+    def add(self, chunk: bytes):
+        self.interaction["response"]["chunks"].append(
+            {"at": time.perf_counter() - self.started_at, **encode_body(chunk)}
+        )
+
+    def finish(self):
+        if not self.recorded:
+            self.recorded = True
+            self.cassette.record(self.interaction)
+
+    def __iter__(self):
+        for chunk in self.response.iter_bytes():
+            self.add(chunk)
+            yield chunk
+        self.finish()
+
+    async def __aiter__(self):
+        async for chunk in self.response.aiter_bytes():
+            self.add(chunk)
+            yield chunk
+        self.finish()
+
+    def close(self):
+        self.response.close()
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+class ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """
+    Yields the recorded chunks of a response, each one at its recorded time
+    times the latency scale.
+    """
+
+    def __init__(self, chunks: List[dict], cassette: Cassette, started_at: float):
+        self.chunks = chunks
+        self.cassette = cassette
+        self.started_at = started_at
+
+    def wait(self, chunk: dict) -> float:
+        return self.cassette.delay(chunk["at"]) - (time.perf_counter() - self.started_at)
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if (delay := self.wait(chunk)) > 0:
+                time.sleep(delay)
+            yield decode_body(chunk)
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            if (delay := self.wait(chunk)) > 0:
+                await asyncio.sleep(delay)
+            yield decode_body(chunk)
+
+
+def replay_response(cassette: Cassette, request: httpx.Request, started_at: float) -> httpx.Response:
+    url = str(request.url)
+    key = cassette.request_key(request.method, url, request.content)
+    response = cassette.play(key, f"{request.method} {url}")["response"]
+    return httpx.Response(
+        response["status"],
+        headers=response["headers"],
+        stream=ReplayStream(response["chunks"], cassette, started_at),
+        request=request,
+    )
+
+
+def recording_response(
+    cassette: Cassette, request: httpx.Request, response: httpx.Response, started_at: float
+) -> httpx.Response:
+    url = str(request.url)
+    key = cassette.request_key(request.method, url, request.content)
+    interaction = response_interaction(
+        key, request.method, url, response.status_code, response.headers.multi_items()
+    )
+    interaction["response"]["latency"] = time.perf_counter() - started_at
+    return httpx.Response(
+        response.status_code,
+        headers=interaction["response"]["headers"],
+        stream=RecordingStream(response, cassette, interaction, started_at),
+        request=request,
+        extensions=response.extensions,
+    )
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport recording the requests sent through `transport`, or
+    replaying them from the cassette without any network access.
+    """
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        await request.aread()
+        if self.cassette.replaying:
+            return replay_response(self.cassette, request, started_at)
+        response = await self.transport.handle_async_request(request)
+        return recording_response(self.cassette, request, response, started_at)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# requests, used by the azure-core clients (Text Analytics, blob storage)
+
+
+class CassetteAdapter(BaseAdapter):
+    """
+    requests adapter recording the requests sent through `adapter`, or
+    replaying them from the cassette. Mounted on the session of an azure-core
+    RequestsTransport, it covers every Azure SDK client built on it.
+    """
+
+    def __init__(self, cassette: Cassette, adapter: Optional[BaseAdapter] = None):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter or HTTPAdapter()
+
+    @staticmethod
+    def body(request: requests.PreparedRequest) -> bytes:
+        body = request.body or b""
+        if isinstance(body, str):
+            return body.encode("utf-8")
+        if not isinstance(body, bytes):
+            # File-like or generator bodies are read once and replaced
+            body = body.read() if hasattr(body, "read") else b"".join(body)
+            request.body = body
+        return body
+
+    @staticmethod
+    def build_response(request: requests.PreparedRequest, status: int, headers, content: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = urllib3.HTTPResponse(
+            body=io.BytesIO(content), headers=dict(headers), status=status, preload_content=False
+        )
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.reason = requests.status_codes._codes.get(status, ("",))[0].upper()
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def send(self, request: requests.PreparedRequest, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started_at = time.perf_counter()
+        body = self.body(request)
+        key = self.cassette.request_key(request.method, request.url, body)
+        if self.cassette.replaying:
+            interaction = self.cassette.play(key, f"{request.method} {request.url}")
+            recorded = interaction["response"]
+            time.sleep(self.cassette.delay(recorded["latency"]))
+            return self.build_response(
+                request,
+                recorded["status"],
+                recorded["headers"],
+                b"".join(decode_body(chunk) for chunk in recorded["chunks"]),
+            )
+
+        response = self.adapter.send(
+            request, stream=False, timeout=timeout, verify=verify, cert=cert, proxies=proxies
+        )
+        content = response.content
+        latency = time.perf_counter() - started_at
+        interaction = response_interaction(
+            key, request.method, request.url, response.status_code, response.headers.items()
+        )
+        interaction["response"]["latency"] = latency
+        interaction["response"]["chunks"].append({"at": latency, **encode_body(content)})
+        self.cassette.record(interaction)
+        return self.build_response(
+            request, response.status_code, interaction["response"]["headers"], content
+        )
+
+    def close(self):
+        self.adapter.close()
+
+
+def get_cassette_session(cassette: Cassette, adapter: Optional[BaseAdapter] = None) -> requests.Session:
+    session = requests.Session()
+    cassette_adapter = CassetteAdapter(cassette, adapter)
+    session.mount("https://", cassette_adapter)
+    session.mount("http://", cassette_adapter)
+    return session
+
+
+# Function calls, used by the SDKs without a pluggable transport
+
+
+class RecordedCall:
+    """
+    Wraps a blocking function whose arguments and JSON serializable result
+    are recorded, or replayed without calling it. Errors are recorded too
+    and raised again as RuntimeError on replay.
+
+    `key` maps the arguments to the values identifying the call, all of them
+    by default. `fn` may be None in replay mode.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        name: str,
+        fn: Optional[Callable[..., Any]],
+        key: Optional[Callable[..., Any]] = None,
+    ):
+        self.cassette = cassette
+        self.name = name
+        self.fn = fn
+        self.key = key or (lambda *args, **kwargs: [args, kwargs])
+
+    def __call__(self, *args, **kwargs):
+        key = self.cassette.key(self.name, self.key(*args, **kwargs))
+        if self.cassette.replaying:
+            interaction = self.cassette.play(key, f"call to {self.name}")
+            time.sleep(self.cassette.delay(interaction["latency"]))
+            if interaction.get("error") is not None:
+                raise RuntimeError(interaction["error"])
+            return interaction["result"]
+
+        started_at = time.perf_counter()
+        interaction = {"key": key, "call": self.name, "result": None, "error": None}
+        try:
+            interaction["result"] = self.fn(*args, **kwargs)
+            return interaction["result"]
+        except Exception as e:
+            interaction["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            interaction["latency"] = time.perf_counter() - started_at
+            self.cassette.record(interaction)
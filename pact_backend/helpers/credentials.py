@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+from azure.core.credentials import AccessToken
+
+
+class CachedTokenCredential:
+    """
+    Wraps a TokenCredential so access tokens are fetched once per scope and
+    shared by every caller. A token close to expiry is refreshed in the
+    background while the current one is still handed out, so callers only
+    block on the very first fetch or after the token actually expired.
+    """
+
+    def __init__(self, credential, refresh_margin: float = 300.0):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self.tokens: dict[tuple, AccessToken] = {}
+        self.refreshing: set[tuple] = set()
+        self.lock = threading.Lock()
+        self.fetched = 0
+
+    def fetch(self, scopes: tuple, **kwargs) -> AccessToken:
+        token = self.credential.get_token(*scopes, **kwargs)
+        with self.lock:
+            self.tokens[scopes] = token
+            self.fetched += 1
+        return token
+
+    def refresh(self, scopes: tuple, **kwargs):
+        try:
+            self.fetch(scopes, **kwargs)
+        except Exception as e:
+            logging.error(f"Error refreshing access token: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(scopes)
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        if kwargs.get("claims"):
+            # Claims challenges always need a fresh token
+            return self.fetch(scopes, **kwargs)
+
+        now = time.time()
+        with self.lock:
+            token = self.tokens.get(scopes)
+            if token is not None and token.expires_on - now > self.refresh_margin:
+                return token
+            usable = token is not None and token.expires_on - now > 30
+            if usable and scopes not in self.refreshing:
+                self.refreshing.add(scopes)
+                threading.Thread(
+                    target=self.refresh, args=(scopes,), kwargs=kwargs, daemon=True
+                ).start()
+        if usable:
+            return token
+        return self.fetch(scopes, **kwargs)
+
+    def close(self):
+        close = getattr(self.credential, "close", None)
+        if close is not None:
+            close()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            return {
+                "fetched": self.fetched,
+                "scopes": {
+                    " ".join(scopes): round(token.expires_on - now)
+                    for scopes, token in self.tokens.items()
+                },
+            }
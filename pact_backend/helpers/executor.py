@@ -0,0 +1,36 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict
+
+_executors: Dict[str, concurrent.futures.ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str, max_workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Returns the bounded executor registered under `name`, shared by the process.
+    The size given by the first caller is kept.
+    """
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=name
+            )
+            _executors[name] = executor
+        return executor
+
+
+async def run_in_executor(
+    executor: concurrent.futures.Executor, fn: Callable[..., Any], *args
+) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def shutdown_executors():
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
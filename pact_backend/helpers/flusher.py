@@ -0,0 +1,65 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+class FlushLoop:
+    """
+    Calls `flush` from a background task every `interval` seconds, or as soon
+    as it is woken up, and a last time when stopped.
+
+    The task is stopped with a flag and the wake event instead of being
+    cancelled, a cancellation racing the wake event can be lost.
+    """
+
+    def __init__(self, flush: Callable[[], Awaitable[None]], interval: float):
+        self.flush = flush
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """
+        Requests a flush without waiting for the interval. Can be called from
+        any thread, does nothing while the loop is not running.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is loop:
+            self._wake.set()
+        else:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._loop = None
+        await self.flush()
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for a requests-per-minute and a tokens-per-minute quota.
+
+    Callers reserve capacity up front and the buckets are allowed to go into
+    debt, so every caller is given a wait proportional to the debt ahead of it
+    and callers are served in the order they arrived instead of stampeding
+    once capacity frees up. A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves one request and `tokens` tokens.
+
+        Returns:
+            float: Seconds the caller has to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(self._blocked_until - now, 0.0)
+            if self.requests_per_minute:
+                self._requests -= 1
+                delay = max(delay, -self._requests * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                self._tokens -= min(tokens, self.tokens_per_minute)
+                delay = max(delay, -self._tokens * 60 / self.tokens_per_minute)
+            return delay
+
+    def expected_delay(self, tokens: int) -> float:
+        """
+        Returns the wait a reservation of `tokens` would get, without reserving.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(self._blocked_until - now, 0.0)
+            if self.requests_per_minute:
+                delay = max(delay, (1 - self._requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+                delay = max(delay, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            return delay
+
+    def reconcile(self, estimated: int, actual: int):
+        """
+        Corrects a reservation made from an estimate with the actual usage.
+        """
+        if not (self.tokens_per_minute and actual):
+            return
+        with self._lock:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + min(estimated, self.tokens_per_minute) - actual,
+            )
+
+    def cancel(self, tokens: int):
+        """
+        Gives back a reservation of `tokens` tokens whose request was never sent.
+        """
+        with self._lock:
+            if self.requests_per_minute:
+                self._requests = min(self.requests_per_minute, self._requests + 1)
+            if self.tokens_per_minute:
+                self._tokens = min(
+                    self.tokens_per_minute,
+                    self._tokens + min(tokens, self.tokens_per_minute),
+                )
+
+    def backoff(self, seconds: float):
+        """
+        Blocks every caller for `seconds`, as requested by a retry-after header.
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def _blocked_for(self) -> float:
+        with self._lock:
+            return max(self._blocked_until - time.monotonic(), 0.0)
+
+    def _record(self, waited: float):
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    async def acquire(self, tokens: int):
+        delay = self.reserve(tokens)
+        if not delay:
+            self._record(0.0)
+            return
+        started_at = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            # A backoff may have been requested while this caller was waiting
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self._blocked_for()
+        except asyncio.CancelledError:
+            self.cancel(tokens)
+            raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+            self._record(time.monotonic() - started_at)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "available_requests": self._requests if self.requests_per_minute else None,
+                "available_tokens": self._tokens if self.tokens_per_minute else None,
+                "blocked_for": max(self._blocked_until - time.monotonic(), 0.0),
+                "queue_depth": self.waiting,
+                "acquired": self.acquired,
+                "average_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait": self.max_wait,
+            }
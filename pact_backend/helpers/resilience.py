@@ -0,0 +1,207 @@
+import asyncio
+import concurrent.futures
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from .executor import get_executor
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+
+class BreakerPermit:
+    """
+    A call let through by a circuit breaker, `trial` when it is the single
+    call let through while the breaker is half-open.
+    """
+
+    __slots__ = ("trial",)
+
+    def __init__(self, trial: bool = False):
+        self.trial = trial
+
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream is unhealthy.
+
+    The breaker opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds have passed it lets a single trial call through
+    (half-open): a success closes it again, a failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        """
+        Whether a call would currently be let through, without reserving the
+        half-open trial.
+        """
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial)
+
+    def allow(self) -> Optional[BreakerPermit]:
+        """
+        Returns the permit of a call let through, or None if the call is
+        rejected.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return BreakerPermit()
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return BreakerPermit(trial=True)
+            self.rejected += 1
+            return None
+
+    def release(self, permit: Optional[BreakerPermit]):
+        """
+        Gives the half-open trial back when the call holding it ends without
+        an outcome, for example when it was cancelled. Other calls have no
+        trial to give back.
+        """
+        if permit is None or not permit.trial:
+            return
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent calls to estimate percentiles.
+    """
+
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns the latency below which `percentile` percent of the recent calls
+        completed, or None until there are enough samples.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, math.ceil(percentile / 100 * len(samples)) - 1)
+        return samples[max(index, 0)]
+
+
+def get_hedge_executor(max_workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Returns the executor running hedged blocking calls, shared by the process.
+    """
+    return get_executor("hedge", max_workers)
+
+
+async def hedge(
+    primary: Callable[[], Awaitable[Any]],
+    backup: Callable[[], Awaitable[Any]],
+    delay: float,
+) -> Any:
+    """
+    Runs `primary`, and also `backup` if `primary` has not completed after
+    `delay` seconds. Returns the first successful result and cancels the other
+    call. Raises the last error if both fail.
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        tasks.append(asyncio.ensure_future(backup()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def hedge_sync(
+    executor: concurrent.futures.Executor,
+    primary: Callable[[], Any],
+    backup: Callable[[], Any],
+    delay: float,
+) -> Any:
+    """
+    Blocking counterpart of `hedge` for calls made from worker threads. Both
+    calls run on `executor`; a losing call that already started cannot be
+    interrupted and finishes in the background.
+    """
+    futures = [executor.submit(primary)]
+    try:
+        done, _ = concurrent.futures.wait(futures, timeout=delay)
+        if done:
+            return futures[0].result()
+        futures.append(executor.submit(backup))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for future in futures:
+            future.cancel()
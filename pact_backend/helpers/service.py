@@ -1,6 +1,13 @@
+from typing import Optional
+
+import httpx
+import requests
 from azure.storage.blob import BlobServiceClient, ContainerClient
 from azure.ai.formrecognizer import DocumentAnalysisClient
+from azure.ai.textanalytics import TextAnalyticsClient
+from azure.ai.textanalytics.aio import TextAnalyticsClient as AsyncTextAnalyticsClient
 from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AsyncHttpTransport, HttpTransport, RequestsTransport
 from langchain_openai import AzureChatOpenAI
 
 
@@ -12,9 +19,44 @@ def get_document_analysis_client(form_recognizer_endpoint: str, form_recognizer_
     return document_analysis_client
 
 
-def get_storage_client(connection_string: str, container_name: str) -> ContainerClient:
+def get_storage_client(connection_string: str, container_name: str, transport: Optional[HttpTransport] = None) -> ContainerClient:
+    kwargs = {"transport": transport} if transport is not None else {}
     blob_service_client = BlobServiceClient.from_connection_string(
-        connection_string)
+        connection_string, **kwargs)
     container_client: ContainerClient = blob_service_client.get_container_client(
         container_name)
     return container_client
+
+
+def get_http_limits(max_connections: int, max_keepalive_connections: int, keepalive_expiry: float) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def get_async_http_client(limits: httpx.Limits, timeout: float, transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(timeout, connect=5.0), transport=transport)
+
+
+def get_text_analytics_client(endpoint: str, api_key: str, max_connections: int, session: Optional[requests.Session] = None) -> TextAnalyticsClient:
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return TextAnalyticsClient(
+        endpoint=endpoint,
+        credential=AzureKeyCredential(api_key),
+        transport=RequestsTransport(session=session, session_owner=False),
+    )
+
+
+def get_async_text_analytics_client(endpoint: str, api_key: str, transport: Optional[AsyncHttpTransport] = None) -> AsyncTextAnalyticsClient:
+    kwargs = {"transport": transport} if transport is not None else {}
+    return AsyncTextAnalyticsClient(
+        endpoint=endpoint, credential=AzureKeyCredential(api_key), **kwargs
+    )
@@ -0,0 +1,15 @@
+import json
+
+
+def format_sse(event: str, data) -> str:
+    """
+    Formats a Server-Sent Event with a JSON encoded payload.
+
+    Args:
+        event (str): The event name, used by the client to route the payload.
+        data: Any JSON serializable payload.
+
+    Returns:
+        str: The encoded event, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,81 @@
+import datetime
+from typing import Dict, List, Tuple
+
+# Bucket sizes, from the finest to the coarsest
+granularities: Dict[str, datetime.timedelta] = {
+    "minute": datetime.timedelta(minutes=1),
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+}
+
+
+def to_utc(time: datetime.datetime) -> datetime.datetime:
+    """
+    Converts an aware datetime to the naive UTC datetimes stored in Mongo.
+    """
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
+
+
+def bucket_start(time: datetime.datetime, granularity: str) -> datetime.datetime:
+    time = to_utc(time)
+    if granularity == "minute":
+        return time.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return time.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return time.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def bucket_ceil(time: datetime.datetime, granularity: str) -> datetime.datetime:
+    start = bucket_start(time, granularity)
+    return start if start == to_utc(time) else start + granularities[granularity]
+
+
+def bucket_starts(start: datetime.datetime, end: datetime.datetime, granularity: str) -> List[datetime.datetime]:
+    """
+    Returns the start of every `granularity` bucket overlapping [start, end).
+    """
+    step = granularities[granularity]
+    current, end = bucket_start(start, granularity), to_utc(end)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def cover(start: datetime.datetime, end: datetime.datetime) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+    """
+    Splits [start, end), rounded to minutes, into the fewest buckets: whole
+    days in the middle, then whole hours, then minutes at the edges.
+
+    Returns:
+        List[Tuple[str, datetime, datetime]]: The granularity and the range of
+        bucket starts [from, to) to read for every part of the range.
+    """
+    start, end = bucket_start(start, "minute"), bucket_start(end, "minute")
+    if start >= end:
+        return []
+    names = list(granularities)
+    parts = []
+
+    def split(low: datetime.datetime, high: datetime.datetime, level: int):
+        if low >= high:
+            return
+        granularity = names[level]
+        if level == 0:
+            parts.append((granularity, low, high))
+            return
+        inner_low, inner_high = bucket_ceil(low, granularity), bucket_start(high, granularity)
+        if inner_low >= inner_high:
+            split(low, high, level - 1)
+            return
+        split(low, inner_low, level - 1)
+        parts.append((granularity, inner_low, inner_high))
+        split(inner_high, high, level - 1)
+
+    split(start, end, len(names) - 1)
+    return parts
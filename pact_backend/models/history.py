@@ -4,4 +4,5 @@ from datetime import datetime
 class HistoryModel(BaseModel):
     user_id: str
     title: str
+    title_pending: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
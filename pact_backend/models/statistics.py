@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict
+from typing import Dict, Iterable, Optional
 
 from .chat import MetricsModel
 
@@ -29,4 +29,33 @@ class StatisticsModel(BaseModel):
 class RequestModel(BaseModel):
     metrics: MetricsModel
     opt_metrics: MetricsModel
-    flagged: bool
\ No newline at end of file
+    flagged: bool
+
+def statistics_increments(metrics: MetricsModel) -> Dict[str, int]:
+    """
+    Returns the $inc operand counting one set of metrics, i.e. the count and
+    the `<metric>.<score>` bucket of every metric.
+    """
+    increments = {"count": 1}
+    for key, value in metrics.dict().items():
+        increments[f"{key}.{value}"] = 1
+    return increments
+
+
+def statistics_document(
+    metrics_type: str, document: Optional[dict] = None, exclude: Iterable[str] = ("_id",)
+) -> dict:
+    """
+    Merges a stored statistics document into the defaults of StatisticsModel,
+    since buckets that were never incremented are missing from it. The
+    `exclude` fields of the stored document are left out.
+    """
+    statistics = StatisticsModel(metrics_type=metrics_type).dict()
+    for key, value in (document or {}).items():
+        if key in exclude:
+            continue
+        if isinstance(value, dict) and isinstance(statistics.get(key), dict):
+            statistics[key].update(value)
+        else:
+            statistics[key] = value
+    return statistics
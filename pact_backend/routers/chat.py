@@ -7,6 +7,7 @@ from bson import ObjectId
 from ..config import AppConfig, get_config
 from ..models.chat import ChatModel, RequestModel
 from ..helpers.serializer import serializer
+from ..services.chats import Chats
 
 router = APIRouter()
 config: AppConfig = get_config()
@@ -17,19 +18,11 @@ db = config.db
 async def get_chat(req: Request):
     try:
         user_id = req.state.user.get("user_id")
-        HistoryCollection = db['history']
-        history_cursor = HistoryCollection.find({"user_id":user_id},{"created_at": 0})
-        history = await history_cursor.to_list()
-        history = list(reversed(history))
-        chats = []
-
-        if history:
-            ChatCollection = db['chat']
-            for h in history:
-                chat_cursor = ChatCollection.find({"history_id":str(h["_id"])},{"created_at": 0})
-                chat = await chat_cursor.to_list()
-                chat = [serializer(c) for c in chat]
-                chats.append({"history":serializer(h),"chats":chat})
+        conversations = await Chats().conversations(user_id)
+        chats = [
+            {"history": serializer(history), "chats": [serializer(c) for c in chat]}
+            for history, chat in conversations
+        ]
         return JSONResponse(status_code=200,content={"status": "success","data": chats})
     except Exception as err:
         logging.error(err)
@@ -1,11 +1,13 @@
 import logging
+import re
 from ..config import AppConfig, get_config
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, BackgroundTasks, Request
 from fastapi.responses import JSONResponse
 from ..models.history import HistoryModel
 from bson import ObjectId
 from ..helpers.auth import decode_jwt
 from ..services.response import BotHandler
+from ..constants.prompts import title_prompt_template
 from ..helpers.serializer import serializer
 from pydantic import BaseModel
 
@@ -18,8 +20,36 @@ class AddRequest(BaseModel):
     user_msg: str
 
 
+def provisional_title(user_msg: str) -> str:
+    """
+    Derives a title from the first words of the message, used until the
+    generated title is available.
+    """
+    title = " ".join(re.findall(r"[\w']+", user_msg)[:3])
+    return title[:1].upper() + title[1:] if title else "New Chat"
+
+
+async def generate_title(history_id: str, user_msg: str, user_id: str):
+    title = None
+    try:
+        prompt = title_prompt_template.format(user_msg=user_msg)
+        bot = BotHandler()
+        response = await bot.aget_response(prompt, route="title", user_id=user_id)
+        if not response.get("error"):
+            title = response.get("response").replace("\n","").replace("\"","")
+    except Exception as err:
+        logging.error(err)
+    try:
+        update = {"title_pending": False}
+        if title:
+            update["title"] = title
+        await db['history'].update_one({"_id": ObjectId(history_id)}, {"$set": update})
+    except Exception as err:
+        logging.error(err)
+
+
 @router.post("/add")
-async def add_history(data: AddRequest, req: Request):
+async def add_history(data: AddRequest, req: Request, background_tasks: BackgroundTasks):
     try:
         user_msg = data.user_msg
         user_id = config.env.anonymous_user_id
@@ -27,16 +57,17 @@ async def add_history(data: AddRequest, req: Request):
         if req.state.user:
             user_id = req.state.user.get("user_id")
 
-        prompt = f"For the following message '{user_msg}' give me a proper title for the chat. The length of the title should not be more than 3 words"
-        bot = BotHandler()
-        title = bot.get_response(prompt).get("response").replace("\n","").replace("\"","")
+        title = provisional_title(user_msg)
 
-        data = HistoryModel(title=title, user_id=user_id)
+        data = HistoryModel(title=title, user_id=user_id, title_pending=True)
         collection = db['history']
         data = await collection.insert_one(data.dict())
         data_id = str(data.inserted_id)
 
-        return JSONResponse(status_code=200,content={"status": "success","message": "History added successfully", "data": data_id, "title": title})
+        # The generated title replaces the provisional one once it is available
+        background_tasks.add_task(generate_title, data_id, user_msg, user_id)
+
+        return JSONResponse(status_code=200,content={"status": "success","message": "History added successfully", "data": data_id, "title": title, "title_pending": True})
 
     except Exception as err:
         logging.error(err)
@@ -56,4 +87,22 @@ async def get_history(req: Request):
         return JSONResponse(status_code=200,content={"status": "success","data": history})
     except Exception as err:
         logging.error(err)
-        return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
\ No newline at end of file
+        return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
+
+
+@router.get("/{history_id}")
+async def get_history_by_id(history_id: str, req: Request):
+    try:
+        user_id = config.env.anonymous_user_id
+        if req.state.user:
+            user_id = req.state.user.get("user_id")
+        if not ObjectId.is_valid(history_id):
+            return JSONResponse(status_code=404,content={"status": "failed","message": "Conversation not found"})
+        collection = db['history']
+        history = await collection.find_one({"_id": ObjectId(history_id), "user_id": user_id},{"created_at":0})
+        if not history:
+            return JSONResponse(status_code=404,content={"status": "failed","message": "Conversation not found"})
+        return JSONResponse(status_code=200,content={"status": "success","data": serializer(history)})
+    except Exception as err:
+        logging.error(err)
+        return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
@@ -1,26 +1,41 @@
 import asyncio
+import datetime
+import json
 import os
 import math
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import logging
 from typing import List, Annotated, Optional
 
 import azure.cognitiveservices.speech as speechsdk
-from fastapi import APIRouter, Response, Request, Cookie, File, Form, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Response, Request, Cookie, File, Form, Query, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from ..config import AppConfig, get_config
+from ..constants.prompts import (
+    content_filter_message,
+    optimize_prompt_template,
+    voice_optimize_prompt_template,
+)
 from ..helpers.auth import (
     get_hashed_password,
     verify_password,
     sign_jwt,
     decode_jwt,
     verify_jwt,
+    get_user_id,
+    is_admin,
 )
+from ..helpers.sse import format_sse
 from ..models.auth import SignInRequest, SignUpRequest, Token
+from ..services.cache import ResponseCache
+from ..services.cassettes import Cassettes
+from ..services.evaluation_cache import EvaluationCache
+from ..services.jobs import MetricsJobQueue
 from ..services.metrics import Metrics
 from ..services.response import BotHandler
 from ..services.upload import FileUpload
+from ..services.usage import UsageLedger
 
 router = APIRouter()
 
@@ -30,6 +45,8 @@ upload_client: FileUpload = FileUpload()
 
 bot_handler = BotHandler()
 
+usage_group_fields = ["route", "user_id", "model", "deployment"]
+
 
 class Metric_Request(BaseModel):
     query: str
@@ -38,51 +55,137 @@ class Metric_Request(BaseModel):
     opt_answer: str
     flagged: bool
     metrics: dict | None
+    include: Optional[List[str]] = None
+    enqueue: bool = False
 
 
 class BotRequest(BaseModel):
     prompt: str
 
 
-@router.post("/prompt")
-async def get_bot_response(prompt: BotRequest):
-    try:
-        prompt = prompt.prompt
-        metrics = Metrics()
-        bot_response = bot_handler.get_response(prompt)
-        opt_prompt = bot_handler.get_response(
-            f'Please analyze the given prompt and optimize it by removing any grammatical errors, spelling mistakes, biases (such as gender, racial, or cultural biases), sensitive or personal information, inappropriate content (such as self-harm, violence, or explicit material), and any unclear or incomplete phrasing. Ensure the optimized prompt is structured for clarity, neutrality, and inclusivity, making it more effective in generating meaningful and constructive responses only prompt no explanation."{prompt}"'
+class BatchRequest(BaseModel):
+    prompts: List[str] = Field(min_length=1)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+
+
+async def process_prompt(prompt: str, user_id: str | None = None) -> dict:
+    """
+    Answers the prompt, optimizes it and answers the optimized prompt.
+
+    Args:
+        prompt (str): The user prompt.
+        user_id (str, optional): The user the calls are recorded for in the usage ledger.
+
+    Returns:
+        dict: The data returned by /llm/prompt.
+    """
+    bot_response, opt_prompt = await asyncio.gather(
+        bot_handler.aget_response(prompt, user_id=user_id),
+        bot_handler.aget_response(
+            optimize_prompt_template.format(prompt=prompt), route="optimize", user_id=user_id
+        ),
+    )
+    opt_bot_response = await bot_handler.aget_response(opt_prompt["response"], user_id=user_id)
+    if bot_response.get("content_filter"):
+        return {
+            "flagged": True,
+            "bot_response": {
+                "response": content_filter_message
+            },
+            "opt_bot_response": opt_bot_response,
+            "opt_prompt": opt_prompt,
+            "metrics": Metrics().get_openai_metrics(bot_response, prompt),
+        }
+
+    return {
+        "bot_response": bot_response,
+        "opt_bot_response": opt_bot_response,
+        "opt_prompt": opt_prompt,
+        "flagged": False,
+        "metrics": None,
+    }
+
+
+async def prompt_event_stream(prompt: str, user_id: str | None = None):
+    """
+    Streams the original answer, the optimized prompt and the optimized answer
+    as Server-Sent Events, one event name per channel. The content filter
+    outcome is sent as the terminal event.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_channel(channel: str, text: str, route: str = "prompt"):
+        async def on_token(token: str):
+            await queue.put(format_sse(channel, {"token": token}))
+
+        result = await bot_handler.astream_response(
+            text, on_token, route=route, user_id=user_id
         )
-        opt_bot_response = bot_handler.get_response(opt_prompt["response"])
-        if bot_response.get("content_filter"):
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "success",
-                    "data": {
-                        "flagged": True,
-                        "bot_response": {
-                            "response": "The provided prompt was filtered due to the prompt triggering the content management policy. Please modify your prompts"
-                        },
-                        "opt_bot_response": opt_bot_response,
-                        "opt_prompt": opt_prompt,
-                        "metrics": metrics.get_openai_metrics(bot_response, prompt),
+        if result.get("content_filter"):
+            await queue.put(format_sse(channel, {"done": True, "response": content_filter_message}))
+        else:
+            await queue.put(format_sse(channel, {"done": True, **result}))
+        return result
+
+    async def run_optimized():
+        opt_prompt = await run_channel(
+            "opt_prompt", optimize_prompt_template.format(prompt=prompt), "optimize"
+        )
+        await run_channel("opt_bot_response", opt_prompt["response"])
+
+    async def produce():
+        try:
+            bot_response, _ = await asyncio.gather(
+                run_channel("bot_response", prompt), run_optimized()
+            )
+            flagged = bool(bot_response.get("content_filter"))
+            await queue.put(
+                format_sse(
+                    "content_filter",
+                    {
+                        "flagged": flagged,
+                        "metrics": Metrics().get_openai_metrics(bot_response, prompt)
+                        if flagged
+                        else None,
                     },
-                },
+                )
             )
+        except Exception as e:
+            logging.error(e)
+            await queue.put(format_sse("error", {"message": "An internal error occured"}))
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        producer.cancel()
+
+
+def stream_prompt(prompt: str, user_id: str | None = None) -> StreamingResponse:
+    return StreamingResponse(
+        prompt_event_stream(prompt, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/prompt/stream")
+async def get_bot_response_stream(prompt: BotRequest, token: str = Cookie(None)):
+    return stream_prompt(prompt.prompt, get_user_id(token))
+
 
+@router.post("/prompt")
+async def get_bot_response(prompt: BotRequest, req: Request, token: str = Cookie(None)):
+    user_id = get_user_id(token)
+    if "text/event-stream" in req.headers.get("accept", ""):
+        return stream_prompt(prompt.prompt, user_id)
+    try:
         return JSONResponse(
             status_code=200,
-            content={
-                "status": "success",
-                "data": {
-                    "bot_response": bot_response,
-                    "opt_bot_response": opt_bot_response,
-                    "opt_prompt": opt_prompt,
-                    "flagged": False,
-                    "metrics": None,
-                },
-            },
+            content={"status": "success", "data": await process_prompt(prompt.prompt, user_id)},
         )
 
     except Exception as e:
@@ -93,151 +196,128 @@ async def get_bot_response(prompt: BotRequest):
         )
 
 
-@router.post("/metrics")
-async def get_metrics(payload: Metric_Request):
+async def run_batch(prompts: List[str], concurrency: int, user_id: str | None = None):
+    """
+    Yields the result of every prompt as soon as it finishes, at most
+    `concurrency` prompts being processed at a time. A failing prompt only
+    fails its own item.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(index: int, prompt: str):
+        async with semaphore:
+            try:
+                return {"index": index, "status": "success", "data": await process_prompt(prompt, user_id)}
+            except Exception as e:
+                logging.error(e)
+                return {"index": index, "status": "failed", "message": "An internal error occured"}
+
+    tasks = [asyncio.create_task(run_item(index, prompt)) for index, prompt in enumerate(prompts)]
     try:
-        metrics = Metrics()
-        response = None
-        opt_response = None
-
-        if payload.flagged:
-            response = metrics.get_openai_metrics(payload.metrics, payload.query)
-            opt_response = metrics.evaluate_all(payload.opt_query, payload.opt_answer)
-            opt_evaluation = {}
-            opt_evaluation["grammar"] = int(opt_response["grammar"])
-            opt_evaluation["spell_check"] = int(opt_response["spell_check"])
-            maxi = 0
-            if (
-                "sensitive_info" in opt_response
-                and isinstance(opt_response["sensitive_info"], list)
-                and opt_response["sensitive_info"]
-            ):
-                entities = opt_response["sensitive_info"][0].entities
-                for ele in entities:
-                    maxi = max(maxi, ele.get("confidence_score", 0))
-
-                maxi = int(math.floor(maxi * 5))
-            else:
-                maxi = 0
-            opt_evaluation["sensitive_info"] = maxi
-            opt_evaluation["violence"] = int(
-                opt_response["violence"]["violence_score"] * 5 / 7
-            )
-            opt_evaluation["bias_gender"] = int(
-                opt_response["bias_gender"]["sexual_score"] * 5 / 7
-            )
-            opt_evaluation["self_harm"] = int(
-                opt_response["bias_self_harm"]["self_harm_score"] * 5 / 7
-            )
-            opt_evaluation["hate_unfairness"] = int(
-                opt_response["hate_unfairness"]["hate_unfairness_score"] * 5 / 7
-            )
-            flag = "not computed"
-            for key in opt_response["jailbreak"]:
-                if opt_response["jailbreak"][key] == True:
-                    flag = True
-                    break
-                else:
-                    flag = False
-            opt_evaluation["jailbreak"] = flag
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
 
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "success",
-                    "data": {"metrics": response, "opt_metrics": opt_evaluation},
-                },
-            )
 
-        else:
-            response = metrics.evaluate_all(payload.query, payload.answer)
-            opt_response = metrics.evaluate_all(payload.opt_query, payload.opt_answer)
-
-        evaluation = {}
-        opt_evaluation = {}
-
-        evaluation["grammar"] = int(response["grammar"])
-        opt_evaluation["grammar"] = int(opt_response["grammar"])
-
-        evaluation["spell_check"] = int(response["spell_check"])
-        opt_evaluation["spell_check"] = int(opt_response["spell_check"])
-
-        maxi = 0
-        if (
-            "sensitive_info" in response
-            and isinstance(response["sensitive_info"], list)
-            and response["sensitive_info"]
-        ):
-            entities = response["sensitive_info"][0].entities
-            for ele in entities:
-                maxi = max(maxi, ele.get("confidence_score", 0))
-            maxi = int(math.ceil((maxi * 5)))
-        else:
-            maxi = 0
-        evaluation["sensitive_info"] = maxi
-
-        maxi = 0
-        if (
-            "sensitive_info" in opt_response
-            and isinstance(opt_response["sensitive_info"], list)
-            and opt_response["sensitive_info"]
-        ):
-            entities = opt_response["sensitive_info"][0].entities
-            for ele in entities:
-                maxi = max(maxi, ele.get("confidence_score", 0))
-
-            maxi = int(math.floor(maxi * 5))
-        else:
-            maxi = 0
-        opt_evaluation["sensitive_info"] = maxi
+async def ndjson_stream(results):
+    async for result in results:
+        yield json.dumps(result) + "\n"
 
-        evaluation["violence"] = int(response["violence"]["violence_score"] * 5 / 7)
-        opt_evaluation["violence"] = int(
-            opt_response["violence"]["violence_score"] * 5 / 7
-        )
 
-        evaluation["bias_gender"] = int(response["bias_gender"]["sexual_score"] * 5 / 7)
-        opt_evaluation["bias_gender"] = int(
-            opt_response["bias_gender"]["sexual_score"] * 5 / 7
+@router.post("/prompt/batch")
+async def get_bot_response_batch(
+    payload: BatchRequest, req: Request, token: str = Cookie(None)
+):
+    if len(payload.prompts) > config.env.llm_batch_max_items:
+        return JSONResponse(
+            status_code=413,
+            content={
+                "status": "failed",
+                "message": f"A batch can have at most {config.env.llm_batch_max_items} prompts",
+            },
         )
+    concurrency = min(
+        payload.concurrency or config.env.llm_batch_concurrency,
+        config.env.llm_batch_max_concurrency,
+    )
+    results = run_batch(payload.prompts, concurrency, get_user_id(token))
 
-        evaluation["self_harm"] = int(
-            response["bias_self_harm"]["self_harm_score"] * 5 / 7
-        )
-        opt_evaluation["self_harm"] = int(
-            opt_response["bias_self_harm"]["self_harm_score"] * 5 / 7
-        )
+    if "application/x-ndjson" in req.headers.get("accept", ""):
+        return StreamingResponse(ndjson_stream(results), media_type="application/x-ndjson")
 
-        evaluation["hate_unfairness"] = int(
-            response["hate_unfairness"]["hate_unfairness_score"] * 5 / 7
-        )
-        opt_evaluation["hate_unfairness"] = int(
-            opt_response["hate_unfairness"]["hate_unfairness_score"] * 5 / 7
+    try:
+        data = sorted([result async for result in results], key=lambda result: result["index"])
+        return JSONResponse(status_code=200, content={"status": "success", "data": data})
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "message": "An internal error occured"},
         )
 
-        flag = "not computed"
-        for key in response["jailbreak"]:
-            if response["jailbreak"][key] == True:
-                flag = True
-                break
-            else:
-                flag = False
-        evaluation["jailbreak"] = flag
-
-        flag = "not computed"
-        for key in opt_response["jailbreak"]:
-            if opt_response["jailbreak"][key] == True:
-                flag = True
-                break
-            else:
-                flag = False
-        opt_evaluation["jailbreak"] = flag
 
+async def process_prompt_with_metrics(prompt: str, user_id: str | None = None) -> dict:
+    """
+    Runs /llm/prompt and /llm/metrics as one dependency graph.
+
+    The original answer is evaluated as soon as it arrives while the optimized
+    branch (optimize the prompt, answer it, evaluate it) proceeds in parallel,
+    so the wall-clock time is that of the longest branch. A filtered prompt is
+    scored from the content filter results without calling the evaluators.
+    A branch whose model call failed has no metrics, its error message is
+    not evaluated.
+    """
+    metrics = Metrics()
+
+    async def original_branch():
+        bot_response = await bot_handler.aget_response(prompt, user_id=user_id)
+        if bot_response.get("content_filter"):
+            return bot_response, metrics.get_openai_metrics(bot_response, prompt)
+        if bot_response.get("error"):
+            return bot_response, None
+        results = await metrics.evaluate_all(prompt, bot_response["response"], user_id)
+        return bot_response, metrics.normalize(results, math.ceil)
+
+    async def optimized_branch():
+        opt_prompt = await bot_handler.aget_response(
+            optimize_prompt_template.format(prompt=prompt), route="optimize", user_id=user_id
+        )
+        if opt_prompt.get("error"):
+            return opt_prompt, opt_prompt, None
+        opt_bot_response = await bot_handler.aget_response(
+            opt_prompt["response"], user_id=user_id
+        )
+        if opt_bot_response.get("error"):
+            return opt_prompt, opt_bot_response, None
+        results = await metrics.evaluate_all(
+            opt_prompt["response"], opt_bot_response["response"], user_id
+        )
+        return opt_prompt, opt_bot_response, metrics.normalize(results)
+
+    (bot_response, evaluation), (opt_prompt, opt_bot_response, opt_evaluation) = (
+        await asyncio.gather(original_branch(), optimized_branch())
+    )
+    flagged = bool(bot_response.get("content_filter"))
+    return {
+        "flagged": flagged,
+        "bot_response": {"response": content_filter_message} if flagged else bot_response,
+        "opt_bot_response": opt_bot_response,
+        "opt_prompt": opt_prompt,
+        "metrics": evaluation,
+        "opt_metrics": opt_evaluation,
+    }
+
+
+@router.post("/prompt/evaluate")
+async def get_bot_response_with_metrics(prompt: BotRequest, token: str = Cookie(None)):
+    try:
         return JSONResponse(
             status_code=200,
             content={
                 "status": "success",
-                "data": {"metrics": evaluation, "opt_metrics": opt_evaluation},
+                "data": await process_prompt_with_metrics(prompt.prompt, get_user_id(token)),
             },
         )
     except Exception as e:
@@ -248,6 +328,183 @@ async def get_metrics(payload: Metric_Request):
         )
 
 
+async def metrics_event_stream(
+    payload: Metric_Request, names: List[str], user_id: str | None = None
+):
+    """
+    Streams the score of every metric of the original and optimized pairs as
+    Server-Sent Events as soon as its evaluator finishes, on the "metrics" and
+    "opt_metrics" channels. The complete scores are sent as the terminal event.
+    """
+    metrics = Metrics()
+    queue: asyncio.Queue = asyncio.Queue()
+    data = {"metrics": {}, "opt_metrics": {}}
+
+    async def run_channel(channel: str, query: str, answer: str, rounding):
+        async for name, value in metrics.evaluate_iter(query, answer, user_id, names):
+            score = metrics.normalize_metric(name, value, rounding)
+            data[channel][name] = score
+            await queue.put(format_sse(channel, {"name": name, "score": score}))
+
+    async def run_original():
+        if not payload.flagged:
+            return await run_channel("metrics", payload.query, payload.answer, math.ceil)
+        data["metrics"] = metrics.flagged_metrics(payload.metrics, payload.query, names)
+        for name, score in data["metrics"].items():
+            await queue.put(format_sse("metrics", {"name": name, "score": score}))
+
+    async def produce():
+        try:
+            await asyncio.gather(
+                run_original(),
+                run_channel("opt_metrics", payload.opt_query, payload.opt_answer, math.floor),
+            )
+            await queue.put(format_sse("done", data))
+        except Exception as e:
+            logging.error(e)
+            await queue.put(format_sse("error", {"message": "An internal error occured"}))
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        producer.cancel()
+
+
+def stream_metrics(
+    payload: Metric_Request, names: List[str], user_id: str | None = None
+) -> StreamingResponse:
+    return StreamingResponse(
+        metrics_event_stream(payload, names, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def invalid_metrics_response(e: ValueError) -> JSONResponse:
+    return JSONResponse(status_code=422, content={"status": "failed", "message": str(e)})
+
+
+async def enqueue_metrics(
+    payload: Metric_Request, names: List[str], user_id: str | None = None
+) -> JSONResponse:
+    try:
+        job_id = await MetricsJobQueue().enqueue(
+            {**payload.model_dump(exclude={"enqueue"}), "include": names}, user_id
+        )
+        return JSONResponse(
+            status_code=202,
+            content={"status": "success", "data": {"job_id": job_id, "status": "queued"}},
+        )
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "message": "An internal error occured"},
+        )
+
+
+async def job_event_stream(job_id: str, user_id: str | None = None):
+    """
+    Streams the status of a metrics job as Server-Sent Events until it is
+    finished. The terminal event is "done" with the scores, or "error".
+    """
+    queue = MetricsJobQueue()
+    status = None
+    while True:
+        try:
+            job = await queue.get(job_id, user_id)
+        except Exception as e:
+            logging.error(e)
+            yield format_sse("error", {"message": "An internal error occured"})
+            return
+        if job is None:
+            yield format_sse("error", {"message": "Job not found"})
+            return
+        if job["status"] != status:
+            status = job["status"]
+            yield format_sse("status", {"status": status, "attempts": job["attempts"]})
+        if status == "done":
+            yield format_sse("done", job["result"])
+            return
+        if status == "failed":
+            yield format_sse("error", {"message": "The evaluation failed"})
+            return
+        await asyncio.sleep(config.env.metrics_job_poll_interval)
+
+
+@router.get("/metrics/jobs/{job_id}/stream")
+async def get_metrics_job_stream(job_id: str, token: str = Cookie(None)):
+    return StreamingResponse(
+        job_event_stream(job_id, get_user_id(token)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/metrics/jobs/{job_id}")
+async def get_metrics_job(job_id: str, req: Request, token: str = Cookie(None)):
+    user_id = get_user_id(token)
+    if "text/event-stream" in req.headers.get("accept", ""):
+        return await get_metrics_job_stream(job_id, token)
+    try:
+        job = await MetricsJobQueue().get(job_id, user_id)
+        if job is None:
+            return JSONResponse(
+                status_code=404,
+                content={"status": "failed", "message": "Job not found"},
+            )
+        return JSONResponse(status_code=200, content={"status": "success", "data": job})
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "message": "An internal error occured"},
+        )
+
+
+@router.post("/metrics/stream")
+async def get_metrics_stream(payload: Metric_Request, token: str = Cookie(None)):
+    try:
+        names = Metrics().metric_names(payload.include)
+    except ValueError as e:
+        return invalid_metrics_response(e)
+    return stream_metrics(payload, names, get_user_id(token))
+
+
+@router.post("/metrics")
+async def get_metrics(payload: Metric_Request, req: Request, token: str = Cookie(None)):
+    try:
+        names = Metrics().metric_names(payload.include)
+    except ValueError as e:
+        return invalid_metrics_response(e)
+    user_id = get_user_id(token)
+    if payload.enqueue:
+        return await enqueue_metrics(payload, names, user_id)
+    if "text/event-stream" in req.headers.get("accept", ""):
+        return stream_metrics(payload, names, user_id)
+    try:
+        data = await Metrics().evaluate_pair(
+            payload.query,
+            payload.answer,
+            payload.opt_query,
+            payload.opt_answer,
+            user_id,
+            names,
+            payload.metrics if payload.flagged else None,
+        )
+        return JSONResponse(status_code=200, content={"status": "success", "data": data})
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "message": "An internal error occured"},
+        )
+
+
 @router.post("/voice")
 async def get_voice_response(
     audio: Annotated[UploadFile, File()],
@@ -309,13 +566,18 @@ async def get_voice_response(
                     "message": "There was an error while processing the prompt",
                 },
             )
-        bot_response = bot_handler.get_response(prompt)
-
-        opt_prompt = bot_handler.get_response(
-            f'Please analyze the given prompt and optimize it by removing any grammatical errors, spelling mistakes, biases (such as gender, racial, or cultural biases), sensitive or personal information, inappropriate content (such as self-harm, violence, or explicit material), and any unclear or incomplete phrasing. Ensure the optimized prompt is structured for clarity, neutrality, and inclusivity, incorporating responsible AI principles making it more effective in generating meaningful and constructive responses only prompt no explanation.\n"{prompt}"'
+        bot_response, opt_prompt = await asyncio.gather(
+            bot_handler.aget_response(prompt, user_id=user_id),
+            bot_handler.aget_response(
+                voice_optimize_prompt_template.format(prompt=prompt),
+                route="optimize",
+                user_id=user_id,
+            ),
         )
 
-        opt_bot_response = bot_handler.get_response(opt_prompt["response"])
+        opt_bot_response = await bot_handler.aget_response(
+            opt_prompt["response"], user_id=user_id
+        )
 
         if bot_response.get("content_filter"):
             return JSONResponse(
@@ -326,7 +588,7 @@ async def get_voice_response(
                         "flagged": True,
                         "prompt": transcripted_text,
                         "bot_response": {
-                            "response": "The provided prompt was filtered due to the prompt triggering the content management policy. Please modify your prompts"
+                            "response": content_filter_message
                         },
                         "opt_bot_response": opt_bot_response,
                         "opt_prompt": opt_prompt,
@@ -354,3 +616,133 @@ async def get_voice_response(
             status_code=500,
             content={"status": "failed", "message": "An internal error occured"},
         )
+
+
+def unauthorized_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=401,
+        content={"status": "failed", "message": "Invalid credentials"},
+    )
+
+
+def forbidden_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=403,
+        content={"status": "failed", "message": "Forbidden"},
+    )
+
+
+def admin_error(token: str | None) -> JSONResponse | None:
+    """
+    Returns the error response of a caller who is not an admin, or None.
+    """
+    payload = decode_jwt(token) if token else None
+    if payload is None:
+        return unauthorized_response()
+    if not is_admin(payload):
+        return forbidden_response()
+    return None
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(token: str = Cookie(None)):
+    if (error := admin_error(token)) is not None:
+        return error
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "success",
+            "data": {
+                **ResponseCache().stats(),
+                "coalesced": bot_handler.inflight.coalesced,
+                "in_flight": len(bot_handler.inflight),
+                "evaluations": EvaluationCache().stats(),
+            },
+        },
+    )
+
+
+@router.get("/limiter/stats")
+async def get_limiter_stats(token: str = Cookie(None)):
+    if (error := admin_error(token)) is not None:
+        return error
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "success",
+            "data": {
+                deployment.name: deployment.limiter.stats()
+                for deployment in bot_handler.pool.deployments
+            },
+        },
+    )
+
+
+@router.get("/deployments")
+async def get_deployments(token: str = Cookie(None)):
+    if (error := admin_error(token)) is not None:
+        return error
+    return JSONResponse(
+        status_code=200,
+        content={"status": "success", "data": bot_handler.pool.stats()},
+    )
+
+
+@router.get("/usage")
+async def get_usage(
+    group_by: str = "route",
+    start: Optional[datetime.datetime] = Query(None, alias="from"),
+    end: Optional[datetime.datetime] = Query(None, alias="to"),
+    user_id: Optional[str] = None,
+    route: Optional[str] = None,
+    token: str = Cookie(None),
+):
+    """
+    Aggregates the usage ledger. Admins can read the usage of every user,
+    other users only their own.
+    """
+    payload = decode_jwt(token) if token else None
+    if payload is None:
+        return unauthorized_response()
+    if not is_admin(payload):
+        if user_id is not None and user_id != payload.get("user_id"):
+            return forbidden_response()
+        user_id = payload.get("user_id")
+    fields = [field for field in group_by.split(",") if field]
+    if not fields or any(field not in usage_group_fields for field in fields):
+        return JSONResponse(
+            status_code=422,
+            content={
+                "status": "failed",
+                "message": f"group_by must be a comma separated list of {', '.join(usage_group_fields)}",
+            },
+        )
+    try:
+        data = await UsageLedger().aggregate(fields, start, end, user_id, route)
+        return JSONResponse(status_code=200, content={"status": "success", "data": data})
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "failed", "message": "An internal error occured"},
+        )
+
+
+@router.get("/upstreams")
+async def get_upstreams(token: str = Cookie(None)):
+    if (error := admin_error(token)) is not None:
+        return error
+    metrics = Metrics()
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status": "success",
+            "data": {
+                "deployments": bot_handler.pool.stats(),
+                "llm_hedged": bot_handler.hedged,
+                "evaluators": [breaker.stats() for breaker in metrics.breakers.values()],
+                "registry": metrics.registry.stats(),
+                "cassettes": Cassettes().stats(),
+            },
+        },
+    )
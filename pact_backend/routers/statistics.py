@@ -1,60 +1,56 @@
+import datetime
 import logging
-from fastapi import APIRouter, Request
+from typing import Optional
+from fastapi import APIRouter, Header, Query, Request, Response
 from fastapi.responses import JSONResponse
 
 from ..config import AppConfig, get_config
 
-from ..models.statistics import StatisticsModel, RequestModel
+from ..helpers.timebuckets import granularities
+from ..models.statistics import RequestModel
+from ..services.statistics import Statistics, StatisticsRangeError
 
 router = APIRouter()
 config: AppConfig = get_config()
-db = config.db
+statistics = Statistics()
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
 
 @router.post("/add")
 async def update_statistics(body: RequestModel):
     try:
-        collection = db["statistics"]
-        prompt_metrics = await collection.find_one({"metrics_type":"prompt_metrics"})
-        opt_prompt_metrics = await collection.find_one({"metrics_type":"opt_prompt_metrics"})
-        if prompt_metrics is None:
-            prompt_metrics = StatisticsModel(metrics_type="prompt_metrics")
-            prompt_metrics = prompt_metrics.dict()
-        else:
-            del prompt_metrics["_id"]
-        if opt_prompt_metrics is None:
-            opt_prompt_metrics = StatisticsModel(metrics_type="opt_prompt_metrics")
-            opt_prompt_metrics = opt_prompt_metrics.dict()
-        else:
-            del opt_prompt_metrics["_id"]
-        prompt_metrics["count"] += 1
-        opt_prompt_metrics["count"] += 1
-        for key in body.metrics.dict().keys():
-            prompt_metrics[key][str(body.metrics.dict()[key])] += 1
-            opt_prompt_metrics[key][str(body.opt_metrics.dict()[key])] += 1
-        await collection.replace_one({"metrics_type":"prompt_metrics"},prompt_metrics,upsert=True)
-        await collection.replace_one({"metrics_type":"opt_prompt_metrics"},opt_prompt_metrics,upsert=True)
+        await statistics.add(body.metrics, body.opt_metrics)
         return JSONResponse(status_code=200,content={"status": "success","message": "Statistics updated successfully"})
     except Exception as err:
         logging.error(err)
         return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
 
 @router.get("/get")
-async def get_statistics():
+async def get_statistics(
+    start: Optional[datetime.datetime] = Query(None, alias="from"),
+    end: Optional[datetime.datetime] = Query(None, alias="to"),
+    granularity: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    if granularity is not None and granularity not in granularities:
+        return JSONResponse(status_code=422,content={"status": "failed","message": f"granularity must be one of {', '.join(granularities)}"})
+    if start is None and (end is not None or granularity is not None):
+        return JSONResponse(status_code=422,content={"status": "failed","message": "from is required with to or granularity"})
     try:
-        collection = db["statistics"]
-        prompt_metrics = await collection.find_one({"metrics_type":"prompt_metrics"})
-        opt_prompt_metrics = await collection.find_one({"metrics_type":"opt_prompt_metrics"})
-        if prompt_metrics is None:
-            prompt_metrics = StatisticsModel(metrics_type="prompt_metrics")
-            prompt_metrics = prompt_metrics.dict()
-        else:
-            del prompt_metrics["_id"]
-        if opt_prompt_metrics is None:
-            opt_prompt_metrics = StatisticsModel(metrics_type="opt_prompt_metrics")
-            opt_prompt_metrics = opt_prompt_metrics.dict()
-        else:
-            del opt_prompt_metrics["_id"]
-        return JSONResponse(status_code=200,content={"status": "success","data":{"prompt_metrics": prompt_metrics,"opt_prompt_metrics": opt_prompt_metrics}})
+        etag, data = await statistics.serialized(start, end, granularity)
+        # The dashboard revalidates on every poll, unchanged statistics cost no body
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(etag, if_none_match):
+            return Response(status_code=304,headers=headers)
+        return Response(content=b'{"status":"success","data":' + data + b"}",media_type="application/json",headers=headers)
+    except StatisticsRangeError as err:
+        return JSONResponse(status_code=422,content={"status": "failed","message": str(err)})
     except Exception as err:
         logging.error(err)
-        return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
\ No newline at end of file
+        return JSONResponse(status_code=500,content={"status": "failed","message": "Internal server error"})
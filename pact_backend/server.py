@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
 
 from .config import AppConfig
@@ -10,12 +13,46 @@ from .middleware.auth import JWTMiddleware
 
 from .routers.api.v1 import router as v1_router
 
+from .helpers.executor import shutdown_executors
+from .services.cache import ResponseCache
+from .services.cassettes import Cassettes
+from .services.chats import Chats
+from .services.evaluation_cache import EvaluationCache
+from .services.evaluators import EvaluatorRegistry
+from .services.jobs import MetricsJobQueue
+from .services.lease import LeaseManager
+from .services.statistics import Statistics
+from .services.usage import UsageLedger
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ResponseCache().ensure_indexes()
+    await EvaluationCache().ensure_indexes()
+    await LeaseManager().ensure_indexes()
+    await UsageLedger().ensure_indexes()
+    await MetricsJobQueue().ensure_indexes()
+    await Statistics().ensure_indexes()
+    await Chats().ensure_indexes()
+    UsageLedger().start()
+    Statistics().start()
+    # Warmed in the background so a slow token endpoint does not delay startup
+    warmup = asyncio.create_task(asyncio.to_thread(EvaluatorRegistry().warm))
+    yield
+    await warmup
+    await UsageLedger().stop()
+    await Statistics().stop()
+    await EvaluatorRegistry().close()
+    shutdown_executors()
+    Cassettes().save()
+
+
+app = FastAPI(lifespan=lifespan)
 
 config: AppConfig = AppConfig()
 
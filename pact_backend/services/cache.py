@@ -0,0 +1,112 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+
+from ..config import AppConfig, get_config
+from ..helpers.lru import TTLCache
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class ResponseCache:
+    """
+    Two-tier cache for deterministic LLM responses.
+
+    The first tier is an in-process LRU, the second tier is a Mongo collection
+    with a TTL index shared by every worker and pod.
+    """
+
+    def __init__(self):
+        self.enabled = config.env.llm_cache_enabled
+        self.memory = TTLCache(config.env.llm_cache_max_entries, config.env.llm_cache_ttl)
+        self.collection = config.db["llm_cache"]
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "errors": 0}
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index(
+                "created_at", expireAfterSeconds=config.env.llm_cache_mongo_ttl
+            )
+        except Exception as e:
+            logging.error(f"Error while creating LLM cache indexes: {e}")
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return " ".join(prompt.split())
+
+    def key(self, model: str, deployment: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        payload = json.dumps(
+            [model, deployment, temperature, max_tokens, self.normalize(prompt)]
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def cacheable(result: dict) -> bool:
+        """
+        Successful responses and content filter results are cached, transient errors are not.
+        """
+        return not result.get("error") or bool(result.get("content_filter"))
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    async def aget(self, key: str, record: bool = True):
+        """
+        Looks the key up in the in-process tier, then in Mongo.
+
+        Args:
+            key (str): The cache key.
+            record (bool): Whether the lookup counts towards the hit/miss counters.
+        """
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            if record:
+                self._count("memory_hits")
+            return dict(value)
+        try:
+            document = await self.collection.find_one({"_id": key})
+        except Exception as e:
+            logging.error(f"Error while reading the LLM cache: {e}")
+            self._count("errors")
+            document = None
+        if document is None:
+            if record:
+                self._count("misses")
+            return None
+        if record:
+            self._count("mongo_hits")
+        self.memory.set(key, document["value"])
+        return dict(document["value"])
+
+    async def aset(self, key: str, value: dict):
+        if not (self.enabled and self.cacheable(value)):
+            return
+        self.memory.set(key, dict(value))
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"value": value, "created_at": datetime.datetime.utcnow()},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.error(f"Error while writing the LLM cache: {e}")
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["memory_hits"] + counters["mongo_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["mongo_hits"]
+        return {
+            **counters,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
@@ -0,0 +1,126 @@
+import os
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+import httpx
+import requests
+from azure.core.pipeline.transport import AsyncioRequestsTransport, RequestsTransport
+
+from ..config import AppConfig, get_config
+from ..helpers.cassette import (
+    AsyncCassetteTransport,
+    Cassette,
+    RecordedCall,
+    get_cassette_session,
+)
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+cassette_modes = ("off", "record", "replay")
+
+
+@singleton
+class Cassettes:
+    """
+    Records the upstream calls of Azure OpenAI, the content safety evaluators,
+    Text Analytics, blob storage and speech to text into one cassette file per
+    service under `cassette_dir`, or replays them offline with the recorded
+    latencies times `cassette_latency_scale`.
+
+    HTTP upstreams are intercepted at the transport of their clients, so the
+    SDKs run their real code paths. The evaluators and speech to text manage
+    their own connections, their calls are recorded as a whole instead.
+
+    Every method returns None, or the unwrapped function, when cassettes are off.
+    """
+
+    def __init__(self):
+        self.mode = config.env.cassette_mode
+        if self.mode not in cassette_modes:
+            raise ValueError(
+                f"Unknown cassette mode: {self.mode}, expected one of {', '.join(cassette_modes)}"
+            )
+        self.directory = config.env.cassette_dir
+        self.latency_scale = config.env.cassette_latency_scale
+        self.cassettes: dict[str, Cassette] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def cassette(self, name: str, match: Iterable[str] = ("method", "url", "body")) -> Cassette:
+        with self._lock:
+            if name not in self.cassettes:
+                self.cassettes[name] = Cassette(
+                    os.path.join(self.directory, f"{name}.json"),
+                    self.mode,
+                    self.latency_scale,
+                    match,
+                )
+            return self.cassettes[name]
+
+    def async_http_transport(self, name: str, limits: httpx.Limits) -> Optional[httpx.AsyncBaseTransport]:
+        if not self.enabled:
+            return None
+        return AsyncCassetteTransport(self.cassette(name), httpx.AsyncHTTPTransport(limits=limits))
+
+    def requests_session(
+        self, name: str, max_connections: int = 10, match: Iterable[str] = ("method", "url", "body")
+    ) -> Optional[requests.Session]:
+        if not self.enabled:
+            return None
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        return get_cassette_session(self.cassette(name, match), adapter)
+
+    def azure_transport(
+        self, name: str, max_connections: int = 10, match: Iterable[str] = ("method", "url", "body")
+    ) -> Optional[RequestsTransport]:
+        session = self.requests_session(name, max_connections, match)
+        if session is None:
+            return None
+        return RequestsTransport(session=session, session_owner=False)
+
+    def async_azure_transport(
+        self, name: str, max_connections: int = 10, match: Iterable[str] = ("method", "url", "body")
+    ) -> Optional[AsyncioRequestsTransport]:
+        """
+        The async Azure clients run on aiohttp by default, which cannot be
+        intercepted, they send their requests through a thread pool instead
+        while cassettes are on.
+        """
+        session = self.requests_session(name, max_connections, match)
+        if session is None:
+            return None
+        return AsyncioRequestsTransport(session=session, session_owner=False)
+
+    def call(
+        self,
+        name: str,
+        call: str,
+        fn: Optional[Callable[..., Any]],
+        key: Optional[Callable[..., Any]] = None,
+    ) -> Optional[Callable[..., Any]]:
+        """
+        Wraps a blocking call of the `name` upstream. `key` maps the arguments
+        of a call to the values identifying it, when they are not stable
+        between runs (e.g. temporary file names).
+        """
+        if not self.enabled:
+            return fn
+        return RecordedCall(self.cassette(name), call, fn, key)
+
+    def save(self):
+        for cassette in list(self.cassettes.values()):
+            cassette.save()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "cassettes": {name: cassette.stats() for name, cassette in self.cassettes.items()},
+        }
@@ -0,0 +1,44 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from ..config import AppConfig, get_config
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class Chats:
+    """
+    Reads the conversations of a user with their chats.
+    """
+
+    def __init__(self):
+        self.histories = config.db["history"]
+        self.chats = config.db["chat"]
+
+    async def ensure_indexes(self):
+        try:
+            await self.histories.create_index("user_id")
+            await self.chats.create_index("history_id")
+        except Exception as e:
+            logging.error(f"Error while creating chat indexes: {e}")
+
+    async def conversations(self, user_id: str) -> List[Tuple[dict, List[dict]]]:
+        """
+        Returns every history of the user, latest first, with its chats.
+        The chats of all the histories are fetched with a single query, so
+        the cost does not grow with the number of conversations.
+        """
+        histories = await self.histories.find({"user_id": user_id}, {"created_at": 0}).to_list(None)
+        if not histories:
+            return []
+        history_ids = [str(history["_id"]) for history in histories]
+        chats: Dict[str, List[dict]] = defaultdict(list)
+        async for chat in self.chats.find({"history_id": {"$in": history_ids}}, {"created_at": 0}):
+            chats[chat["history_id"]].append(chat)
+        return [
+            (history, chats.get(history_id, []))
+            for history, history_id in reversed(list(zip(histories, history_ids)))
+        ]
@@ -0,0 +1,182 @@
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+import httpx
+from langchain_openai import AzureChatOpenAI
+
+from ..config import AppConfig, get_config
+from ..config.environment import DeploymentConfig
+from ..helpers.ratelimit import RateLimiter
+from ..helpers.resilience import BreakerPermit, CircuitBreaker, CircuitOpenError
+
+config: AppConfig = get_config()
+
+
+class Deployment:
+    """
+    One Azure OpenAI deployment of the pool, with its own quota and the
+    latency and health observed from the calls sent to it.
+    """
+
+    # Weight of the latest call in the moving average of the latency
+    latency_smoothing = 0.2
+
+    def __init__(
+        self,
+        settings: DeploymentConfig,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        http_async_client: httpx.AsyncClient,
+    ):
+        self.name = settings.name or f"{settings.endpoint}/{settings.deployment}"
+        self.endpoint = settings.endpoint
+        self.deployment = settings.deployment
+        self.weight = settings.weight
+        self.llm = AzureChatOpenAI(
+            openai_api_key=settings.api_key,
+            azure_endpoint=settings.endpoint,
+            azure_deployment=settings.deployment,
+            model=model,
+            api_version=settings.api_version or config.env.azure_openai_api_version,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=config.env.llm_timeout,
+            # Retries go through the rate limiter and the pool, see BotHandler.ainvoke
+            max_retries=0,
+            # Streamed calls end with a usage chunk, for the ledger and the limiter
+            stream_usage=True,
+            http_async_client=http_async_client,
+        )
+        self.limiter = RateLimiter(settings.requests_per_minute, settings.tokens_per_minute)
+        self.breaker = CircuitBreaker(
+            self.name,
+            config.env.deployment_failure_threshold,
+            config.env.deployment_cooldown,
+        )
+
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.available()
+
+    def score(self, tokens: int, default_latency: float) -> float:
+        """
+        Expected time for a call of `tokens` tokens to complete on this
+        deployment: the observed latency scaled by the calls already in flight
+        and the weight, plus the wait imposed by the remaining quota.
+        """
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (self.in_flight + 1) / self.weight + self.limiter.expected_delay(tokens)
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record_success(self, latency: float):
+        self.breaker.record_success()
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.latency_smoothing * (latency - self.latency)
+
+    def record_failure(self):
+        """
+        Records a failed call. The circuit breaker takes the deployment out of
+        rotation after too many consecutive failures.
+        """
+        self.breaker.record_failure()
+        with self._lock:
+            self.errors += 1
+
+    def throttled(self, permit: Optional[BreakerPermit]):
+        """
+        Records a throttled call, which does not count against the health of
+        the deployment. A half-open trial ends without an outcome.
+        """
+        self.breaker.release(permit)
+        with self._lock:
+            self.throttles += 1
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "deployment": self.deployment,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "latency": self.latency,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttles": self.throttles,
+            "breaker": self.breaker.stats(),
+            "limiter": self.limiter.stats(),
+        }
+
+
+class DeploymentPool:
+    """
+    Routes every call to the deployment expected to answer first, failing
+    over to the other deployments on throttling and server errors.
+    """
+
+    def __init__(self, deployments: List[Deployment]):
+        self.deployments = deployments
+
+    @property
+    def name(self) -> str:
+        return ",".join(sorted(deployment.name for deployment in self.deployments))
+
+    def pick(self, tokens: int, exclude: List[Deployment] = ()) -> Deployment:
+        """
+        Picks the healthy deployment with the best score that has not been
+        tried yet for this call, falling back to already tried deployments
+        when there is no other choice.
+
+        Raises:
+            CircuitOpenError: The circuit breakers of all deployments are open.
+        """
+        latencies = [d.latency for d in self.deployments if d.latency is not None]
+        default_latency = min(latencies) if latencies else 1.0
+        healthy = [d for d in self.deployments if d.healthy]
+        candidates = [d for d in healthy if d not in exclude] or healthy
+        if not candidates:
+            raise CircuitOpenError("All Azure OpenAI deployments are unavailable")
+        return min(candidates, key=lambda d: d.score(tokens, default_latency))
+
+    def has_alternative(self, exclude: List[Deployment]) -> bool:
+        return any(d.healthy and d not in exclude for d in self.deployments)
+
+    def stats(self) -> List[dict]:
+        return [deployment.stats() for deployment in self.deployments]
+
+
+def get_deployment_settings() -> List[DeploymentConfig]:
+    if config.env.azure_openai_deployments:
+        return config.env.azure_openai_deployments
+    return [
+        DeploymentConfig(
+            endpoint=config.env.azure_openai_endpoint,
+            api_key=config.env.azure_openai_api_key,
+            deployment=config.env.azure_openai_deployment,
+            api_version=config.env.azure_openai_api_version,
+            name=config.env.azure_openai_deployment,
+            requests_per_minute=config.env.llm_requests_per_minute,
+            tokens_per_minute=config.env.llm_tokens_per_minute,
+        )
+    ]
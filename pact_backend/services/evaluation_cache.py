@@ -0,0 +1,123 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict
+
+from pymongo import ReplaceOne
+
+from ..config import AppConfig, get_config
+from ..helpers.lru import TTLCache
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class EvaluationCache:
+    """
+    Two-tier cache of the raw result of every metric of Metrics.evaluate_all.
+
+    Entries are keyed by the metric, its version and a hash of its inputs, so
+    bumping the version of one metric only invalidates the results of that
+    metric. The first tier is an in-process LRU, the second tier is a Mongo
+    collection with a TTL index shared by every worker and pod.
+    """
+
+    def __init__(self):
+        self.enabled = config.env.eval_cache_enabled
+        self.memory = TTLCache(config.env.eval_cache_max_entries, config.env.eval_cache_ttl)
+        self.collection = config.db["evaluation_cache"]
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "errors": 0}
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index(
+                "created_at", expireAfterSeconds=config.env.eval_cache_mongo_ttl
+            )
+        except Exception as e:
+            logging.error(f"Error while creating evaluation cache indexes: {e}")
+
+    @staticmethod
+    def key(metric: str, version: str, *inputs: str) -> str:
+        payload = json.dumps([metric, version, *inputs])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    async def get_many(self, keys: Dict[str, str]) -> Dict[str, object]:
+        """
+        Looks the keys up in the in-process tier, then the remaining ones in
+        Mongo with a single query.
+
+        Args:
+            keys (Dict[str, str]): The cache key of every metric.
+
+        Returns:
+            Dict[str, object]: The cached result of the metrics found.
+        """
+        if not self.enabled:
+            return {}
+        results = {}
+        missing = {}
+        for metric, key in keys.items():
+            value = self.memory.get(key)
+            if value is not None:
+                results[metric] = value
+            else:
+                missing[key] = metric
+        self._count("memory_hits", len(results))
+        if not missing:
+            return results
+        try:
+            documents = self.collection.find({"_id": {"$in": list(missing)}})
+            async for document in documents:
+                self.memory.set(document["_id"], document["value"])
+                results[missing[document["_id"]]] = document["value"]
+                self._count("mongo_hits")
+        except Exception as e:
+            logging.error(f"Error while reading the evaluation cache: {e}")
+            self._count("errors")
+        self._count("misses", len(keys) - len(results))
+        return results
+
+    async def set_many(self, entries: Dict[str, tuple]):
+        """
+        Stores results in both tiers.
+
+        Args:
+            entries (Dict[str, tuple]): The (metric, version, result) of every key.
+        """
+        if not (self.enabled and entries):
+            return
+        now = datetime.datetime.utcnow()
+        operations = []
+        for key, (metric, version, value) in entries.items():
+            self.memory.set(key, value)
+            operations.append(
+                ReplaceOne(
+                    {"_id": key},
+                    {"metric": metric, "version": version, "value": value, "created_at": now},
+                    upsert=True,
+                )
+            )
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logging.error(f"Error while writing the evaluation cache: {e}")
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["memory_hits"] + counters["mongo_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["mongo_hits"]
+        return {
+            **counters,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
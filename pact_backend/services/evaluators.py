@@ -0,0 +1,155 @@
+import logging
+import threading
+
+from azure.ai.evaluation import (
+    ViolenceEvaluator,
+    SexualEvaluator,
+    SelfHarmEvaluator,
+    HateUnfairnessEvaluator,
+    IndirectAttackEvaluator,
+)
+from azure.identity import DefaultAzureCredential
+
+from ..config import AppConfig, get_config
+from ..helpers.batcher import MicroBatcher
+from ..helpers.credentials import CachedTokenCredential
+from ..helpers.service import (
+    get_async_text_analytics_client,
+    get_text_analytics_client,
+)
+from ..helpers.singleton import singleton
+from .cassettes import Cassettes
+
+config: AppConfig = get_config()
+
+evaluator_classes = {
+    "violence": ViolenceEvaluator,
+    "sexual": SexualEvaluator,
+    "self_harm": SelfHarmEvaluator,
+    "hate_unfairness": HateUnfairnessEvaluator,
+    "jailbreak": IndirectAttackEvaluator,
+}
+
+
+@singleton
+class EvaluatorRegistry:
+    """
+    Builds the content safety evaluators and the Text Analytics clients once
+    per worker. They share a single credential whose access tokens are cached
+    and refreshed ahead of expiry, and the Text Analytics clients keep their
+    connections alive between calls.
+
+    Async entity and PII recognition go through micro-batchers, so documents
+    of concurrent requests are sent to Text Analytics in multi-document calls.
+    """
+
+    def __init__(self):
+        self.azure_ai_project = {
+            "subscription_id": config.env.azure_subscription_id,
+            "resource_group_name": config.env.azure_rg_name,
+            "project_name": config.env.azure_ai_project_name,
+        }
+        self.cassettes = Cassettes()
+        self.credential = CachedTokenCredential(
+            DefaultAzureCredential(), config.env.token_refresh_margin
+        )
+        self.evaluators = {}
+        self.text_analytics = None
+        self.async_text_analytics = get_async_text_analytics_client(
+            config.env.azure_language_endpoint,
+            config.env.azure_language_api_key,
+            self.cassettes.async_azure_transport(
+                "text_analytics", config.env.evaluator_max_connections
+            ),
+        )
+        self.entity_batcher = MicroBatcher(
+            self.recognize_entities_batch,
+            config.env.text_analytics_batch_size,
+            config.env.text_analytics_batch_wait,
+        )
+        self.pii_batcher = MicroBatcher(
+            self.recognize_pii_entities_batch,
+            config.env.text_analytics_batch_size,
+            config.env.text_analytics_batch_wait,
+        )
+        self._lock = threading.Lock()
+
+    def evaluator(self, name: str):
+        evaluator = self.evaluators.get(name)
+        if evaluator is None:
+            with self._lock:
+                evaluator = self.evaluators.get(name)
+                if evaluator is None:
+                    # Replayed evaluators never reach the service
+                    if not self.cassettes.replaying:
+                        evaluator = evaluator_classes[name](
+                            credential=self.credential,
+                            azure_ai_project=self.azure_ai_project,
+                        )
+                    evaluator = self.cassettes.call("evaluators", name, evaluator)
+                    self.evaluators[name] = evaluator
+        return evaluator
+
+    def text_analytics_client(self):
+        if self.text_analytics is None:
+            with self._lock:
+                if self.text_analytics is None:
+                    self.text_analytics = get_text_analytics_client(
+                        config.env.azure_language_endpoint,
+                        config.env.azure_language_api_key,
+                        config.env.evaluator_max_connections,
+                        self.cassettes.requests_session(
+                            "text_analytics", config.env.evaluator_max_connections
+                        ),
+                    )
+        return self.text_analytics
+
+    async def recognize_entities_batch(self, documents: list) -> list:
+        return list(await self.async_text_analytics.recognize_entities(documents))
+
+    async def recognize_entities(self, document: str):
+        """
+        Recognizes the entities of one document, batched with the documents of
+        concurrent calls.
+        """
+        return await self.entity_batcher.submit(document)
+
+    async def recognize_pii_entities_batch(self, documents: list) -> list:
+        return list(await self.async_text_analytics.recognize_pii_entities(documents))
+
+    async def recognize_pii_entities(self, document: str):
+        """
+        Recognizes the PII entities of one document, batched with the
+        documents of concurrent calls.
+        """
+        return await self.pii_batcher.submit(document)
+
+    def warm(self):
+        """
+        Builds every evaluator and client and fetches the access token used
+        by the content safety evaluators, so the first requests do not pay
+        for it. Failures are logged, the calls will retry lazily.
+        """
+        try:
+            for name in evaluator_classes:
+                self.evaluator(name)
+            self.text_analytics_client()
+            if not self.cassettes.replaying:
+                self.credential.get_token(config.env.evaluator_token_scope)
+        except Exception as e:
+            logging.error(f"Error while warming evaluators: {e}")
+
+    async def close(self):
+        if self.text_analytics is not None:
+            self.text_analytics.close()
+        await self.async_text_analytics.close()
+        self.credential.close()
+
+    def stats(self) -> dict:
+        return {
+            "evaluators": sorted(self.evaluators),
+            "text_analytics": self.text_analytics is not None,
+            "entity_batches": self.entity_batcher.stats(),
+            "pii_batches": self.pii_batcher.stats(),
+            "credential": self.credential.stats(),
+        }
@@ -0,0 +1,164 @@
+import datetime
+import logging
+import os
+import secrets
+import socket
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from ..config import AppConfig, get_config
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class MetricsJobQueue:
+    """
+    Mongo-backed queue of /llm/metrics evaluations run by the metrics worker.
+
+    A worker claims a job by taking a lease on it. The lease is renewed while
+    the job runs, and a job whose lease expired (its worker died) is claimed
+    again, up to `metrics_job_max_attempts` times. Finished jobs keep their
+    result for polling until the TTL index removes them.
+
+    Job ids are random and unguessable: a job of a signed in user can only be
+    read by that user, the id of an anonymous job is what grants access to it.
+    """
+
+    def __init__(self):
+        self.collection = config.db["metrics_jobs"]
+        self.lease_ttl = config.env.metrics_job_lease_ttl
+        self.max_attempts = config.env.metrics_job_max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index([("status", 1), ("created_at", 1)])
+            await self.collection.create_index(
+                "finished_at", expireAfterSeconds=config.env.metrics_job_ttl
+            )
+        except Exception as e:
+            logging.error(f"Error while creating metrics job indexes: {e}")
+
+    def lease_expiry(self) -> datetime.datetime:
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_ttl)
+
+    async def enqueue(self, payload: dict, user_id: Optional[str] = None) -> str:
+        now = datetime.datetime.utcnow()
+        result = await self.collection.insert_one(
+            {
+                "_id": secrets.token_urlsafe(24),
+                "status": "queued",
+                "payload": payload,
+                "user_id": user_id,
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        return result.inserted_id
+
+    async def claim(self) -> Optional[dict]:
+        """
+        Leases the oldest queued job, or a running job whose lease expired.
+        """
+        now = datetime.datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "owner": self.owner,
+                    "lease_expires_at": self.lease_expiry(),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def renew(self, job_id: str) -> bool:
+        """
+        Extends the lease of a running job, False if it was lost to another worker.
+        """
+        result = await self.collection.update_one(
+            {"_id": job_id, "status": "running", "owner": self.owner},
+            {"$set": {"lease_expires_at": self.lease_expiry()}},
+        )
+        return result.modified_count == 1
+
+    async def complete(self, job_id: str, result: dict):
+        now = datetime.datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": job_id, "owner": self.owner},
+            {
+                "$set": {
+                    "status": "done",
+                    "result": result,
+                    "updated_at": now,
+                    "finished_at": now,
+                },
+                "$unset": {"lease_expires_at": ""},
+            },
+        )
+
+    async def fail(self, job_id: str, attempts: int, error: str):
+        """
+        Requeues the job, or marks it failed once it ran out of attempts.
+        """
+        now = datetime.datetime.utcnow()
+        update = {"status": "queued", "error": error, "updated_at": now}
+        if attempts >= self.max_attempts:
+            update.update({"status": "failed", "finished_at": now})
+        await self.collection.update_one(
+            {"_id": job_id, "owner": self.owner},
+            {"$set": update, "$unset": {"lease_expires_at": ""}},
+        )
+
+    async def reap(self) -> int:
+        """
+        Marks failed the jobs whose last attempt was abandoned by its worker.
+        """
+        now = datetime.datetime.utcnow()
+        result = await self.collection.update_many(
+            {
+                "status": "running",
+                "lease_expires_at": {"$lt": now},
+                "attempts": {"$gte": self.max_attempts},
+            },
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "The job was abandoned by its worker",
+                    "updated_at": now,
+                    "finished_at": now,
+                },
+                "$unset": {"lease_expires_at": ""},
+            },
+        )
+        return result.modified_count
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Returns the public view of a job, None if it does not exist or belongs
+        to another user.
+        """
+        job = await self.collection.find_one({"_id": job_id})
+        if job is None or job.get("user_id") != user_id:
+            return None
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "result": job.get("result"),
+            "error": job.get("error") if job["status"] == "failed" else None,
+        }
@@ -0,0 +1,105 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+from ..config import AppConfig, get_config
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class LeaseManager:
+    """
+    Short-lived named leases stored in Mongo, used to let one worker across
+    all pods perform an upstream call while the others wait for its result.
+    """
+
+    def __init__(self):
+        self.enabled = config.env.lease_enabled
+        self.ttl = config.env.lease_ttl
+        self.poll_interval = config.env.lease_poll_interval
+        self.collection = config.db["leases"]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logging.error(f"Error while creating lease indexes: {e}")
+
+    async def acquire(self, name: str) -> bool:
+        """
+        Acquires the lease unless another owner holds an unexpired one.
+        Errors other than contention fail open so that callers still proceed.
+        """
+        if not self.enabled:
+            return True
+        now = datetime.datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": name, "expires_at": {"$lt": now}},
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "expires_at": now + datetime.timedelta(seconds=self.ttl),
+                    }
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+        except Exception as e:
+            logging.error(f"Error while acquiring lease {name}: {e}")
+            return True
+
+    async def release(self, name: str):
+        if not self.enabled:
+            return
+        try:
+            await self.collection.delete_one({"_id": name, "owner": self.owner})
+        except Exception as e:
+            logging.error(f"Error while releasing lease {name}: {e}")
+
+    async def held(self, name: str) -> bool:
+        """
+        Whether another owner still holds an unexpired lease. Errors count as
+        released so that waiters stop waiting and proceed.
+        """
+        try:
+            lease = await self.collection.find_one(
+                {"_id": name, "expires_at": {"$gte": datetime.datetime.utcnow()}}, {"_id": 1}
+            )
+        except Exception as e:
+            logging.error(f"Error while reading lease {name}: {e}")
+            return False
+        return lease is not None
+
+    async def wait_for(self, name: str, poll):
+        """
+        Polls until the lease holder has published a result, or until the lease
+        is released or expires.
+
+        Args:
+            name (str): The lease held by the worker computing the result.
+            poll (Callable[[], Awaitable]): Returns the published result, or None.
+
+        Returns:
+            The published result, or None if the lease ended before one appeared,
+            e.g. when the result of the holder could not be shared.
+        """
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            if (result := await poll()) is not None:
+                return result
+            if not await self.held(name):
+                # The result may have been published just before the release
+                return await poll()
+        return None
@@ -0,0 +1,199 @@
+import asyncio
+import datetime
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from ..config import AppConfig, get_config
+from ..helpers.singleton import singleton
+from ..helpers.timebuckets import bucket_start, granularities
+from .lease import LeaseManager
+from .statistics import Statistics, metrics_types
+
+config: AppConfig = get_config()
+
+duplicate_key_error = 11000
+
+
+async def bulk_write_once(collection, operations: list):
+    """
+    Runs guarded $inc upserts. A document already materialized up to the
+    batch does not match its guard, so its upsert collides with the unique
+    index: it was applied before and is skipped.
+    """
+    if not operations:
+        return
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = [
+            error for error in e.details.get("writeErrors", []) if error.get("code") != duplicate_key_error
+        ]
+        if errors or e.details.get("writeConcernErrors"):
+            raise
+
+
+def statistics_pipeline(metrics_type: str, start: datetime.datetime, end: datetime.datetime) -> List[dict]:
+    """
+    Counts the chats and the scores of every metric of `metrics_type` per
+    minute. Minutes are formatted as strings, $dateTrunc needs MongoDB 5.
+    """
+    return [
+        {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+        {
+            "$project": {
+                "_id": 0,
+                "minute": {"$dateToString": {"format": "%Y-%m-%dT%H:%M", "date": "$created_at"}},
+                # A "count" entry per chat, then one entry per metric
+                "entries": {
+                    "$concatArrays": [
+                        [{"k": "count", "v": None}],
+                        {"$objectToArray": {"$ifNull": [f"${metrics_type}", {}]}},
+                    ]
+                },
+            }
+        },
+        {"$unwind": "$entries"},
+        {
+            "$group": {
+                "_id": {"minute": "$minute", "metric": "$entries.k", "score": "$entries.v"},
+                "count": {"$sum": 1},
+            }
+        },
+    ]
+
+
+@singleton
+class StatisticsMaterializer:
+    """
+    Derives the statistics counters and buckets from the `prompt_metrics` and
+    `opt_prompt_metrics` of the chat collection, so they cannot drift from
+    the chats. Set `statistics_materialized` to stop /statistics/add from
+    writing them too.
+
+    Chats are processed in batches of whole minutes after a watermark kept
+    in `statistics_materialized`, up to `statistics_materialize_lag` seconds
+    ago so that chats still being inserted are not skipped. The end of a
+    batch is stored before it is applied, and every counter remembers the
+    batch it was last incremented by, so a batch interrupted by a crash is
+    resumed without counting anything twice. Without a watermark, e.g. on
+    the first run or after deleting it, the counters are rebuilt from scratch.
+    """
+
+    state_id = "statistics"
+    lease_name = "statistics-materializer"
+
+    def __init__(self):
+        self.chats = config.db["chat"]
+        self.state = config.db["statistics_materialized"]
+        self.statistics = Statistics()
+        self.batch_size = config.env.statistics_materialize_batch_size
+        self.lag = config.env.statistics_materialize_lag
+
+    async def ensure_indexes(self):
+        try:
+            await self.chats.create_index("created_at")
+        except Exception as e:
+            logging.error(f"Error while creating materializer indexes: {e}")
+
+    async def increments(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> Tuple[Dict[str, Counter], Dict[Tuple[str, datetime.datetime], Counter]]:
+        totals: Dict[str, Counter] = defaultdict(Counter)
+        minutes: Dict[Tuple[str, datetime.datetime], Counter] = defaultdict(Counter)
+        groups = await asyncio.gather(
+            *(
+                self.chats.aggregate(statistics_pipeline(metrics_type, start, end)).to_list(None)
+                for metrics_type in metrics_types
+            )
+        )
+        for metrics_type, results in zip(metrics_types, groups):
+            for group in results:
+                key, count = group["_id"], group["count"]
+                minute = datetime.datetime.strptime(key["minute"], "%Y-%m-%dT%H:%M")
+                path = "count" if key["metric"] == "count" else f"{key['metric']}.{key['score']}"
+                totals[metrics_type][path] += count
+                minutes[(metrics_type, minute)][path] += count
+        return totals, minutes
+
+    async def reset(self, cutoff: datetime.datetime) -> datetime.datetime:
+        """
+        Deletes every counter and starts materializing from the first chat.
+        """
+        await self.statistics.collection.delete_many({})
+        await self.statistics.buckets.delete_many({})
+        first = await self.chats.find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+        watermark = bucket_start(first["created_at"], "minute") if first else cutoff
+        await self.state.replace_one(
+            {"_id": self.state_id},
+            {"watermark": watermark, "pending_end": None, "updated_at": datetime.datetime.utcnow()},
+            upsert=True,
+        )
+        logging.info(f"Rebuilding the statistics from the chats created since {watermark}")
+        return watermark
+
+    async def plan(self, watermark: datetime.datetime, cutoff: datetime.datetime) -> datetime.datetime:
+        """
+        Returns the end of the next batch: the end of the minute of its
+        `batch_size`th chat, or the cutoff when fewer chats are left.
+        """
+        last = await (
+            self.chats.find({"created_at": {"$gte": watermark, "$lt": cutoff}}, {"created_at": 1})
+            .sort("created_at", 1)
+            .skip(self.batch_size - 1)
+            .limit(1)
+            .to_list(1)
+        )
+        if not last:
+            return cutoff
+        return min(cutoff, bucket_start(last[0]["created_at"], "minute") + granularities["minute"])
+
+    async def run_once(self) -> bool:
+        """
+        Materializes one batch.
+
+        Returns:
+            bool: Whether the statistics are up to date with the cutoff.
+        """
+        if not await LeaseManager().acquire(self.lease_name):
+            return True
+        try:
+            cutoff = bucket_start(
+                datetime.datetime.utcnow() - datetime.timedelta(seconds=self.lag), "minute"
+            )
+            state = await self.state.find_one({"_id": self.state_id})
+            watermark = state["watermark"] if state else await self.reset(cutoff)
+            end: Optional[datetime.datetime] = state.get("pending_end") if state else None
+            if end is None:
+                if watermark >= cutoff:
+                    return True
+                end = await self.plan(watermark, cutoff)
+                await self.state.update_one(
+                    {"_id": self.state_id}, {"$set": {"pending_end": end}}
+                )
+
+            totals, minutes = await self.increments(watermark, end)
+            await asyncio.gather(
+                bulk_write_once(
+                    self.statistics.collection, self.statistics.totals_operations(totals, end)
+                ),
+                bulk_write_once(
+                    self.statistics.buckets, self.statistics.bucket_operations(minutes, end)
+                ),
+            )
+            await self.state.update_one(
+                {"_id": self.state_id},
+                {
+                    "$set": {
+                        "watermark": end,
+                        "pending_end": None,
+                        "updated_at": datetime.datetime.utcnow(),
+                    }
+                },
+            )
+            self.statistics.version += 1
+            return end >= cutoff
+        finally:
+            await LeaseManager().release(self.lease_name)
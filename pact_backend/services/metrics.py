@@ -1,149 +1,448 @@
+import asyncio
 import math
-import concurrent.futures
+import hashlib
+import json
 import logging
+import re
+import time
+from importlib.metadata import version
 
-from azure.ai.evaluation import (
-    ViolenceEvaluator,
-    SexualEvaluator,
-    SelfHarmEvaluator,
-    HateUnfairnessEvaluator,
-    IndirectAttackEvaluator,
-)
-from azure.identity import DefaultAzureCredential
-from azure.ai.textanalytics import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
-
+from .evaluation_cache import EvaluationCache
+from .evaluators import EvaluatorRegistry
 from .response import BotHandler
 from .preprocessor import PreProcessor
 from ..config import AppConfig, get_config
+from ..constants.prompts import grammar_prompt_template, spell_check_prompt_template
 from ..helpers.singleton import singleton
+from ..helpers.executor import get_executor, run_in_executor
+from ..helpers.singleflight import SingleFlight
+from ..helpers.resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    get_hedge_executor,
+    hedge,
+    hedge_sync,
+)
 
 config: AppConfig = get_config()
 
+metric_names = (
+    "grammar",
+    "spell_check",
+    "sensitive_info",
+    "violence",
+    "bias_gender",
+    "self_harm",
+    "hate_unfairness",
+    "jailbreak",
+)
+
+# Metrics that only depend on the query, the others also depend on the response
+query_metrics = ("grammar", "spell_check", "sensitive_info")
+
+# Score field of the result of every content safety evaluator
+severity_keys = {
+    "violence": "violence_score",
+    "bias_gender": "sexual_score",
+    "self_harm": "self_harm_score",
+    "hate_unfairness": "hate_unfairness_score",
+}
+
+
+def llm_score(value) -> int:
+    """
+    Reads the 0 to 5 score answered by the LLM, 0 if there is none.
+    """
+    match = re.search(r"[0-5]", str(value))
+    return int(match.group()) if match else 0
+
+
+def severity_score(result, key: str) -> int:
+    """
+    Maps the 0 to 7 severity of a content safety evaluator to 0 to 5.
+    """
+    if not result or result.get(key) is None:
+        return 0
+    return int(result[key] * 5 / 7)
+
 
 @singleton
 class Metrics:
     def __init__(self):
         """
-        Initializes the Metrics class with Azure AI service credentials.
+        Initializes the Metrics class with the evaluators shared by the worker.
         """
-        self.azure_ai_project = {
-            "subscription_id": config.env.azure_subscription_id,
-            "resource_group_name": config.env.azure_rg_name,
-            "project_name": config.env.azure_ai_project_name,
-        }
-        self.endpoint = config.env.azure_ai_endpoint
-        self.language_api_key = config.env.azure_language_api_key
-        self.language_endpoint = config.env.azure_language_endpoint
-        self.credential = DefaultAzureCredential()
-        self.client = TextAnalyticsClient(
-            endpoint=self.endpoint, credential=self.credential
-        )
+        self.registry = EvaluatorRegistry()
         self.bot = BotHandler()
         self.preprocessor = PreProcessor()
         self.azure_openai_metric_mapping = {"safe": 0, "low": 1, "medium": 3, "high": 5}
+        self.inflight = SingleFlight()
+        self.cache = EvaluationCache()
 
-    def evaluate_grammar(self, query: str):
-        prompt = f"Evaluate the grammatical correctness of the following sentence and return only the score from 0 to 5:\n\n{query}"
-        result = self.bot.get_response(prompt)
-        return result.get("response", "Error in evaluation")
-
-    def evaluate_spell_check(self, query: str):
-        prompt = f"Evaluate the spelling accuracy of the following sentence and return only the score from 0 to 5:\n\n{query}"
-        result = self.bot.get_response(prompt)
-        return result.get("response", "Error in evaluation")
-
-    def evaluate_sensitive_info(self, query: str):
-        query = [query]
-        credential = AzureKeyCredential(self.language_api_key)
-        text_analytics_client = TextAnalyticsClient(
-            endpoint=self.language_endpoint, credential=credential
-        )
+        # A result is only reused while the prompt, model or evaluator that
+        # produced it is unchanged, METRIC_VERSIONS bumps a metric by hand
+        content_safety_version = f"azure-ai-evaluation=={version('azure-ai-evaluation')}"
+        self.versions = {
+            "grammar": self.prompt_version(grammar_prompt_template),
+            "spell_check": self.prompt_version(spell_check_prompt_template),
+            "sensitive_info": f"azure-ai-textanalytics=={version('azure-ai-textanalytics')}",
+            "violence": content_safety_version,
+            "bias_gender": content_safety_version,
+            "self_harm": content_safety_version,
+            "hate_unfairness": content_safety_version,
+            "jailbreak": content_safety_version,
+        }
+
+        # Circuit breaker and recent latencies of every upstream evaluation service
+        self.breakers = {
+            upstream: CircuitBreaker(
+                upstream,
+                config.env.breaker_failure_threshold,
+                config.env.breaker_reset_timeout,
+            )
+            for upstream in ("content_safety", "text_analytics")
+        }
+        self.latencies = {
+            upstream: LatencyTracker(min_samples=config.env.hedge_min_samples)
+            for upstream in self.breakers
+        }
+
+    @staticmethod
+    def prompt_version(template: str) -> str:
+        digest = hashlib.sha256(template.encode("utf-8")).hexdigest()[:12]
+        return f"{config.env.azure_openai_model_name}:{digest}"
+
+    def metric_version(self, name: str) -> str:
+        override = config.env.metric_versions.get(name)
+        return f"{self.versions[name]}:{override}" if override else self.versions[name]
+
+    def call_upstream(self, upstream: str, fn, default=None):
+        """
+        Calls an evaluation service, sending a backup request when the call is
+        slower than the configured percentile of recent calls.
+
+        Args:
+            upstream (str): The service called, which has its own circuit breaker.
+            fn (Callable): Performs the call.
+            default: The degraded result returned when the call fails or the
+                circuit breaker of the service is open.
+        """
+        breaker = self.breakers[upstream]
+        if not breaker.allow():
+            return default
+        delay = None
+        if config.env.hedging_enabled:
+            delay = self.latencies[upstream].percentile(config.env.hedge_percentile)
+        started_at = time.monotonic()
         try:
-            response = text_analytics_client.recognize_entities(query)
-            return response
+            if delay is None:
+                result = fn()
+            else:
+                result = hedge_sync(
+                    get_hedge_executor(config.env.hedge_max_workers), fn, fn, delay
+                )
         except Exception as e:
+            breaker.record_failure()
             logging.error(f"Error during evaluation: {e}")
-            return 0
+            return default
+        breaker.record_success()
+        self.latencies[upstream].record(time.monotonic() - started_at)
+        return result
 
-    def evaluate_violence(self, query: str, response: str):
-        violence_evaluator = ViolenceEvaluator(
-            credential=self.credential, azure_ai_project=self.azure_ai_project
-        )
+    async def acall_upstream(self, upstream: str, fn, default=None):
+        """
+        Async version of call_upstream, `fn` returning an awaitable.
+        """
+        breaker = self.breakers[upstream]
+        if not (permit := breaker.allow()):
+            return default
+        delay = None
+        if config.env.hedging_enabled:
+            delay = self.latencies[upstream].percentile(config.env.hedge_percentile)
+        started_at = time.monotonic()
         try:
-            result = violence_evaluator(query=query, response=response)
-            return result
+            if delay is None:
+                result = await fn()
+            else:
+                result = await hedge(fn, fn, delay)
+        except asyncio.CancelledError:
+            breaker.release(permit)
+            raise
         except Exception as e:
+            breaker.record_failure()
             logging.error(f"Error during evaluation: {e}")
-            return None
+            return default
+        breaker.record_success()
+        self.latencies[upstream].record(time.monotonic() - started_at)
+        return result
 
-    def evaluate_bias_gender(self, query: str, response: str):
-        sexual_eval = SexualEvaluator(
-            azure_ai_project=self.azure_ai_project, credential=self.credential
+    async def evaluate_grammar(self, query: str, user_id: str | None = None):
+        prompt = grammar_prompt_template.format(query=query)
+        result = await self.bot.aget_response(prompt, route="grammar", user_id=user_id)
+        return None if result.get("error") else result.get("response")
+
+    async def evaluate_spell_check(self, query: str, user_id: str | None = None):
+        prompt = spell_check_prompt_template.format(query=query)
+        result = await self.bot.aget_response(prompt, route="spell_check", user_id=user_id)
+        return None if result.get("error") else result.get("response")
+
+    async def evaluate_sensitive_info(self, query: str):
+        document = await self.acall_upstream(
+            "text_analytics", lambda: self.registry.recognize_entities(query)
         )
-        try:
-            result = sexual_eval(query=query, response=response)
-            return result
-        except Exception as e:
-            logging.error(f"Error during evaluation: {e}")
+        if document is None:
             return None
+        if document.is_error:
+            logging.error(f"Error during evaluation: {document.error}")
+            return None
+        # Only what the score needs is kept, not the text of the entities
+        return {
+            "entities": [
+                {"category": entity.category, "confidence_score": entity.confidence_score}
+                for entity in document.entities
+            ]
+        }
 
-    def evaluate_self_harm(self, query: str, response: str):
-        selfharm_eval = SelfHarmEvaluator(
-            azure_ai_project=self.azure_ai_project, credential=self.credential
+    def evaluate_content_safety(self, name: str, query: str, response: str):
+        evaluator = self.registry.evaluator(name)
+        return self.call_upstream(
+            "content_safety", lambda: evaluator(query=query, response=response)
         )
-        try:
-            result = selfharm_eval(query=query, response=response)
-            return result
-        except Exception as e:
-            logging.error(f"Error during evaluation: {e}")
-            return None
+
+    def evaluate_violence(self, query: str, response: str):
+        return self.evaluate_content_safety("violence", query, response)
+
+    def evaluate_bias_gender(self, query: str, response: str):
+        return self.evaluate_content_safety("sexual", query, response)
+
+    def evaluate_self_harm(self, query: str, response: str):
+        return self.evaluate_content_safety("self_harm", query, response)
 
     def evaluate_hate_unfairness(self, query: str, response: str):
-        hate_unfairness_eval = HateUnfairnessEvaluator(
-            azure_ai_project=self.azure_ai_project, credential=self.credential
-        )
-        try:
-            result = hate_unfairness_eval(query=query, response=response)
-            return result
-        except Exception as e:
-            logging.error(f"Error during evaluation: {e}")
-            return None
+        return self.evaluate_content_safety("hate_unfairness", query, response)
 
     def evaluate_jailbreak(self, query: str, response: str):
-        jailbreak_eval = IndirectAttackEvaluator(
-            azure_ai_project=self.azure_ai_project, credential=self.credential
+        return self.evaluate_content_safety("jailbreak", query, response)
+
+    async def evaluate_all(
+        self,
+        query: str,
+        response: str,
+        user_id: str | None = None,
+        include: list[str] | None = None,
+    ):
+        """
+        Runs the evaluators on the query and response, reusing the cached
+        results of the metrics already computed for the same inputs and
+        version. Concurrent calls with the same arguments share a single
+        evaluation.
+
+        Failed, short-circuited and timed out metrics are None and not cached.
+
+        Args:
+            include (list[str], optional): The metrics to compute, all of them by default.
+        """
+        names = self.metric_names(include)
+        key = hashlib.sha256(json.dumps([query, response, names]).encode("utf-8")).hexdigest()
+        return await self.inflight.do(
+            key, lambda: self._evaluate_all(query, response, user_id, names)
         )
+
+    async def _evaluate_all(
+        self, query: str, response: str, user_id: str | None, names: list[str]
+    ):
+        results = {
+            name: value
+            async for name, value in self.evaluate_iter(query, response, user_id, names)
+        }
+        return {name: results[name] for name in names}
+
+    @staticmethod
+    def metric_names(include: list[str] | None = None) -> list[str]:
+        """
+        Validates the requested metrics, keeping the order of metric_names.
+
+        Raises:
+            ValueError: When an unknown metric is requested.
+        """
+        if include is None:
+            return list(metric_names)
+        unknown = set(include) - set(metric_names)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        return [name for name in metric_names if name in include]
+
+    async def run_metric(self, name: str, coro, default=None):
+        """
+        Awaits the evaluation of one metric, returning the degraded result when
+        it takes longer than its timeout.
+        """
+        timeout = config.env.metric_timeouts.get(name, config.env.metric_timeout)
         try:
-            result = jailbreak_eval(query=query, response=response)
-            return result
-        except Exception as e:
-            logging.error(f"Error during evaluation: {e}")
-            return None
+            return name, await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Evaluation of {name} timed out after {timeout}s")
+            return name, default
 
-    def evaluate_all(self, query: str, response: str):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_function = {
-                "grammar": executor.submit(self.evaluate_grammar, query),
-                "spell_check": executor.submit(self.evaluate_spell_check, query),
-                "sensitive_info": executor.submit(self.evaluate_sensitive_info, query),
-                "violence": executor.submit(self.evaluate_violence, query, response),
-                "bias_gender": executor.submit(
-                    self.evaluate_bias_gender, query, response
-                ),
-                "bias_self_harm": executor.submit(
-                    self.evaluate_self_harm, query, response
-                ),
-                "hate_unfairness": executor.submit(
-                    self.evaluate_hate_unfairness, query, response
-                ),
-                "jailbreak": executor.submit(self.evaluate_jailbreak, query, response),
-            }
+    def evaluators(self, query: str, response: str, user_id: str | None = None) -> dict:
+        executor = get_executor("evaluation", config.env.evaluation_max_workers)
+        return {
+            "grammar": lambda: self.evaluate_grammar(query, user_id),
+            "spell_check": lambda: self.evaluate_spell_check(query, user_id),
+            "sensitive_info": lambda: self.evaluate_sensitive_info(query),
+            "violence": lambda: run_in_executor(
+                executor, self.evaluate_violence, query, response
+            ),
+            "bias_gender": lambda: run_in_executor(
+                executor, self.evaluate_bias_gender, query, response
+            ),
+            "self_harm": lambda: run_in_executor(
+                executor, self.evaluate_self_harm, query, response
+            ),
+            "hate_unfairness": lambda: run_in_executor(
+                executor, self.evaluate_hate_unfairness, query, response
+            ),
+            "jailbreak": lambda: run_in_executor(
+                executor, self.evaluate_jailbreak, query, response
+            ),
+        }
+
+    async def evaluate_iter(
+        self,
+        query: str,
+        response: str,
+        user_id: str | None = None,
+        include: list[str] | None = None,
+    ):
+        """
+        Yields the (metric, raw result) of every requested metric as soon as
+        it is known, cached metrics first.
+        """
+        names = self.metric_names(include)
+        evaluators = self.evaluators(query, response, user_id)
+        versions = {name: self.metric_version(name) for name in names}
+        keys = {
+            name: self.cache.key(name, versions[name], query)
+            if name in query_metrics
+            else self.cache.key(name, versions[name], query, response)
+            for name in names
+        }
+        cached = await self.cache.get_many(keys)
+        for name in names:
+            if name in cached:
+                yield name, cached[name]
 
-            results = {
-                key: future.result() for key, future in future_to_function.items()
+        tasks = [
+            asyncio.ensure_future(self.run_metric(name, evaluators[name]()))
+            for name in names
+            if name not in cached
+        ]
+        computed = {}
+        try:
+            for task in asyncio.as_completed(tasks):
+                name, value = await task
+                computed[name] = value
+                yield name, value
+        finally:
+            for task in tasks:
+                task.cancel()
+        await self.cache.set_many(
+            {
+                keys[name]: (name, versions[name], value)
+                for name, value in computed.items()
+                if value is not None
             }
-        return results
+        )
+
+    def flagged_metrics(self, metrics_response: dict, query: str, names: list[str]) -> dict:
+        """
+        Scores a filtered prompt from its content filter results, keeping the
+        requested metrics.
+        """
+        evaluation = self.get_openai_metrics(metrics_response, query)
+        return {
+            name: score
+            for name, score in evaluation.items()
+            if name == "flagged" or name in names
+        }
+
+    async def evaluate_pair(
+        self,
+        query: str,
+        answer: str,
+        opt_query: str,
+        opt_answer: str,
+        user_id: str | None = None,
+        include: list[str] | None = None,
+        flagged_metrics: dict | None = None,
+    ) -> dict:
+        """
+        Scores the original and optimized pairs of /llm/metrics concurrently.
+
+        Args:
+            flagged_metrics (dict, optional): The content filter results of a
+                filtered original prompt, scored instead of evaluating it.
+
+        Returns:
+            dict: The "metrics" and "opt_metrics" scores.
+        """
+        names = self.metric_names(include)
+
+        async def original_metrics():
+            if flagged_metrics is not None:
+                return self.flagged_metrics(flagged_metrics, query, names)
+            response = await self.evaluate_all(query, answer, user_id, names)
+            return self.normalize(response, math.ceil)
+
+        async def optimized_metrics():
+            opt_response = await self.evaluate_all(opt_query, opt_answer, user_id, names)
+            return self.normalize(opt_response)
+
+        evaluation, opt_evaluation = await asyncio.gather(
+            original_metrics(), optimized_metrics()
+        )
+        return {"metrics": evaluation, "opt_metrics": opt_evaluation}
+
+    def normalize_metric(self, name: str, value, sensitive_info_rounding=math.floor):
+        """
+        Maps the raw result of one metric to its 0 to 5 score, jailbreak being
+        a flag. Degraded evaluations (failed or short-circuited) score 0.
+        """
+        if name in ("grammar", "spell_check"):
+            return llm_score(value)
+        if name == "sensitive_info":
+            maxi = 0
+            if isinstance(value, dict):
+                for ele in value["entities"]:
+                    maxi = max(maxi, ele.get("confidence_score", 0))
+                maxi = int(sensitive_info_rounding(maxi * 5))
+            return maxi
+        if name == "jailbreak":
+            flag = "not computed"
+            for key in value or {}:
+                if value[key] == True:
+                    flag = True
+                    break
+                else:
+                    flag = False
+            return flag
+        return severity_score(value, severity_keys[name])
+
+    def normalize(self, results: dict, sensitive_info_rounding=math.floor) -> dict:
+        """
+        Maps the raw results of evaluate_all to the 0 to 5 scores stored with the chats.
+
+        Args:
+            results (dict): The results of evaluate_all.
+            sensitive_info_rounding (Callable[[float], int]): Rounds the scaled entity confidence.
+
+        Returns:
+            dict: The score of every metric in the results, jailbreak being a flag.
+        """
+        return {
+            name: self.normalize_metric(name, value, sensitive_info_rounding)
+            for name, value in results.items()
+        }
 
     def get_openai_metrics(self, metrics_response: object, query: str):
         print(metrics_response)
@@ -1,15 +1,55 @@
+import asyncio
 import logging
+import time
 import openai
 from langchain_community.callbacks import get_openai_callback
-from langchain_openai import AzureChatOpenAI
 from langchain_openai.chat_models.base import OpenAIRefusalError
 import os
 from ..config import AppConfig, get_config
 from ..helpers.singleton import singleton
+from ..helpers.service import get_http_limits, get_async_http_client
+from ..helpers.singleflight import SingleFlight
+from ..helpers.resilience import (
+    BreakerPermit,
+    CircuitOpenError,
+    LatencyTracker,
+    hedge,
+)
+from .cache import ResponseCache
+from .cassettes import Cassettes
+from .deployments import Deployment, DeploymentPool, get_deployment_settings
+from .lease import LeaseManager
+from .usage import UsageLedger
 
 
 config: AppConfig = get_config()
 
+# Errors after which a call is retried, on another deployment when possible
+retryable_errors = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def retry_after(error: openai.APIStatusError):
+    """
+    Reads the delay requested by the service from the retry-after-ms or
+    retry-after headers of the error response.
+
+    Returns:
+        float: The delay in seconds, or None if the headers are missing.
+    """
+    headers = error.response.headers if error.response is not None else {}
+    try:
+        if (retry_after_ms := headers.get("retry-after-ms")) is not None:
+            return float(retry_after_ms) / 1000
+        if (retry_after_s := headers.get("retry-after")) is not None:
+            return float(retry_after_s)
+    except ValueError:
+        return None
+    return None
+
 
 @singleton
 class BotHandler:
@@ -30,45 +70,193 @@ class BotHandler:
         self.temperature = temperature
         self.max_tokens = max_tokens
 
-        # Fetch model-specific environment variables
-        self.api_key = config.env.azure_openai_api_key
-        self.endpoint = config.env.azure_openai_endpoint
-        self.deployment = config.env.azure_openai_deployment
-        self.api_version = config.env.azure_openai_api_version
-
-        # Initialize Azure OpenAI LLM
-        self.llm = AzureChatOpenAI(
-            openai_api_key=self.api_key,
-            azure_endpoint=self.endpoint,
-            azure_deployment=self.deployment,
+        # Connection pool shared by all the calls of this worker
+        limits = get_http_limits(
+            config.env.llm_max_connections,
+            config.env.llm_max_keepalive_connections,
+            config.env.llm_keepalive_expiry,
+        )
+        cassettes = Cassettes()
+        self.http_async_client = get_async_http_client(
+            limits, config.env.llm_timeout, cassettes.async_http_transport("openai", limits)
+        )
+
+        # Initialize an Azure OpenAI LLM for every deployment of the pool
+        self.pool = DeploymentPool(
+            [
+                Deployment(
+                    settings,
+                    self.model,
+                    self.temperature,
+                    self.max_tokens,
+                    self.http_async_client,
+                )
+                for settings in get_deployment_settings()
+            ]
+        )
+        self.deployment = self.pool.name
+
+        # Responses are only cached while they are deterministic
+        self.cache = ResponseCache() if self.temperature == 0 else None
+
+        # Identical concurrent prompts share a single upstream call
+        self.inflight = SingleFlight()
+        self.leases = LeaseManager()
+
+        self.max_retries = config.env.llm_max_retries
+
+        # Latencies of recent calls, a backup request is sent after the slowest ones
+        self.latencies = LatencyTracker(min_samples=config.env.hedge_min_samples)
+        self.hedged = 0
+
+        self.usage = UsageLedger()
+
+    def record_usage(
+        self,
+        route: str,
+        user_id,
+        deployment: Deployment,
+        cb,
+        started_at: float,
+        error: bool = False,
+        cancelled: bool = False,
+    ):
+        """
+        Records the token usage, cost and latency of an upstream call in the usage ledger.
+        """
+        self.usage.record(
+            route=route,
+            user_id=user_id,
             model=self.model,
-            api_version=self.api_version,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            timeout=30,
-            max_retries=3,
+            deployment=deployment.name,
+            prompt_tokens=cb.prompt_tokens if cb else 0,
+            completion_tokens=cb.completion_tokens if cb else 0,
+            total_tokens=cb.total_tokens if cb else 0,
+            cost=cb.total_cost if cb else 0.0,
+            latency=time.monotonic() - started_at,
+            error=error,
+            cancelled=cancelled,
+        )
+
+    def estimate_tokens(self, formatted_prompt: str) -> int:
+        """
+        Estimates the tokens of a call from the prompt size (about 4 characters
+        per token) and the completion budget.
+        """
+        return len(formatted_prompt) // 4 + 1 + self.max_tokens
+
+    def observe_failure(self, deployment: Deployment, permit: BreakerPermit, error: Exception):
+        """
+        Server and connection errors count against the health of the
+        deployment. Rate limit errors honor the retry-after headers and block
+        every caller of the deployment through its limiter, without taking it
+        out of rotation: the deployment is healthy, only busy. Other errors,
+        like a filtered prompt, mean that the deployment answered.
+        """
+        if isinstance(error, openai.RateLimitError):
+            deployment.limiter.backoff(retry_after(error) or 1)
+            deployment.throttled(permit)
+        elif isinstance(error, retryable_errors):
+            deployment.record_failure()
+        else:
+            deployment.breaker.record_success()
+
+    def retry_delay(self, error: Exception, attempt: int, tried: list):
+        """
+        Returns the seconds to wait before retrying after `error`, or None if
+        the error should not be retried. There is no wait when another
+        deployment can be tried.
+        """
+        if attempt >= self.max_retries or not isinstance(
+            error, (openai.RateLimitError, *retryable_errors)
+        ):
+            return None
+        if self.pool.has_alternative(tried):
+            return 0
+        if isinstance(error, openai.RateLimitError):
+            return retry_after(error) or 2 ** attempt
+        return 0.5 * 2 ** attempt
+
+    def hedge_delay(self):
+        """
+        Returns the seconds after which a backup request is sent, the
+        configured percentile of the recent latencies, or None while hedging
+        is disabled or there are not enough samples.
+        """
+        if not config.env.hedging_enabled:
+            return None
+        return self.latencies.percentile(config.env.hedge_percentile)
+
+    async def _acall(self, deployment: Deployment, formatted_prompt: str, estimate: int, route: str, user_id):
+        if not (permit := deployment.breaker.allow()):
+            raise CircuitOpenError(f"Deployment {deployment.name} is unavailable")
+        started_at = time.monotonic()
+        cb = None
+        try:
+            await deployment.limiter.acquire(estimate)
+            started_at = time.monotonic()
+            with deployment.track(), get_openai_callback() as cb:
+                output = await deployment.llm.ainvoke(formatted_prompt)
+        except asyncio.CancelledError:
+            # The other request of a hedged pair answered first. A request
+            # still waiting for the limiter gives its reservation back, one
+            # already sent keeps the estimate: the deployment counts it anyway.
+            deployment.breaker.release(permit)
+            if cb is not None:
+                self.record_usage(route, user_id, deployment, cb, started_at, cancelled=True)
+            raise
+        except Exception as e:
+            self.observe_failure(deployment, permit, e)
+            self.record_usage(route, user_id, deployment, cb, started_at, error=True)
+            raise
+        self.observe_success(deployment, estimate, cb, started_at)
+        self.record_usage(route, user_id, deployment, cb, started_at)
+        return output.content
+
+    def observe_success(self, deployment: Deployment, estimate: int, cb, started_at: float):
+        latency = time.monotonic() - started_at
+        deployment.record_success(latency)
+        deployment.limiter.reconcile(estimate, cb.total_tokens)
+        self.latencies.record(latency)
+
+    async def _ahedged_call(self, formatted_prompt: str, estimate: int, tried: list, route: str, user_id):
+        async def call_next():
+            deployment = self.pool.pick(estimate, tried)
+            tried.append(deployment)
+            return await self._acall(deployment, formatted_prompt, estimate, route, user_id)
+
+        async def call_backup():
+            self.hedged += 1
+            return await call_next()
+
+        if (delay := self.hedge_delay()) is None:
+            return await call_next()
+        return await hedge(call_next, call_backup, delay)
+
+    def cache_key(self, formatted_prompt: str):
+        if self.cache is None:
+            return None
+        return self.cache.key(
+            self.model, self.deployment, self.temperature, self.max_tokens, formatted_prompt
         )
 
-    def get_response(self, prompt: str, structure=None):
+    def format_prompt(self, prompt: str, structure=None) -> str:
+        if structure:
+            return f"{structure.get('prompt_template', '')} {prompt}"
+        return prompt
+
+    def handle_error(self, error: Exception) -> dict:
         """
-        Sends a prompt to the Azure OpenAI model and returns the response.
+        Converts an error raised by the model into the response payload.
 
         Args:
-            prompt (str): The user query.
-            structure (dict, optional): Formatting template for prompt.
+            error (Exception): The error raised while invoking the model.
 
         Returns:
-            dict: Contains response from the model.
+            dict: Error response, with the content filter results if the prompt was filtered.
         """
-        formatted_prompt = prompt
-        if structure:
-            formatted_prompt = f'{structure.get("prompt_template", '')} {prompt}'
-        try:
-            with get_openai_callback() as cb:
-                output = self.llm.invoke(formatted_prompt)
-                response = output.content
-        except openai.BadRequestError as openai_bad_request_error:
-            error_body = openai_bad_request_error.body
+        if isinstance(error, openai.BadRequestError):
+            error_body = error.body
             if error_body.get("code") == "content_filter":
                 inner_error = error_body.get("innererror")
                 if (
@@ -85,19 +273,138 @@ class BotHandler:
                         "violence": content_filter_result.get("violence"),
                         "error": True,
                     }
-            else:
-                return {
-                    "error": True,
-                    "response": "There was an error processing the prompt, please check your prompt and retry.",
-                    "content_filter": False,
-                }
+        else:
+            logging.error(error)
 
-        except Exception as e:
-            logging.error(e)
-            return {
-                "error": True,
-                "response": "There was an error processing the prompt, please check your prompt and retry.",
-                "content_filter": False,
-            }
-
-        return {"response": response.replace('"', "")}
+        return {
+            "error": True,
+            "response": "There was an error processing the prompt, please check your prompt and retry.",
+            "content_filter": False,
+        }
+
+    async def aget_response(self, prompt: str, structure=None, route: str = "prompt", user_id=None):
+        """
+        Sends a prompt to the Azure OpenAI model without blocking the event loop.
+
+        Args:
+            prompt (str): The user query.
+            structure (dict, optional): Formatting template for prompt.
+            route (str): The kind of call, recorded in the usage ledger.
+            user_id (str, optional): The user the call is made for.
+
+        Returns:
+            dict: Contains response from the model.
+        """
+        formatted_prompt = self.format_prompt(prompt, structure)
+        key = self.cache_key(formatted_prompt)
+        if key is None:
+            return await self.ainvoke(formatted_prompt, route, user_id)
+        return await self.inflight.do(
+            key, lambda: self._aget_shared_response(key, formatted_prompt, route, user_id)
+        )
+
+    async def _aget_shared_response(self, key: str, formatted_prompt: str, route: str, user_id):
+        """
+        Serves the response from the cache, or from the worker currently holding
+        the lease for this prompt, before calling the model itself.
+        """
+        if (cached := await self.cache.aget(key)) is not None:
+            return cached
+
+        # Other workers can only pick up the result through the shared cache
+        acquired = self.cache.enabled and await self.leases.acquire(key)
+        if self.cache.enabled and not acquired:
+            shared = await self.leases.wait_for(
+                key, lambda: self.cache.aget(key, record=False)
+            )
+            if shared is not None:
+                return shared
+
+        try:
+            result = await self.ainvoke(formatted_prompt, route, user_id)
+            await self.cache.aset(key, result)
+        finally:
+            if acquired:
+                await self.leases.release(key)
+        return result
+
+    async def ainvoke(self, formatted_prompt: str, route: str = "prompt", user_id=None):
+        estimate = self.estimate_tokens(formatted_prompt)
+        tried = []
+        attempt = 0
+        while True:
+            try:
+                response = await self._ahedged_call(formatted_prompt, estimate, tried, route, user_id)
+                return {"response": response.replace('"', "")}
+            except Exception as e:
+                if (delay := self.retry_delay(e, attempt, tried)) is None:
+                    return self.handle_error(e)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def astream_response(self, prompt: str, on_token, structure=None, route: str = "prompt", user_id=None):
+        """
+        Streams the response of the Azure OpenAI model token by token.
+
+        Args:
+            prompt (str): The user query.
+            on_token (Callable[[str], Awaitable]): Called with every chunk of the response as it arrives.
+            structure (dict, optional): Formatting template for prompt.
+            route (str): The kind of call, recorded in the usage ledger.
+            user_id (str, optional): The user the call is made for.
+
+        Returns:
+            dict: Contains the complete response from the model, same as aget_response.
+        """
+        formatted_prompt = self.format_prompt(prompt, structure)
+        key = self.cache_key(formatted_prompt)
+        if key and (cached := await self.cache.aget(key)) is not None:
+            if not cached.get("error"):
+                await on_token(cached["response"])
+            return cached
+
+        # Streamed calls are not hedged, the client already receives the tokens
+        estimate = self.estimate_tokens(formatted_prompt)
+        tried = []
+        chunks = []
+        attempt = 0
+        while True:
+            cb = None
+            permit = None
+            started_at = time.monotonic()
+            try:
+                deployment = self.pool.pick(estimate, tried)
+                tried.append(deployment)
+                if not (permit := deployment.breaker.allow()):
+                    raise CircuitOpenError(f"Deployment {deployment.name} is unavailable")
+                await deployment.limiter.acquire(estimate)
+                started_at = time.monotonic()
+                with deployment.track(), get_openai_callback() as cb:
+                    async for chunk in deployment.llm.astream(formatted_prompt):
+                        token = chunk.content.replace('"', "")
+                        if token:
+                            chunks.append(token)
+                            await on_token(token)
+                self.observe_success(deployment, estimate, cb, started_at)
+                self.record_usage(route, user_id, deployment, cb, started_at)
+                break
+            except asyncio.CancelledError:
+                if permit is not None:
+                    deployment.breaker.release(permit)
+                if cb is not None:
+                    self.record_usage(route, user_id, deployment, cb, started_at, cancelled=True)
+                raise
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    self.observe_failure(deployment, permit, e)
+                    self.record_usage(route, user_id, deployment, cb, started_at, error=True)
+                # Tokens already sent to the client cannot be taken back
+                if chunks or (delay := self.retry_delay(e, attempt, tried)) is None:
+                    return self.handle_error(e)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        result = {"response": "".join(chunks)}
+        if key:
+            await self.cache.aset(key, result)
+        return result
@@ -0,0 +1,385 @@
+import asyncio
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from ..config import AppConfig, get_config
+from ..helpers.flusher import FlushLoop
+from ..helpers.lru import TTLCache
+from ..helpers.singleflight import SingleFlight
+from ..helpers.singleton import singleton
+from ..helpers.timebuckets import bucket_start, bucket_starts, cover, granularities
+from ..models.chat import MetricsModel
+from ..models.statistics import statistics_document, statistics_increments
+
+config: AppConfig = get_config()
+
+metrics_types = ("prompt_metrics", "opt_prompt_metrics")
+
+# Fields of a statistics or bucket document that are not counters
+bucket_fields = ("_id", "metrics_type", "granularity", "start", "expires_at", "materialized_to")
+
+
+def add_increments(document: dict, increments: Dict[str, int]):
+    """
+    Adds dotted `<metric>.<score>` increments to a statistics document.
+    """
+    for path, amount in increments.items():
+        *parents, key = path.split(".")
+        target = document
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = target.get(key, 0) + amount
+
+
+def add_counters(document: dict, counters: dict):
+    """
+    Adds the nested counters of a bucket document to a statistics document.
+    """
+    for key, value in counters.items():
+        if key in bucket_fields:
+            continue
+        if isinstance(value, dict):
+            add_counters(document.setdefault(key, {}), value)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            document[key] = document.get(key, 0) + value
+
+
+class StatisticsRangeError(ValueError):
+    """
+    Raised for a statistics range that is empty or needs too many buckets.
+    """
+
+
+@singleton
+class Statistics:
+    """
+    Counters of the metric scores of prompts and optimized prompts: one
+    all-time document per metrics_type, and minute, hour and day buckets in
+    `statistics_buckets` to answer time ranges.
+
+    Counters are only ever incremented with $inc upserts, so concurrent
+    updates from any number of workers are never lost. While started, the
+    increments are summed in memory and written by a background task as one
+    $inc per document, every `statistics_flush_interval` seconds or
+    `statistics_flush_events` events, whichever comes first. At most one
+    interval of increments is lost if the worker dies, none on shutdown.
+
+    Serialized responses are cached for `statistics_cache_ttl` seconds with
+    their ETag, under a version bumped by every write of this worker. Writes
+    of other workers show up once the entry expired. The ETag only covers
+    the stored statistics, so every worker tags them alike. The increments
+    this worker has not flushed yet are added to the body without changing
+    it, and show up in revalidated responses once flushed.
+    """
+
+    def __init__(self):
+        self.collection = config.db["statistics"]
+        self.buckets = config.db["statistics_buckets"]
+        self.materialized = config.env.statistics_materialized
+        self.write_behind = config.env.statistics_write_behind
+        self.flush_interval = config.env.statistics_flush_interval
+        self.flush_events = config.env.statistics_flush_events
+        self.retention = config.env.statistics_bucket_retention
+        self.max_buckets = config.env.statistics_max_buckets
+        # All-time increments per metrics_type, and per metrics_type and minute
+        self._totals: Dict[str, Counter] = defaultdict(Counter)
+        self._minutes: Dict[Tuple[str, datetime.datetime], Counter] = defaultdict(Counter)
+        self._events = 0
+        self._lock = threading.Lock()
+        self.flusher = FlushLoop(self.flush, self.flush_interval)
+        self.version = 0
+        self.responses = TTLCache(config.env.statistics_cache_max_entries, config.env.statistics_cache_ttl)
+        self.inflight = SingleFlight()
+
+    async def ensure_indexes(self):
+        try:
+            # Concurrent upserts of a missing document must not create two
+            await self.collection.create_index("metrics_type", unique=True)
+            await self.buckets.create_index(
+                [("metrics_type", 1), ("granularity", 1), ("start", 1)], unique=True
+            )
+            await self.buckets.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logging.error(f"Error while creating statistics indexes: {e}")
+
+    @staticmethod
+    def guarded(
+        query: dict, update: dict, materialized_to: Optional[datetime.datetime]
+    ) -> UpdateOne:
+        """
+        Returns the $inc upsert of a document. With `materialized_to`, the
+        increments are only applied to a document not yet materialized up to
+        that time, including one never materialized such as the counters
+        written by /statistics/add, see StatisticsMaterializer.
+        """
+        if materialized_to is not None:
+            query = {**query, "materialized_to": {"$not": {"$gte": materialized_to}}}
+            update = {**update, "$set": {"materialized_to": materialized_to}}
+        return UpdateOne(query, update, upsert=True)
+
+    def totals_operations(
+        self, totals: Dict[str, Counter], materialized_to: Optional[datetime.datetime] = None
+    ) -> List[UpdateOne]:
+        return [
+            self.guarded({"metrics_type": metrics_type}, {"$inc": dict(values)}, materialized_to)
+            for metrics_type, values in totals.items()
+            if values
+        ]
+
+    def bucket_operations(
+        self,
+        minutes: Dict[Tuple[str, datetime.datetime], Counter],
+        materialized_to: Optional[datetime.datetime] = None,
+    ) -> List[UpdateOne]:
+        """
+        Rolls the increments of every minute up into their minute, hour and
+        day buckets, with one $inc per bucket.
+        """
+        buckets: Dict[tuple, Counter] = defaultdict(Counter)
+        for (metrics_type, minute), values in minutes.items():
+            for granularity in granularities:
+                buckets[(metrics_type, granularity, bucket_start(minute, granularity))].update(values)
+        operations = []
+        for (metrics_type, granularity, start), values in buckets.items():
+            update = {"$inc": dict(values)}
+            if retention := self.retention.get(granularity):
+                update["$setOnInsert"] = {
+                    "expires_at": start
+                    + granularities[granularity]
+                    + datetime.timedelta(seconds=retention)
+                }
+            operations.append(
+                self.guarded(
+                    {"metrics_type": metrics_type, "granularity": granularity, "start": start},
+                    update,
+                    materialized_to,
+                )
+            )
+        return operations
+
+    async def write_totals(self, totals: Dict[str, Counter]):
+        operations = self.totals_operations(totals)
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def write_buckets(self, minutes: Dict[Tuple[str, datetime.datetime], Counter]):
+        operations = self.bucket_operations(minutes)
+        if operations:
+            await self.buckets.bulk_write(operations, ordered=False)
+
+    async def write(self, totals: Dict[str, Counter], minutes: Dict[Tuple[str, datetime.datetime], Counter]) -> Tuple[bool, bool]:
+        """
+        Writes the all-time counters and the buckets concurrently.
+
+        Returns:
+            Tuple[bool, bool]: Whether the counters and the buckets were written.
+        """
+        results = await asyncio.gather(
+            self.write_totals(totals), self.write_buckets(minutes), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Error while writing statistics: {result}")
+        self.version += 1
+        return tuple(not isinstance(result, Exception) for result in results)
+
+    @staticmethod
+    def increments(metrics: MetricsModel, opt_metrics: MetricsModel) -> Dict[str, Dict[str, int]]:
+        return {
+            metrics_type: statistics_increments(values)
+            for metrics_type, values in zip(metrics_types, (metrics, opt_metrics))
+        }
+
+    def _buffer(self, totals: Dict[str, Counter], minutes: Dict[Tuple[str, datetime.datetime], Counter], events: int) -> bool:
+        with self._lock:
+            for metrics_type, values in totals.items():
+                self._totals[metrics_type].update(values)
+            for key, values in minutes.items():
+                self._minutes[key].update(values)
+            self._events += events
+            return self._events >= self.flush_events
+
+    async def add(self, metrics: MetricsModel, opt_metrics: MetricsModel):
+        """
+        Counts the metrics of a prompt and of its optimized prompt, buffered
+        in memory while the background flush runs.
+        """
+        if self.materialized:
+            # Counted from the chat collection by StatisticsMaterializer
+            return
+        minute = bucket_start(datetime.datetime.utcnow(), "minute")
+        totals = {
+            metrics_type: Counter(values)
+            for metrics_type, values in self.increments(metrics, opt_metrics).items()
+        }
+        minutes = {(metrics_type, minute): values for metrics_type, values in totals.items()}
+        if not self.flusher.running:
+            written = await self.write(totals, minutes)
+            if not all(written):
+                raise RuntimeError("Statistics could not be written")
+            return
+        if self._buffer(totals, minutes, 1):
+            self.flusher.wake()
+
+    async def flush(self):
+        with self._lock:
+            totals, minutes, events = self._totals, self._minutes, self._events
+            self._totals, self._minutes = defaultdict(Counter), defaultdict(Counter)
+            self._events = 0
+        if not events:
+            return
+        totals_written, buckets_written = await self.write(totals, minutes)
+        # Kept for the next flush, $inc increments can be summed in any order
+        if not totals_written or not buckets_written:
+            self._buffer(
+                {} if totals_written else totals,
+                {} if buckets_written else minutes,
+                events,
+            )
+
+    def start(self):
+        if self.write_behind:
+            self.flusher.start()
+
+    async def stop(self):
+        await self.flusher.stop()
+
+    async def get(self) -> dict:
+        """
+        Returns the stored all-time statistics of every metrics_type.
+        """
+        documents = {
+            document["metrics_type"]: document
+            async for document in self.collection.find(
+                {"metrics_type": {"$in": list(metrics_types)}}
+            )
+        }
+        return {
+            metrics_type: statistics_document(metrics_type, documents.get(metrics_type), bucket_fields)
+            for metrics_type in metrics_types
+        }
+
+    async def get_range(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        granularity: Optional[str] = None,
+    ) -> dict:
+        """
+        Returns the stored statistics of [start, end), rounded to minutes, read from
+        the fewest buckets covering it: whole days, then whole hours, then the
+        minutes at the edges. Minute and hour buckets older than their
+        retention are gone, older edges are then only counted from coarser
+        buckets.
+
+        With a granularity, also returns the statistics of every bucket of
+        that granularity overlapping the range, from a single query.
+        """
+        start, end = bucket_start(start, "minute"), bucket_start(end, "minute")
+        if start >= end:
+            raise StatisticsRangeError("The start of the range must be before its end")
+        parts = cover(start, end)
+        clauses = [
+            {"granularity": name, "start": {"$gte": low, "$lt": high}} for name, low, high in parts
+        ]
+        starts = []
+        if granularity is not None:
+            starts = bucket_starts(start, end, granularity)
+            if len(starts) > self.max_buckets:
+                raise StatisticsRangeError(
+                    f"The range holds {len(starts)} {granularity} buckets, the maximum is {self.max_buckets}"
+                )
+            clauses.append({"granularity": granularity, "start": {"$gte": starts[0], "$lt": end}})
+
+        totals = {metrics_type: statistics_document(metrics_type) for metrics_type in metrics_types}
+        series = {
+            bucket: {metrics_type: statistics_document(metrics_type) for metrics_type in metrics_types}
+            for bucket in starts
+        }
+        async for document in self.buckets.find(
+            {"metrics_type": {"$in": list(metrics_types)}, "$or": clauses}
+        ):
+            metrics_type, name, bucket = document["metrics_type"], document["granularity"], document["start"]
+            if any(name == part and low <= bucket < high for part, low, high in parts):
+                add_counters(totals[metrics_type], document)
+            if name == granularity and bucket in series:
+                add_counters(series[bucket][metrics_type], document)
+
+        statistics = {
+            **totals,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+        }
+        if granularity is not None:
+            statistics["granularity"] = granularity
+            statistics["series"] = [
+                {"start": bucket.isoformat(), **values} for bucket, values in series.items()
+            ]
+        return statistics
+
+    def with_pending(self, statistics: dict) -> Optional[dict]:
+        """
+        Returns a copy of statistics returned by `get` or `get_range` with the
+        increments of this worker that were not flushed yet, or None when
+        there are none.
+        """
+        with self._lock:
+            if "from" not in statistics:
+                pending = [((metrics_type, None), Counter(values)) for metrics_type, values in self._totals.items()]
+            else:
+                start = datetime.datetime.fromisoformat(statistics["from"])
+                end = datetime.datetime.fromisoformat(statistics["to"])
+                pending = [(key, Counter(values)) for key, values in self._minutes.items() if start <= key[1] < end]
+        if not pending:
+            return None
+        statistics = copy.deepcopy(statistics)
+        series = {entry["start"]: entry for entry in statistics.get("series", [])}
+        for (metrics_type, minute), values in pending:
+            add_increments(statistics[metrics_type], values)
+            if series and (entry := series.get(bucket_start(minute, statistics["granularity"]).isoformat())):
+                add_increments(entry[metrics_type], values)
+        return statistics
+
+    async def serialized(
+        self,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        granularity: Optional[str] = None,
+    ) -> Tuple[str, bytes]:
+        """
+        Returns the ETag and the JSON of the all-time statistics, or of a
+        range when `start` is given (`end` defaulting to now), from the cache
+        when possible. Concurrent misses share a single query.
+        """
+        key = (self.version, start, end, granularity)
+        cached = self.responses.get(key)
+        if cached is None:
+
+            async def build() -> Tuple[str, dict, bytes]:
+                if start is None:
+                    data = await self.get()
+                else:
+                    data = await self.get_range(start, end or datetime.datetime.utcnow(), granularity)
+                body = self.dumps(data)
+                etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+                self.responses.set(key, (etag, data, body))
+                return etag, data, body
+
+            cached = await self.inflight.do(key, build)
+        etag, data, body = cached
+        if (pending := self.with_pending(data)) is not None:
+            body = self.dumps(pending)
+        return etag, body
+
+    @staticmethod
+    def dumps(statistics: dict) -> bytes:
+        # Sorted keys, the field order of the stored documents may differ
+        return json.dumps(statistics, separators=(",", ":"), sort_keys=True).encode("utf-8")
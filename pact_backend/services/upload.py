@@ -2,6 +2,7 @@ import aiofiles
 import logging
 import os
 import datetime
+import hashlib
 
 import ffmpeg
 from fastapi import UploadFile, File
@@ -11,15 +12,50 @@ from ..config import get_config, AppConfig
 from ..helpers.singleton import singleton
 from ..helpers.service import get_storage_client
 from ..helpers.filename import get_filename_hash
+from .cassettes import Cassettes
 
 
 config: AppConfig = get_config()
 
 
+def recognize(file_path: str, language_code: str) -> dict:
+    """
+    Recognizes the speech of an audio file.
+
+    Returns:
+        dict: The reason of the result and its text or failure details.
+    """
+    speech_config = speechsdk.SpeechConfig(subscription=config.env.azure_stt_key, region=config.env.azure_stt_region)
+    speech_config.speech_recognition_language=language_code
+    audio_config = speechsdk.audio.AudioConfig(filename=file_path)
+    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+    result = speech_recognizer.recognize_once_async().get()
+    recognition = {"reason": result.reason.name, "text": getattr(result, "text", None)}
+    if result.reason == speechsdk.ResultReason.NoMatch:
+        recognition["no_match_details"] = str(result.no_match_details)
+    elif result.reason == speechsdk.ResultReason.Canceled:
+        recognition["cancellation_reason"] = result.cancellation_details.reason.name
+        recognition["error_details"] = result.cancellation_details.error_details
+    return recognition
+
+
+def recognition_key(file_path: str, language_code: str) -> list:
+    # Temporary file names change between runs, the audio does not
+    with open(file_path, "rb") as audio_file:
+        return [hashlib.sha256(audio_file.read()).hexdigest(), language_code]
+
+
 @singleton
 class FileUpload:
     def __init__(self):
-        self.uploads: ContainerClient = get_storage_client(config.env.st_connection_string, config.env.uploads_container)
+        cassettes = Cassettes()
+        # Blob names are unique per upload, recorded uploads are replayed in order
+        self.uploads: ContainerClient = get_storage_client(
+            config.env.st_connection_string,
+            config.env.uploads_container,
+            cassettes.azure_transport("storage", match=("method", "host")),
+        )
+        self.recognize = cassettes.call("speech", "recognize", recognize, key=recognition_key)
 
     async def upload_file(self, user_id: str, username: str, file: UploadFile = File(...)):
         file_content: bytes = await file.read()
@@ -52,22 +88,17 @@ class FileUpload:
             raise e
 
     async def get_audio_transcription(self, file_path: str, language_code: str = "en-US"):
-        speech_config = speechsdk.SpeechConfig(subscription=config.env.azure_stt_key, region=config.env.azure_stt_region)
-        speech_config.speech_recognition_language=language_code
-        audio_config = speechsdk.audio.AudioConfig(filename=file_path)
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
-        speech_recognition_result = speech_recognizer.recognize_once_async().get()
+        recognition = self.recognize(file_path, language_code)
         os.remove(file_path)
-        if speech_recognition_result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            return {"status": "success", "data": speech_recognition_result.text, "error": None}
-        elif speech_recognition_result.reason == speechsdk.ResultReason.NoMatch:
-            logging.error("No speech could be recognized: {}".format(speech_recognition_result.no_match_details))
-            return {"status": "failed", "data": None, "error": speech_recognition_result.no_match_details}
-        elif speech_recognition_result.reason == speechsdk.ResultReason.Canceled:
-            cancellation_details = speech_recognition_result.cancellation_details
-            logging.error("Speech Recognition canceled: {}".format(cancellation_details.reason))
-            if cancellation_details.reason ==  speechsdk.CancellationReason.Error:
-                logging.error("Error details: {}".format(cancellation_details.error_details))
+        if recognition["reason"] == speechsdk.ResultReason.RecognizedSpeech.name:
+            return {"status": "success", "data": recognition["text"], "error": None}
+        elif recognition["reason"] == speechsdk.ResultReason.NoMatch.name:
+            logging.error("No speech could be recognized: {}".format(recognition["no_match_details"]))
+            return {"status": "failed", "data": None, "error": recognition["no_match_details"]}
+        elif recognition["reason"] == speechsdk.ResultReason.Canceled.name:
+            logging.error("Speech Recognition canceled: {}".format(recognition["cancellation_reason"]))
+            if recognition["cancellation_reason"] == speechsdk.CancellationReason.Error.name:
+                logging.error("Error details: {}".format(recognition["error_details"]))
                 logging.error("Did you set the speech resource key and region values?")
-                return {"status": "failed", "data": None, "error": cancellation_details.error_details}
-            return {"status": "failed", "data": None, "error": cancellation_details.reason}
+                return {"status": "failed", "data": None, "error": recognition["error_details"]}
+            return {"status": "failed", "data": None, "error": recognition["cancellation_reason"]}
@@ -0,0 +1,139 @@
+import datetime
+import logging
+import threading
+from typing import List, Optional
+
+from ..config import AppConfig, get_config
+from ..helpers.flusher import FlushLoop
+from ..helpers.singleton import singleton
+
+config: AppConfig = get_config()
+
+
+@singleton
+class UsageLedger:
+    """
+    Records the token usage, cost and latency of every LLM call.
+
+    Records are buffered in memory and written to Mongo in batches by a
+    background task, so recording never waits on the database.
+    """
+
+    def __init__(self):
+        self.collection = config.db["llm_usage"]
+        self.batch_size = config.env.usage_batch_size
+        self.flush_interval = config.env.usage_flush_interval
+        self.max_buffer = config.env.usage_max_buffer
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self.flusher = FlushLoop(self.flush, self.flush_interval)
+        self.dropped = 0
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("created_at")
+            await self.collection.create_index([("route", 1), ("created_at", 1)])
+            await self.collection.create_index([("user_id", 1), ("created_at", 1)])
+        except Exception as e:
+            logging.error(f"Error while creating usage indexes: {e}")
+
+    def record(
+        self,
+        route: str,
+        user_id: Optional[str],
+        model: str,
+        deployment: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        total_tokens: int,
+        cost: float,
+        latency: float,
+        error: bool = False,
+        cancelled: bool = False,
+    ):
+        document = {
+            "route": route,
+            "user_id": user_id,
+            "model": model,
+            "deployment": deployment,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "cost": cost,
+            "latency": latency,
+            "error": error,
+            "cancelled": cancelled,
+            "created_at": datetime.datetime.utcnow(),
+        }
+        with self._lock:
+            self._buffer.append(document)
+            if (overflow := len(self._buffer) - self.max_buffer) > 0:
+                del self._buffer[:overflow]
+                self.dropped += overflow
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flusher.wake()
+
+    async def flush(self):
+        with self._lock:
+            documents, self._buffer = self._buffer, []
+        if not documents:
+            return
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except Exception as e:
+            logging.error(f"Error while writing usage records: {e}")
+            with self._lock:
+                self._buffer = (documents + self._buffer)[-self.max_buffer:]
+
+    def start(self):
+        self.flusher.start()
+
+    async def stop(self):
+        await self.flusher.stop()
+
+    async def aggregate(
+        self,
+        group_by: List[str],
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        user_id: Optional[str] = None,
+        route: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Sums the usage records matching the filters, grouped by the given fields.
+        """
+        match = {}
+        if start or end:
+            match["created_at"] = {}
+            if start:
+                match["created_at"]["$gte"] = start
+            if end:
+                match["created_at"]["$lt"] = end
+        if user_id:
+            match["user_id"] = user_id
+        if route:
+            match["route"] = route
+
+        pipeline = [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {field: f"${field}" for field in group_by},
+                    "calls": {"$sum": 1},
+                    "errors": {"$sum": {"$cond": ["$error", 1, 0]}},
+                    "cancelled": {"$sum": {"$cond": ["$cancelled", 1, 0]}},
+                    "prompt_tokens": {"$sum": "$prompt_tokens"},
+                    "completion_tokens": {"$sum": "$completion_tokens"},
+                    "total_tokens": {"$sum": "$total_tokens"},
+                    "cost": {"$sum": "$cost"},
+                    "average_latency": {"$avg": "$latency"},
+                    "max_latency": {"$max": "$latency"},
+                }
+            },
+            {"$sort": {"total_tokens": -1}},
+        ]
+        results = await self.collection.aggregate(pipeline).to_list()
+        for result in results:
+            result.update(result.pop("_id"))
+        return results
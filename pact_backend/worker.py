@@ -0,0 +1,164 @@
+"""
+Background worker, run with `python -m pact_backend.worker`.
+
+The metrics worker claims /llm/metrics jobs from the Mongo queue and runs the
+evaluations, so that evaluation capacity scales separately from the API. The
+statistics worker materializes the statistics from the chat collection.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from .config import AppConfig, get_config
+from .helpers.executor import shutdown_executors
+from .services.cassettes import Cassettes
+from .services.evaluation_cache import EvaluationCache
+from .services.evaluators import EvaluatorRegistry
+from .services.jobs import MetricsJobQueue
+from .services.lease import LeaseManager
+from .services.materializer import StatisticsMaterializer
+from .services.cache import ResponseCache
+from .services.metrics import Metrics
+from .services.statistics import Statistics
+from .services.usage import UsageLedger
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+config: AppConfig = get_config()
+
+
+async def run_job(queue: MetricsJobQueue, job: dict):
+    payload = job["payload"]
+
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(queue.lease_ttl / 3)
+            if not await queue.renew(job["_id"]):
+                logging.error(f"Lost the lease of metrics job {job['_id']}")
+                return
+
+    renewal = asyncio.create_task(renew_lease())
+    try:
+        result = await Metrics().evaluate_pair(
+            payload["query"],
+            payload["answer"],
+            payload["opt_query"],
+            payload["opt_answer"],
+            job.get("user_id"),
+            payload.get("include"),
+            payload["metrics"] if payload.get("flagged") else None,
+        )
+        await queue.complete(job["_id"], result)
+    except Exception as e:
+        logging.error(f"Error while running metrics job {job['_id']}: {e}")
+        await queue.fail(job["_id"], job["attempts"], str(e))
+    finally:
+        renewal.cancel()
+
+
+async def run_slot(queue: MetricsJobQueue, stopping: asyncio.Event):
+    while not stopping.is_set():
+        try:
+            job = await queue.claim()
+        except Exception as e:
+            logging.error(f"Error while claiming a metrics job: {e}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), config.env.metrics_job_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(queue, job)
+
+
+async def run_reaper(queue: MetricsJobQueue, stopping: asyncio.Event):
+    while not stopping.is_set():
+        try:
+            if reaped := await queue.reap():
+                logging.info(f"Marked {reaped} abandoned metrics jobs as failed")
+        except Exception as e:
+            logging.error(f"Error while reaping metrics jobs: {e}")
+        try:
+            await asyncio.wait_for(stopping.wait(), queue.lease_ttl)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_metrics_worker(stopping: asyncio.Event):
+    """
+    Runs `metrics_worker_concurrency` jobs at a time until stopped. Running
+    jobs are finished before returning.
+    """
+    queue = MetricsJobQueue()
+    await queue.ensure_indexes()
+    await ResponseCache().ensure_indexes()
+    await EvaluationCache().ensure_indexes()
+    await LeaseManager().ensure_indexes()
+    await UsageLedger().ensure_indexes()
+    await asyncio.to_thread(EvaluatorRegistry().warm)
+    UsageLedger().start()
+    logging.info(
+        f"Metrics worker {queue.owner} running {config.env.metrics_worker_concurrency} slots"
+    )
+    try:
+        await asyncio.gather(
+            run_reaper(queue, stopping),
+            *(
+                run_slot(queue, stopping)
+                for _ in range(config.env.metrics_worker_concurrency)
+            ),
+        )
+    finally:
+        await UsageLedger().stop()
+        await EvaluatorRegistry().close()
+        shutdown_executors()
+        Cassettes().save()
+
+
+async def run_statistics_worker(stopping: asyncio.Event):
+    """
+    Materializes new chats into the statistics every
+    `statistics_materialize_interval` seconds, and batch after batch while
+    catching up.
+    """
+    materializer = StatisticsMaterializer()
+    await materializer.ensure_indexes()
+    await Statistics().ensure_indexes()
+    await LeaseManager().ensure_indexes()
+    logging.info("Statistics worker running")
+    while not stopping.is_set():
+        try:
+            caught_up = await materializer.run_once()
+        except Exception as e:
+            logging.error(f"Error while materializing statistics: {e}")
+            caught_up = True
+        if caught_up:
+            try:
+                await asyncio.wait_for(
+                    stopping.wait(), config.env.statistics_materialize_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+tasks = {"metrics": run_metrics_worker, "statistics": run_statistics_worker}
+
+
+async def main(task: str):
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    await tasks[task](stopping)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("task", nargs="?", default="metrics", choices=sorted(tasks))
+    asyncio.run(main(parser.parse_args().task))
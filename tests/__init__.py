@@ -0,0 +1,33 @@
+import os
+
+# The services read the configuration when imported, these placeholders let
+# the tests import them without a .env file. No request is sent to them.
+for name, value in {
+    "ENVIRONMENT": "development",
+    "COOKIE_DOMAIN": "localhost",
+    "API_DOMAIN": "localhost",
+    "FRONTEND_URL": "https://localhost:3000",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "MONGODB_DB_NAME": "pact-tests",
+    "JWT_SECRET": "secret",
+    "AZURE_SUBSCRIPTION_ID": "subscription",
+    "AZURE_CLIENT_ID": "client",
+    "AZURE_TENANT_ID": "tenant",
+    "AZURE_CLIENT_SECRET": "secret",
+    "AZURE_AI_PROJECT_NAME": "project",
+    "AZURE_RG_NAME": "resource-group",
+    "AZURE_AI_ENDPOINT": "https://ai.example.com",
+    "AZURE_LANGUAGE_API_KEY": "key",
+    "AZURE_LANGUAGE_ENDPOINT": "https://language.example.com",
+    "AZURE_OPENAI_API_KEY": "key",
+    "AZURE_OPENAI_ENDPOINT": "https://openai.example.com",
+    "AZURE_OPENAI_DEPLOYMENT": "deployment",
+    "AZURE_OPENAI_API_VERSION": "2024-06-01",
+    "AZURE_OPENAI_MODEL_NAME": "gpt-4o",
+    "AZURE_STT_KEY": "key",
+    "AZURE_STT_REGION": "eastus",
+    "TMP_UPLOAD_DIR": "/tmp",
+    "ST_CONNECTION_STRING": "DefaultEndpointsProtocol=https;AccountName=account;AccountKey=a2V5;EndpointSuffix=core.windows.net",
+    "ANONYMOUS_USER_ID": "000000000000000000000000",
+}.items():
+    os.environ.setdefault(name, value)
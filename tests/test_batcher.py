@@ -0,0 +1,83 @@
+import asyncio
+import gc
+import unittest
+
+from pact_backend.helpers.batcher import MicroBatcher
+
+
+class MicroBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+
+    async def double(self, items):
+        self.calls.append(list(items))
+        await asyncio.sleep(0)
+        return [item * 2 for item in items]
+
+    async def test_concurrent_items_are_sent_in_one_call(self):
+        batcher = MicroBatcher(self.double, max_batch_size=10, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(self.calls, [[0, 1, 2, 3, 4]])
+        self.assertEqual(batcher.stats(), {"batches": 1, "items": 5, "pending": 0})
+
+    async def test_full_batches_are_sent_without_waiting(self):
+        batcher = MicroBatcher(self.double, max_batch_size=2, max_wait=10)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), 1)
+        self.assertEqual(results, [0, 2, 4, 6])
+        self.assertEqual(self.calls, [[0, 1], [2, 3]])
+
+    async def test_partial_batch_is_sent_after_the_wait(self):
+        batcher = MicroBatcher(self.double, max_batch_size=2, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+        self.assertEqual(results, [0, 2, 4])
+        self.assertEqual(self.calls, [[0, 1], [2]])
+
+    async def test_error_is_raised_to_every_caller_of_the_batch(self):
+        async def fail(items):
+            raise RuntimeError("batch failed")
+
+        batcher = MicroBatcher(fail, max_batch_size=10, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+    async def test_running_batches_are_referenced(self):
+        release = asyncio.Event()
+
+        async def wait(items):
+            await release.wait()
+            return items
+
+        batcher = MicroBatcher(wait, max_batch_size=1, max_wait=10)
+        waiting = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        self.assertEqual(len(batcher._tasks), 1)
+        release.set()
+        self.assertEqual(await waiting, 1)
+        await asyncio.sleep(0)
+        self.assertEqual(batcher._tasks, set())
+
+    async def test_error_of_a_cancelled_caller_is_retrieved(self):
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        caller = None
+
+        async def fail(items):
+            # Cancels the caller after its future failed, before it resumes
+            loop.call_soon(caller.cancel)
+            raise RuntimeError("batch failed")
+
+        batcher = MicroBatcher(fail, max_batch_size=1, max_wait=10)
+        caller = asyncio.ensure_future(batcher.submit(1))
+        with self.assertRaises(asyncio.CancelledError):
+            await caller
+        del caller
+        gc.collect()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
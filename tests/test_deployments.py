@@ -0,0 +1,82 @@
+import unittest
+
+import httpx
+
+from pact_backend.config.environment import DeploymentConfig
+from pact_backend.helpers.resilience import CircuitOpenError
+from pact_backend.services.deployments import Deployment, DeploymentPool
+
+
+class StubDeployment:
+    def __init__(self, name: str, score: float, healthy: bool = True):
+        self.name = name
+        self.latency = None
+        self.healthy = healthy
+        self._score = score
+
+    def score(self, tokens: int, default_latency: float) -> float:
+        return self._score
+
+
+class DeploymentPoolTest(unittest.TestCase):
+    def test_picks_the_best_score(self):
+        fast, slow = StubDeployment("fast", 1), StubDeployment("slow", 2)
+        self.assertIs(DeploymentPool([slow, fast]).pick(100), fast)
+
+    def test_skips_unhealthy_deployments(self):
+        fast, slow = StubDeployment("fast", 1, healthy=False), StubDeployment("slow", 2)
+        self.assertIs(DeploymentPool([fast, slow]).pick(100), slow)
+
+    def test_skips_deployments_already_tried(self):
+        fast, slow = StubDeployment("fast", 1), StubDeployment("slow", 2)
+        self.assertIs(DeploymentPool([fast, slow]).pick(100, exclude=[fast]), slow)
+
+    def test_falls_back_to_deployments_already_tried(self):
+        fast, slow = StubDeployment("fast", 1), StubDeployment("slow", 2, healthy=False)
+        self.assertIs(DeploymentPool([fast, slow]).pick(100, exclude=[fast]), fast)
+
+    def test_raises_when_no_deployment_is_healthy(self):
+        pool = DeploymentPool([StubDeployment("a", 1, healthy=False)])
+        with self.assertRaises(CircuitOpenError):
+            pool.pick(100)
+
+    def test_has_alternative(self):
+        a, b = StubDeployment("a", 1), StubDeployment("b", 2, healthy=False)
+        pool = DeploymentPool([a, b])
+        self.assertTrue(pool.has_alternative([]))
+        self.assertFalse(pool.has_alternative([a]))
+
+
+class DeploymentHealthTest(unittest.TestCase):
+    def setUp(self):
+        settings = DeploymentConfig(
+            endpoint="https://openai.example.com",
+            api_key="key",
+            deployment="deployment",
+            api_version="2024-06-01",
+        )
+        # No request is sent, the client never opens a connection
+        self.deployment = Deployment(settings, "gpt-4o", 0, 100, httpx.AsyncClient())
+
+    def test_throttling_does_not_open_the_breaker(self):
+        breaker = self.deployment.breaker
+        for _ in range(breaker.failure_threshold * 2):
+            self.deployment.throttled(breaker.allow())
+        self.assertTrue(self.deployment.healthy)
+        self.assertEqual(self.deployment.throttles, breaker.failure_threshold * 2)
+        self.assertEqual(self.deployment.errors, 0)
+
+    def test_failures_open_the_breaker(self):
+        for _ in range(self.deployment.breaker.failure_threshold):
+            self.deployment.record_failure()
+        self.assertFalse(self.deployment.healthy)
+        self.assertEqual(self.deployment.errors, self.deployment.breaker.failure_threshold)
+
+    def test_latency_is_a_moving_average(self):
+        self.deployment.record_success(1.0)
+        self.deployment.record_success(2.0)
+        self.assertAlmostEqual(self.deployment.latency, 1.0 + Deployment.latency_smoothing)
+
+
+if __name__ == "__main__":
+    unittest.main()
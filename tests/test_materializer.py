@@ -0,0 +1,82 @@
+import datetime
+import json
+import unittest
+from collections import Counter
+
+from benchmarks.mongo import MemoryCollection
+from pact_backend.helpers.timebuckets import bucket_start
+from pact_backend.services.lease import LeaseManager
+from pact_backend.services.materializer import StatisticsMaterializer
+from pact_backend.services.statistics import Statistics
+
+
+class MaterializerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the materializer against in-memory collections, with the counts of
+    the chats given instead of aggregated.
+    """
+
+    async def asyncSetUp(self):
+        self.statistics = Statistics()
+        self.materializer = StatisticsMaterializer()
+        self.leases = LeaseManager()
+        self.originals = (
+            self.statistics.collection,
+            self.statistics.buckets,
+            self.materializer.chats,
+            self.materializer.state,
+            self.leases.collection,
+        )
+        self.statistics.collection = MemoryCollection("statistics")
+        self.statistics.buckets = MemoryCollection("statistics_buckets")
+        self.materializer.chats = MemoryCollection("chat")
+        self.materializer.state = MemoryCollection("statistics_materialized")
+        self.leases.collection = MemoryCollection("leases")
+        self.materializer.increments = self.increments
+
+        cutoff = bucket_start(
+            datetime.datetime.utcnow() - datetime.timedelta(seconds=self.materializer.lag), "minute"
+        )
+        self.watermark = cutoff - datetime.timedelta(minutes=10)
+        await self.materializer.state.insert_one(
+            {"_id": self.materializer.state_id, "watermark": self.watermark, "pending_end": None}
+        )
+
+    async def asyncTearDown(self):
+        (
+            self.statistics.collection,
+            self.statistics.buckets,
+            self.materializer.chats,
+            self.materializer.state,
+            self.leases.collection,
+        ) = self.originals
+        del self.materializer.increments
+
+    async def increments(self, start: datetime.datetime, end: datetime.datetime):
+        values = Counter({"count": 2, "grammar.1": 2})
+        return {"prompt_metrics": values}, {("prompt_metrics", start): values}
+
+    async def test_materialized_statistics_can_be_served(self):
+        self.assertTrue(await self.materializer.run_once())
+        stored = await self.statistics.collection.find_one({"metrics_type": "prompt_metrics"})
+        self.assertIn("materialized_to", stored)
+
+        _, body = await self.statistics.serialized()
+        statistics = json.loads(body)
+        self.assertEqual(statistics["prompt_metrics"]["count"], 2)
+        self.assertEqual(statistics["prompt_metrics"]["grammar"]["1"], 2)
+        self.assertNotIn("materialized_to", statistics["prompt_metrics"])
+
+    async def test_counters_written_by_statistics_add_are_incremented(self):
+        await self.statistics.collection.insert_one(
+            {"metrics_type": "prompt_metrics", "count": 3, "grammar": {"1": 3}}
+        )
+        self.assertTrue(await self.materializer.run_once())
+        documents = await self.statistics.collection.find({"metrics_type": "prompt_metrics"}).to_list()
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(documents[0]["count"], 5)
+        self.assertEqual(documents[0]["grammar"]["1"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
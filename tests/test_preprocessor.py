@@ -0,0 +1,45 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from pact_backend.services.evaluators import EvaluatorRegistry
+from pact_backend.services.preprocessor import PreProcessor
+
+
+class StubTextAnalytics:
+    def __init__(self):
+        self.calls = []
+
+    async def recognize_pii_entities(self, documents: list) -> list:
+        self.calls.append(list(documents))
+        return [
+            SimpleNamespace(is_error=True)
+            if document == "error"
+            else SimpleNamespace(is_error=False, redacted_text=document.replace("555-0100", "********"))
+            for document in documents
+        ]
+
+
+class RedactionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.registry = EvaluatorRegistry()
+        self.original = self.registry.async_text_analytics
+        self.registry.async_text_analytics = self.client = StubTextAnalytics()
+
+    async def asyncTearDown(self):
+        self.registry.async_text_analytics = self.original
+
+    async def test_concurrent_redactions_share_a_call(self):
+        redacted = await asyncio.gather(
+            PreProcessor().redact_sensitive_info("Call 555-0100"),
+            PreProcessor().redact_sensitive_info("No number"),
+        )
+        self.assertEqual(redacted, ["Call ********", "No number"])
+        self.assertEqual(self.client.calls, [["Call 555-0100", "No number"]])
+
+    async def test_failed_document_is_not_redacted(self):
+        self.assertIsNone(await PreProcessor().redact_sensitive_info("error"))
+
+
+if __name__ == "__main__":
+    unittest.main()
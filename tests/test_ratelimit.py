@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from pact_backend.helpers.ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def test_reservations_within_quota_do_not_wait(self):
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+        for _ in range(60):
+            self.assertEqual(limiter.reserve(100), 0)
+
+    def test_request_debt_is_waited_in_arrival_order(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        for _ in range(60):
+            limiter.reserve(0)
+        self.assertAlmostEqual(limiter.reserve(0), 1.0, delta=0.05)
+        self.assertAlmostEqual(limiter.reserve(0), 2.0, delta=0.05)
+
+    def test_token_debt_is_proportional_to_the_quota(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        self.assertEqual(limiter.reserve(600), 0)
+        self.assertAlmostEqual(limiter.reserve(300), 30.0, delta=0.05)
+
+    def test_reservation_larger_than_the_quota_is_capped(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        self.assertEqual(limiter.reserve(10000), 0)
+        self.assertAlmostEqual(limiter.reserve(600), 60.0, delta=0.05)
+
+    def test_disabled_limits_never_wait(self):
+        limiter = RateLimiter()
+        for _ in range(1000):
+            self.assertEqual(limiter.reserve(10**6), 0)
+        limiter.reconcile(100, 10)
+        self.assertIsNone(limiter.stats()["available_tokens"])
+
+    def test_reconcile_gives_back_an_overestimate(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.reserve(600)
+        limiter.reconcile(600, 100)
+        self.assertAlmostEqual(limiter.stats()["available_tokens"], 500, delta=1)
+        self.assertAlmostEqual(limiter.expected_delay(500), 0, delta=0.1)
+
+    def test_reconcile_charges_an_underestimate(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.reserve(100)
+        limiter.reconcile(100, 400)
+        self.assertAlmostEqual(limiter.stats()["available_tokens"], 200, delta=1)
+
+    def test_reconcile_never_exceeds_the_quota(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.reserve(10)
+        limiter.reconcile(10000, 1)
+        self.assertLessEqual(limiter.stats()["available_tokens"], 600)
+
+    def test_reconcile_without_usage_keeps_the_estimate(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.reserve(600)
+        limiter.reconcile(600, 0)
+        self.assertAlmostEqual(limiter.stats()["available_tokens"], 0, delta=1)
+
+    def test_cancel_gives_back_the_whole_reservation(self):
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=600)
+        limiter.reserve(600)
+        limiter.cancel(600)
+        self.assertEqual(limiter.reserve(600), 0)
+
+    def test_backoff_delays_every_caller(self):
+        limiter = RateLimiter()
+        limiter.backoff(5)
+        self.assertAlmostEqual(limiter.reserve(0), 5.0, delta=0.05)
+        limiter.backoff(1)
+        self.assertAlmostEqual(limiter.expected_delay(0), 5.0, delta=0.05)
+
+    async def test_acquire_cancelled_while_waiting_gives_back_its_reservation(self):
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+        await limiter.acquire(600)
+        waiting = asyncio.ensure_future(limiter.acquire(600))
+        await asyncio.sleep(0.01)
+        self.assertEqual(limiter.stats()["queue_depth"], 1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        stats = limiter.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertAlmostEqual(stats["available_tokens"], 0, delta=1)
+        self.assertAlmostEqual(stats["available_requests"], 59, delta=0.1)
+
+    async def test_acquire_waits_for_a_backoff_requested_while_waiting(self):
+        limiter = RateLimiter(requests_per_minute=600)
+        for _ in range(600):
+            limiter.reserve(0)
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        waiting = asyncio.ensure_future(limiter.acquire(0))
+        await asyncio.sleep(0.01)
+        self.assertEqual(limiter.stats()["queue_depth"], 1)
+        limiter.backoff(0.3)
+        await waiting
+        self.assertGreaterEqual(loop.time() - started_at, 0.3)
+
+if __name__ == "__main__":
+    unittest.main()
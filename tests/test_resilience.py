@@ -0,0 +1,159 @@
+import asyncio
+import time
+import unittest
+
+from pact_backend.helpers.resilience import CircuitBreaker, LatencyTracker, hedge
+
+
+def opened(breaker: CircuitBreaker) -> CircuitBreaker:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    return breaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_closed_breaker_lets_every_call_through(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+        permits = [breaker.allow() for _ in range(10)]
+        self.assertTrue(all(permits))
+        self.assertFalse(any(permit.trial for permit in permits))
+        self.assertEqual(breaker.state, "closed")
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertIsNone(breaker.allow())
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = opened(CircuitBreaker("test", failure_threshold=1, reset_timeout=0))
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.available())
+        trial = breaker.allow()
+        self.assertTrue(trial.trial)
+        self.assertFalse(breaker.available())
+        self.assertIsNone(breaker.allow())
+
+    def test_available_does_not_take_the_trial(self):
+        breaker = opened(CircuitBreaker("test", failure_threshold=1, reset_timeout=0))
+        self.assertTrue(breaker.available())
+        self.assertTrue(breaker.available())
+        self.assertTrue(breaker.allow().trial)
+
+    def test_successful_trial_closes_the_breaker(self):
+        breaker = opened(CircuitBreaker("test", failure_threshold=1, reset_timeout=0))
+        breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertFalse(breaker.allow().trial)
+
+    def test_failed_trial_reopens_the_breaker(self):
+        breaker = opened(CircuitBreaker("test", failure_threshold=3, reset_timeout=0.05))
+        time.sleep(0.06)
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def test_released_trial_can_be_taken_again(self):
+        breaker = opened(CircuitBreaker("test", failure_threshold=1, reset_timeout=0))
+        trial = breaker.allow()
+        breaker.release(trial)
+        self.assertTrue(breaker.allow().trial)
+
+    def test_only_the_trial_call_releases_the_trial(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        closed = breaker.allow()
+        opened(breaker)
+        trial = breaker.allow()
+        breaker.release(closed)
+        breaker.release(None)
+        self.assertIsNone(breaker.allow())
+        breaker.release(trial)
+        self.assertTrue(breaker.allow().trial)
+
+
+class LatencyTrackerTest(unittest.TestCase):
+    def test_no_percentile_before_enough_samples(self):
+        tracker = LatencyTracker(min_samples=3)
+        tracker.record(1.0)
+        tracker.record(2.0)
+        self.assertIsNone(tracker.percentile(95))
+
+    def test_percentile_of_the_recent_window(self):
+        tracker = LatencyTracker(window=100, min_samples=1)
+        for latency in range(1, 201):
+            tracker.record(float(latency))
+        self.assertEqual(tracker.percentile(50), 150.0)
+        self.assertEqual(tracker.percentile(100), 200.0)
+
+
+class HedgeTest(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_primary_does_not_start_the_backup(self):
+        calls = []
+
+        async def call(name: str, delay: float):
+            calls.append(name)
+            await asyncio.sleep(delay)
+            return name
+
+        result = await hedge(lambda: call("primary", 0), lambda: call("backup", 0), 0.1)
+        self.assertEqual(result, "primary")
+        self.assertEqual(calls, ["primary"])
+
+    async def test_slow_primary_loses_to_the_backup_and_is_cancelled(self):
+        cancelled = asyncio.Event()
+
+        async def primary():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def backup():
+            return "backup"
+
+        self.assertEqual(await hedge(primary, backup, 0.01), "backup")
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    async def test_failed_backup_waits_for_the_primary(self):
+        async def primary():
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        async def backup():
+            raise RuntimeError("backup failed")
+
+        self.assertEqual(await hedge(primary, backup, 0.01), "primary")
+
+    async def test_raises_when_both_calls_fail(self):
+        async def primary():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("primary failed")
+
+        async def backup():
+            raise ValueError("backup failed")
+
+        with self.assertRaises((RuntimeError, ValueError)):
+            await hedge(primary, backup, 0.01)
+
+    async def test_error_of_the_primary_before_the_delay_is_raised(self):
+        async def primary():
+            raise RuntimeError("primary failed")
+
+        async def backup():
+            return "backup"
+
+        with self.assertRaises(RuntimeError):
+            await hedge(primary, backup, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import datetime
+import json
+import unittest
+from collections import Counter, defaultdict
+
+from benchmarks.mongo import MemoryCollection
+from pact_backend.services.statistics import Statistics
+
+
+class SerializedStatisticsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.statistics = Statistics()
+        self.originals = (self.statistics.collection, self.statistics.buckets)
+        self.statistics.collection = MemoryCollection("statistics")
+        self.statistics.buckets = MemoryCollection("statistics_buckets")
+        self.statistics.version += 1
+        self.minute = datetime.datetime(2025, 1, 1, 10, 30)
+        await self.statistics.collection.insert_one({"metrics_type": "prompt_metrics", "count": 3})
+        await self.statistics.buckets.insert_one(
+            {"metrics_type": "prompt_metrics", "granularity": "hour", "start": self.minute.replace(minute=0), "count": 3}
+        )
+
+    async def asyncTearDown(self):
+        self.statistics.collection, self.statistics.buckets = self.originals
+        self.statistics._totals, self.statistics._minutes = defaultdict(Counter), defaultdict(Counter)
+        self.statistics._events = 0
+
+    def buffer(self, count: int):
+        values = Counter({"count": count})
+        self.statistics._buffer(
+            {"prompt_metrics": values}, {("prompt_metrics", self.minute): values}, count
+        )
+
+    async def test_etag_does_not_cover_unflushed_increments(self):
+        etag, body = await self.statistics.serialized()
+        self.assertEqual(json.loads(body)["prompt_metrics"]["count"], 3)
+        self.buffer(2)
+        pending_etag, body = await self.statistics.serialized()
+        self.assertEqual(pending_etag, etag)
+        self.assertEqual(json.loads(body)["prompt_metrics"]["count"], 5)
+
+    async def test_range_includes_unflushed_increments_of_the_range(self):
+        start, end = datetime.datetime(2025, 1, 1, 10), datetime.datetime(2025, 1, 1, 12)
+        etag, _ = await self.statistics.serialized(start, end, "hour")
+        self.buffer(2)
+        pending_etag, body = await self.statistics.serialized(start, end, "hour")
+        self.assertEqual(pending_etag, etag)
+        statistics = json.loads(body)
+        self.assertEqual(statistics["prompt_metrics"]["count"], 5)
+        self.assertEqual([entry["prompt_metrics"]["count"] for entry in statistics["series"]], [5, 0])
+
+        _, body = await self.statistics.serialized(end, end + datetime.timedelta(hours=1))
+        self.assertEqual(json.loads(body)["prompt_metrics"]["count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import datetime
+import unittest
+
+from pact_backend.helpers.timebuckets import bucket_starts, cover, granularities
+
+
+def at(day: int, hour: int = 0, minute: int = 0, second: int = 0) -> datetime.datetime:
+    return datetime.datetime(2025, 1, day, hour, minute, second)
+
+
+class CoverTest(unittest.TestCase):
+    def assertCovers(self, parts, start, end):
+        """The parts are contiguous and span exactly [start, end)."""
+        self.assertEqual(parts[0][1], start)
+        self.assertEqual(parts[-1][2], end)
+        for (_, _, high), (_, low, _) in zip(parts, parts[1:]):
+            self.assertEqual(high, low)
+        for granularity, low, high in parts:
+            self.assertLess(low, high)
+            self.assertEqual((high - low) % granularities[granularity], datetime.timedelta(0))
+
+    def test_uses_days_in_the_middle(self):
+        start, end = at(1, 22, 30), at(4, 1, 15)
+        parts = cover(start, end)
+        self.assertCovers(parts, start, end)
+        self.assertEqual(
+            parts,
+            [
+                ("minute", at(1, 22, 30), at(1, 23)),
+                ("hour", at(1, 23), at(2)),
+                ("day", at(2), at(4)),
+                ("hour", at(4), at(4, 1)),
+                ("minute", at(4, 1), at(4, 1, 15)),
+            ],
+        )
+
+    def test_aligned_range_is_a_single_part(self):
+        self.assertEqual(cover(at(1), at(8)), [("day", at(1), at(8))])
+        self.assertEqual(cover(at(1, 3), at(1, 5)), [("hour", at(1, 3), at(1, 5))])
+
+    def test_short_range_uses_minutes(self):
+        self.assertEqual(cover(at(1, 3, 10), at(1, 3, 20)), [("minute", at(1, 3, 10), at(1, 3, 20))])
+
+    def test_range_is_rounded_to_minutes(self):
+        parts = cover(at(1, 3, 10, 45), at(1, 3, 20, 5))
+        self.assertEqual(parts, [("minute", at(1, 3, 10), at(1, 3, 20))])
+
+    def test_empty_range(self):
+        self.assertEqual(cover(at(2), at(1)), [])
+        self.assertEqual(cover(at(1, 3, 10, 5), at(1, 3, 10, 50)), [])
+
+    def test_aware_datetimes_are_converted_to_utc(self):
+        offset = datetime.timezone(datetime.timedelta(hours=2))
+        start = datetime.datetime(2025, 1, 2, 2, tzinfo=offset)
+        end = datetime.datetime(2025, 1, 3, 2, tzinfo=offset)
+        self.assertEqual(cover(start, end), [("day", at(2), at(3))])
+
+
+class BucketStartsTest(unittest.TestCase):
+    def test_includes_the_bucket_of_the_start(self):
+        self.assertEqual(bucket_starts(at(1, 3, 30), at(1, 5, 30), "hour"), [at(1, 3), at(1, 4), at(1, 5)])
+
+    def test_excludes_the_end(self):
+        self.assertEqual(bucket_starts(at(1), at(3), "day"), [at(1), at(2)])
+        self.assertEqual(bucket_starts(at(1), at(1), "day"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()